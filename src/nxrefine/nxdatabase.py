@@ -34,17 +34,28 @@ there are changes to the files outside of NXrefine code (eg manually
 deleting an entry or adding a new .nxs files). Other changes are tracked
 automatically.
 
+Status changes are normally recorded one at a time with queue_task(),
+start_task(), end_task() and fail_task(). Several changes can be
+grouped into a single locked transaction, either by calling
+update_tasks() or by making the calls within a transaction() block
+
+    >>> with nxdb.transaction():
+    ...     nxdb.end_task(wrapper_file, 'nxmax', 'f1')
+    ...     nxdb.start_task(wrapper_file, 'nxfind', 'f1')
+
 NXDatabase assumes that no identical tasks (i.e., same task, entry, and
 wrapper file) will be queued or running at the same time
 """
 
 import datetime
 import os
+from contextlib import contextmanager
 from pathlib import Path
 
+import h5py as h5
 from nexusformat.nexus import NeXusError, NXLock, nxload
-from sqlalchemy import (Column, ForeignKey, Integer, String, create_engine,
-                        inspect, text)
+from sqlalchemy import (Column, Float, ForeignKey, Index, Integer, String,
+                        create_engine, event, func, inspect, text)
 from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
@@ -56,6 +67,58 @@ _prog = {'not started': 0, 'queued': 1, 'in progress': 2, 'done': 3}
 NOT_STARTED, QUEUED, IN_PROGRESS, DONE, FAILED = 0, 1, 2, 3, -1
 
 
+def set_pragmas(dbapi_connection, connection_record):
+    """Use the rollback journal, which is safe on network file systems.
+
+    The database may be shared by several nodes, so write-ahead logging,
+    whose shared-memory index is local to each host, cannot be used.
+    Setting the journal mode also converts databases that were created
+    with write-ahead logging.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=DELETE')
+    cursor.close()
+
+
+def inspect_file(filepath, scan_dir):
+    """Return the entries and groups contained in a wrapper file.
+
+    Only the group names are read, so this is much faster than loading
+    the file.
+
+    Parameters
+    ----------
+    filepath : Path
+        Path of the wrapper file.
+    scan_dir : Path
+        Directory containing the raw data files.
+
+    Returns
+    -------
+    dict
+        Modification time and size of the wrapper file, the names of
+        the scan entries, a dictionary of group names within each entry,
+        and the modification time of the scan directory and the names of
+        the files it contains.
+    """
+    filepath = Path(filepath)
+    stat = filepath.stat()
+    with h5.File(filepath, 'r') as root:
+        groups = {e: list(root[e]) for e in root
+                  if isinstance(root[e], h5.Group)}
+    entries = [e for e in groups if e[-1].isdigit()]
+    scan_dir = Path(scan_dir)
+    if scan_dir.exists():
+        scan_mtime = scan_dir.stat().st_mtime
+        scan_files = [p.name for p in scan_dir.iterdir()]
+    else:
+        scan_mtime = None
+        scan_files = []
+    return {'mtime': stat.st_mtime, 'size': stat.st_size, 'entries': entries,
+            'groups': groups, 'scan_mtime': scan_mtime,
+            'scan_files': scan_files}
+
+
 class File(Base):
     __tablename__ = 'files'
 
@@ -74,6 +137,11 @@ class File(Base):
     nxmasked_combine = Column(Integer, default=NOT_STARTED)
     nxpdf = Column(Integer, default=NOT_STARTED)
     nxmasked_pdf = Column(Integer, default=NOT_STARTED)
+    # Wrapper file modification time and size, and scan directory
+    # modification time, at the last synchronization
+    mtime = Column(Float)
+    size = Column(Integer)
+    scan_mtime = Column(Float)
 
     def __repr__(self):
         return f"File(filename='{self.filename}')"
@@ -90,6 +158,10 @@ class File(Base):
 
 class Task(Base):
     __tablename__ = 'tasks'
+    # Allows the latest task for each file, name, and entry to be found
+    # without scanning the table
+    __table_args__ = (Index('ix_tasks_latest', 'filename', 'name', 'entry',
+                            'id'),)
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -121,23 +193,32 @@ class NXDatabase:
                   'nxcombine', 'nxmasked_combine', 'nxpdf', 'nxmasked_pdf')
     NOT_STARTED, QUEUED, IN_PROGRESS, DONE, FAILED = 0, 1, 2, 3, -1
 
-    def __init__(self, db_file, echo=False):
+    def __init__(self, db_file, echo=False, timeout=60):
         """Connect to the database, creating tables if necessary.
 
+        The database schema is checked once, when the connection is
+        made, and the database is switched to write-ahead logging.
+
         Parameters
         ----------
         db_file : str
             Path to the database file
         echo : bool, optional
             True if SQL statements are echoed to `stdout`, by default False.
+        timeout : float, optional
+            Time in seconds to wait for a database write to be possible,
+            by default 60.
         """
         if Path(db_file).resolve().parent.name != 'tasks':
             raise NeXusError("Database should be in 'tasks' subdirectory")
         db_file = str(db_file)
         with NXLock(db_file):
             connection = 'sqlite:///' + db_file
-            self.engine = create_engine(connection, echo=echo)
+            self.engine = create_engine(connection, echo=echo,
+                                        connect_args={'timeout': timeout})
+            event.listen(self.engine, 'connect', set_pragmas)
             Base.metadata.create_all(self.engine)
+            self.check_tasks()
         self.database = Path(self.engine.url.database).resolve()
         self.experiment_directory = self.database.parent.parent
         try:
@@ -145,6 +226,7 @@ class NXDatabase:
         except Exception:
             pass
         self._session = None
+        self._depth = 0
 
     def __repr__(self):
         return f"NXDatabase('{self.database}')"
@@ -155,6 +237,39 @@ class NXDatabase:
             self._session = sessionmaker(bind=self.engine)()
         return self._session
 
+    @contextmanager
+    def transaction(self):
+        """Group database updates into a single locked transaction.
+
+        The database file is locked on entry and the changes are
+        committed on exit, or rolled back if an exception is raised.
+        Nested transactions are merged into the outermost one.
+        """
+        if self._depth > 0:
+            self._depth += 1
+            try:
+                yield self.session
+            finally:
+                self._depth -= 1
+            return
+        with NXLock(self.database):
+            self._depth = 1
+            try:
+                yield self.session
+                self.session.commit()
+            except Exception:
+                self.session.rollback()
+                raise
+            finally:
+                self._depth = 0
+
+    def commit(self):
+        """Commit changes, unless they are part of a larger transaction."""
+        if self._depth > 0:
+            self.session.flush()
+        else:
+            self.session.commit()
+
     def get_filepath(self, filename):
         """Return the absolute path of the requested filename."""
         if Path(filename).is_absolute():
@@ -167,20 +282,22 @@ class NXDatabase:
         return str(self.get_filepath(filename).relative_to(
             self.experiment_directory))
 
-    def get_file(self, filename):
+    def get_file(self, filename, sync=True):
         """Return the File object (and associated tasks) matching filename.
 
         Parameters
         ----------
         filename : str
             Path of wrapper file.
+        sync : bool, optional
+            True if the status of the raw data files is checked, by
+            default True.
 
         Returns
         -------
         File
             File object.
         """
-        self.check_tasks()
         filepath = self.get_filepath(filename)
         filename = self.get_filename(filename)
         f = self.query(filename)
@@ -189,14 +306,15 @@ class NXDatabase:
             if not filepath.exists():
                 raise NeXusError(f"'{filepath}' does not exist")
             self.session.add(File(filename=filename))
-            self.session.commit()
+            self.commit()
             f = self.sync_file(filename)
         else:
             if (f.entries is None or f.entries == ''
                     or isinstance(f.entries, int)):
                 root = nxload(filepath)
                 f.set_entries([e for e in root.entries if e[-1].isdigit()])
-            f = self.sync_data(filename)
+            if sync:
+                f = self.sync_data(filename)
         return f
 
     def query(self, filename):
@@ -218,58 +336,65 @@ class NXDatabase:
             Updated File object.
         """
         f = self.get_file(filename)
-        filepath = self.get_filepath(filename)
         if f:
-            scan_dir = self.get_directory(filename)
-            if scan_dir.exists():
-                scan_files = scan_dir.iterdir()
-            else:
-                scan_files = []
-            root = nxload(filepath)
-            entries = [e for e in root.entries if e[-1].isdigit()]
-            tasks = {t: 0 for t in self.task_names}
-            for e in entries:
-                nxentry = root[e]
-                if e in root and 'data' in nxentry and 'instrument' in nxentry:
-                    if 'nxload' in nxentry:
-                        tasks['nxload'] += 1
-                    elif e+'.h5' in scan_files or e+'.nxs' in scan_files:
-                        tasks['nxload'] += 1
-                    if 'nxlink' in nxentry:
-                        tasks['nxlink'] += 1
-                    if 'nxmax' in nxentry:
-                        tasks['nxmax'] += 1
-                    if 'nxfind' in nxentry:
-                        tasks['nxfind'] += 1
-                    if 'nxcopy' in nxentry or self.is_parent(filename):
-                        tasks['nxcopy'] += 1
-                    if 'nxrefine' in nxentry:
-                        tasks['nxrefine'] += 1
-                    if 'nxprepare_mask' in nxentry:
-                        tasks['nxprepare'] += 1
-                    if 'nxtransform' in nxentry:
-                        tasks['nxtransform'] += 1
-                    if 'nxmasked_transform' in nxentry or 'nxmask' in nxentry:
-                        tasks['nxmasked_transform'] += 1
-            if 'nxcombine' in root['entry']:
-                tasks['nxcombine'] = len(entries)
-            if 'nxmasked_combine' in root['entry']:
-                tasks['nxmasked_combine'] = len(entries)
-            if 'nxpdf' in root['entry']:
-                tasks['nxpdf'] = len(entries)
-            if 'nxmasked_pdf' in root['entry']:
-                tasks['nxmasked_pdf'] = len(entries)
-            for task, value in tasks.items():
-                if value == 0:
-                    setattr(f, task, NOT_STARTED)
-                elif value == len(entries):
-                    setattr(f, task, DONE)
-                else:
-                    setattr(f, task, IN_PROGRESS)
-            f.set_entries(entries)
-            self.session.commit()
+            self.set_file_status(f, inspect_file(self.get_filepath(filename),
+                                                 self.get_directory(filename)))
+            self.commit()
         return f
 
+    def set_file_status(self, f, contents):
+        """Set the task columns of a File object from the file contents.
+
+        Parameters
+        ----------
+        f : File
+            File object being updated.
+        contents : dict
+            Contents of the wrapper file returned by `inspect_file`.
+        """
+        entries = contents['entries']
+        groups = contents['groups']
+        scan_files = contents['scan_files']
+        is_parent = self.is_parent(f.filename)
+        tasks = {t: 0 for t in self.task_names}
+        for e in entries:
+            nxentry = groups[e]
+            if 'data' in nxentry and 'instrument' in nxentry:
+                if 'nxload' in nxentry:
+                    tasks['nxload'] += 1
+                elif e+'.h5' in scan_files or e+'.nxs' in scan_files:
+                    tasks['nxload'] += 1
+                if 'nxlink' in nxentry:
+                    tasks['nxlink'] += 1
+                if 'nxmax' in nxentry:
+                    tasks['nxmax'] += 1
+                if 'nxfind' in nxentry:
+                    tasks['nxfind'] += 1
+                if 'nxcopy' in nxentry or is_parent:
+                    tasks['nxcopy'] += 1
+                if 'nxrefine' in nxentry:
+                    tasks['nxrefine'] += 1
+                if 'nxprepare_mask' in nxentry:
+                    tasks['nxprepare'] += 1
+                if 'nxtransform' in nxentry:
+                    tasks['nxtransform'] += 1
+                if 'nxmasked_transform' in nxentry or 'nxmask' in nxentry:
+                    tasks['nxmasked_transform'] += 1
+        for task in ['nxcombine', 'nxmasked_combine', 'nxpdf', 'nxmasked_pdf']:
+            if task in groups.get('entry', []):
+                tasks[task] = len(entries)
+        for task, value in tasks.items():
+            if value == 0:
+                setattr(f, task, NOT_STARTED)
+            elif value == len(entries):
+                setattr(f, task, DONE)
+            else:
+                setattr(f, task, IN_PROGRESS)
+        f.set_entries(entries)
+        f.mtime = contents['mtime']
+        f.size = contents['size']
+        f.scan_mtime = contents['scan_mtime']
+
     def sync_data(self, filename):
         """Update status of raw data linked from File.
 
@@ -288,7 +413,9 @@ class NXDatabase:
             scan_dir = self.get_directory(filename)
             entries = f.get_entries()
             data = 0
-            if 'nxload' in [t.name for t in f.tasks]:
+            if self.session.query(Task.id).filter(
+                    Task.filename == f.filename,
+                    Task.name == 'nxload').first() is not None:
                 self.update_status(f, 'nxload')
             else:
                 for e in entries:
@@ -300,7 +427,7 @@ class NXDatabase:
                     f.nxload = DONE
                 else:
                     f.nxload = IN_PROGRESS
-            self.session.commit()
+            self.commit()
         return f
 
     def get_task(self, f, task, entry):
@@ -317,15 +444,55 @@ class NXDatabase:
         entry : str
             Entry of NeXus file being checked.
         """
-        for t in reversed(f.tasks):
-            if t.name == task and t.entry == entry:
-                break
-        else:
+        t = self.latest_task(f, task, entry)
+        if t is None:
             # This task was started from command line
-            t = Task(name=task, entry=entry)
-            f.tasks.append(t)
+            t = Task(name=task, entry=entry, file=f)
+            self.session.add(t)
         return t
 
+    def latest_task(self, f, task, entry):
+        """Return the latest database entry for the specified task.
+
+        Parameters
+        ----------
+        file : File
+            File object.
+        task : str
+            Task being checked.
+        entry : str
+            Entry of NeXus file being checked.
+
+        Returns
+        -------
+        Task or None
+            Latest Task object, or None if the task has not been recorded.
+        """
+        return self.session.query(Task).filter(
+            Task.filename == f.filename, Task.name == task,
+            Task.entry == entry).order_by(Task.id.desc()).first()
+
+    def latest_status(self, f, task):
+        """Return the status of the latest task for each entry.
+
+        Parameters
+        ----------
+        file : File
+            File object.
+        task : str
+            Task being checked.
+
+        Returns
+        -------
+        dict
+            Dictionary of task status values, with entry names as keys.
+        """
+        latest = self.session.query(func.max(Task.id)).filter(
+            Task.filename == f.filename,
+            Task.name == task).group_by(Task.entry)
+        return dict(self.session.query(Task.entry, Task.status).filter(
+            Task.id.in_(latest.scalar_subquery())).all())
+
     def task_status(self, filename, task, entry=None):
         """Return the status of the task.
 
@@ -338,15 +505,14 @@ class NXDatabase:
         entry : str
             Entry of NeXus file being checked.
         """
-        with NXLock(self.database):
-            f = self.get_file(filename)
+        with self.transaction():
+            f = self.get_file(filename, sync=(task == 'nxload'))
             if entry:
-                for t in reversed(f.tasks):
-                    if t.name == task and t.entry == entry:
-                        status = t.status
-                        break
-                else:
+                t = self.latest_task(f, task, entry)
+                if t is None:
                     status = NOT_STARTED
+                else:
+                    status = t.status
             else:
                 status = getattr(f, task)
         return status
@@ -366,16 +532,7 @@ class NXDatabase:
         entry : str
             Entry of NeXus file being updated.
         """
-        with NXLock(self.database):
-            f = self.get_file(filename)
-            t = self.get_task(f, task, entry)
-            t.status = QUEUED
-            if queue_time:
-                t.queue_time = queue_time
-            else:
-                t.queue_time = datetime.datetime.now()
-            t.start_time = t.end_time = None
-            self.update_status(f, task)
+        self.update_tasks(filename, [(task, entry)], QUEUED, queue_time)
 
     def start_task(self, filename, task, entry, start_time=None):
         """Record that a task has begun execution.
@@ -389,17 +546,7 @@ class NXDatabase:
         entry : str
             Entry of NeXus file being updated.
         """
-        with NXLock(self.database):
-            f = self.get_file(filename)
-            t = self.get_task(f, task, entry)
-            t.status = IN_PROGRESS
-            if start_time:
-                t.start_time = start_time
-            else:
-                t.start_time = datetime.datetime.now()
-            t.pid = os.getpid()
-            t.end_time = None
-            self.update_status(f, task)
+        self.update_tasks(filename, [(task, entry)], IN_PROGRESS, start_time)
 
     def end_task(self, filename, task, entry, end_time=None):
         """Record that a task finished execution.
@@ -416,15 +563,7 @@ class NXDatabase:
         entry : str
             Entry of NeXus file being updated.
         """
-        with NXLock(self.database):
-            f = self.get_file(filename)
-            t = self.get_task(f, task, entry)
-            t.status = DONE
-            if end_time:
-                t.end_time = end_time
-            else:
-                t.end_time = datetime.datetime.now()
-            self.update_status(f, task)
+        self.update_tasks(filename, [(task, entry)], DONE, end_time)
 
     def fail_task(self, filename, task, entry):
         """Record that a task failed during execution.
@@ -438,19 +577,56 @@ class NXDatabase:
         entry : str
             Entry of NeXus file being updated.
         """
-        with NXLock(self.database):
-            f = self.get_file(filename)
-            for t in reversed(f.tasks):
-                if t.name == task and t.entry == entry:
-                    break
-            else:
-                # No task recorded
-                return
-            t.status = FAILED
-            t.queue_time = None
-            t.start_time = None
-            t.end_time = None
-            self.update_status(f, task)
+        self.update_tasks(filename, [(task, entry)], FAILED)
+
+    def update_tasks(self, filename, tasks, status, time=None):
+        """Record a change of status for several tasks in one transaction.
+
+        The database is only locked and committed once, and the status
+        of each task column in the File table is updated once, however
+        many entries are changed. The raw data files are not checked.
+
+        Parameters
+        ----------
+        filename : str
+            Path of wrapper file relative to GUP directory.
+        tasks : list of tuple
+            List of (task, entry) pairs to be updated.
+        status : int
+            New status of the tasks, i.e., QUEUED, IN_PROGRESS, DONE, or
+            FAILED.
+        time : datetime.datetime, optional
+            Time of the status change, by default the current time.
+        """
+        if time is None:
+            time = datetime.datetime.now()
+        with self.transaction():
+            f = self.get_file(filename, sync=False)
+            updated = []
+            for task, entry in tasks:
+                if status == FAILED:
+                    t = self.latest_task(f, task, entry)
+                    if t is None:
+                        # No task recorded
+                        continue
+                else:
+                    t = self.get_task(f, task, entry)
+                t.status = status
+                if status == QUEUED:
+                    t.queue_time = time
+                    t.start_time = t.end_time = None
+                elif status == IN_PROGRESS:
+                    t.start_time = time
+                    t.pid = os.getpid()
+                    t.end_time = None
+                elif status == DONE:
+                    t.end_time = time
+                elif status == FAILED:
+                    t.queue_time = t.start_time = t.end_time = None
+                if task not in updated:
+                    updated.append(task)
+            for task in updated:
+                self.update_status(f, task)
 
     def update_status(self, f, task):
         """Update the File object with the status of the specified task.
@@ -471,13 +647,9 @@ class NXDatabase:
                 entries = ['entry']
             else:
                 entries = f.get_entries()
+            latest = self.latest_status(f, task)
             for e in entries:
-                for t in reversed(f.tasks):
-                    if t.name == task and t.entry == e:
-                        status[e] = t.status
-                        break
-                else:
-                    status[e] = NOT_STARTED
+                status[e] = latest.get(e, NOT_STARTED)
             if all(s == DONE for s in status.values()):
                 setattr(f, task, DONE)
             elif FAILED in status.values():
@@ -493,7 +665,7 @@ class NXDatabase:
                 setattr(f, task, IN_PROGRESS)
             else:
                 setattr(f, task, NOT_STARTED)
-        self.session.commit()
+        self.commit()
 
     def update_file(self, filename):
         """Update the File object for the specified file.
@@ -506,31 +678,73 @@ class NXDatabase:
         filename : str
             Path of wrapper file relative to GUP directory.
         """
-        with NXLock(self.database):
+        with self.transaction():
             self.sync_file(filename)
 
-    def sync_db(self, sample_dir):
+    def sync_db(self, sample_dir, wrapper_files=None, force=False):
         """ Populate the database based on local files.
 
+        Only wrapper files whose modification time or size, or whose
+        scan directory's modification time, differ from the values
+        recorded at the last synchronization are inspected, since raw
+        data files may be added without modifying the wrapper file. Only
+        the group names are read, so this is fast enough to be done
+        serially, and the database is only locked while the results are
+        stored.
+
         Parameters
         ----------
         sample_dir : str or Path
             Directory containing the NeXus wrapper files.
+        wrapper_files : list of str or Path, optional
+            Wrapper files to be synchronized, by default all the wrapper
+            files in the sample directory. Files that are no longer in
+            the directory are only removed from the database if this is
+            not specified.
+        force : bool, optional
+            True if files are inspected even if they have not changed, by
+            default False.
         """
-        # Get a list of all the .nxs wrapper files
         sample_dir = Path(sample_dir)
-        wrapper_files = [
-            sample_dir / filename for filename in sample_dir.glob('*.nxs')
-            if 'parent' not in filename.name and 'mask' not in filename.name]
-        with NXLock(self.database):
-            for wrapper_file in wrapper_files:
-                self.sync_file(self.get_file(wrapper_file))
-            tracked_files = list(self.session.query(File).all())
-            for f in tracked_files:
-                if f.filename not in [
-                        self.get_filename(w) for w in wrapper_files]:
+        if wrapper_files is None:
+            # Get a list of all the .nxs wrapper files
+            wrapper_files = [
+                filename for filename in sample_dir.glob('*.nxs')
+                if 'parent' not in filename.name
+                and 'mask' not in filename.name]
+            remove = True
+        else:
+            wrapper_files = [Path(w) for w in wrapper_files]
+            remove = False
+        filenames = [self.get_filename(w) for w in wrapper_files]
+        recorded = {f.filename: (f.mtime, f.size, f.scan_mtime)
+                    for f in self.session.query(File).all()}
+        self.session.commit()
+        changed = []
+        for wrapper_file, filename in zip(wrapper_files, filenames):
+            stat = wrapper_file.stat()
+            scan_dir = self.get_directory(wrapper_file)
+            if scan_dir.exists():
+                scan_mtime = scan_dir.stat().st_mtime
+            else:
+                scan_mtime = None
+            if force or recorded.get(filename) != (stat.st_mtime,
+                                                   stat.st_size, scan_mtime):
+                changed.append((wrapper_file, filename))
+        contents = [inspect_file(self.get_filepath(c[0]),
+                                 self.get_directory(c[0]))
+                    for c in changed]
+        with self.transaction():
+            for (wrapper_file, filename), c in zip(changed, contents):
+                f = self.query(filename)
+                if f is None:
+                    f = File(filename=filename)
+                    self.session.add(f)
+                self.set_file_status(f, c)
+            if remove:
+                for f in self.session.query(File).filter(
+                        File.filename.not_in(filenames)).all():
                     self.session.delete(f)
-            self.session.commit()
 
     def check_tasks(self):
         """Check that all tasks are present, adding a column if necessary."""
@@ -544,6 +758,14 @@ class NXDatabase:
                 self.add_column(task)
         if 'entries' not in tasks:
             self.add_column('entries', data_type=String)
+        if 'mtime' not in tasks:
+            self.add_column('mtime', data_type=Float)
+        if 'size' not in tasks:
+            self.add_column('size')
+        if 'scan_mtime' not in tasks:
+            self.add_column('scan_mtime', data_type=Float)
+        for index in Task.__table__.indexes:
+            index.create(self.engine, checkfirst=True)
 
     def add_column(self, column_name, table_name='files',
                    data_type=Integer, default=None):
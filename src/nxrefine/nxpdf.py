@@ -18,7 +18,9 @@ from nexusformat.nexus import (NeXusError, NXdata, NXentry, NXfield, NXlink,
 
 from .nxrefine import NXRefine
 from .nxsymmetry import NXSymmetry
-from .nxutils import init_julia, load_julia
+from .nxsettings import NXSettings
+from .nxutils import (NXLaplaceInterpolator, centered_fft, fft_taper,
+                      storage_options, storage_settings)
 
 
 class NXPDF:
@@ -45,11 +47,19 @@ class NXPDF:
         self.qmax = qmax
 
         self._logger = None
-        self.julia = None
 
     def __repr__(self):
         return f"NXPDF('{self.root.nxname}')"
 
+    @property
+    def storage(self):
+        """Storage profile of the 3D volumes, read from the server settings."""
+        return storage_settings(NXSettings().settings['server'])
+
+    def storage_options(self, shape):
+        """Return the keyword arguments used to store a 3D volume."""
+        return storage_options(shape, **self.storage)
+
     @property
     def logger(self):
         """Log file handler."""
@@ -86,14 +96,6 @@ class NXPDF:
 
     def nxpdf(self):
         task = 'nxpdf'
-        if self.julia is None:
-            try:
-                self.julia = init_julia()
-            except Exception as error:
-                self.logger.info(f"Cannot initialize Julia: {error}")
-                self.julia = None
-                return
-        load_julia(['LaplaceInterpolation.jl'])
         # self.record_start(task)
         self.init_pdf()
         try:
@@ -135,13 +137,20 @@ class NXPDF:
         if self.symmetrize_data:
             symmetry = NXSymmetry(self.entry['transform'],
                                   laue_group=self.refine.laue_group)
-            symm_root['entry/data/data'] = symmetry.symmetrize(entries=True)
+            storage = self.storage_options(symmetry.shape)
+            storage.setdefault('dtype', symmetry.dtype)
+            symm_root['entry/data/data'] = NXfield(shape=symmetry.shape,
+                                                   fillvalue=0, **storage)
+            symmetry.symmetrize(entries=True,
+                                output=symm_root['entry/data/data'])
         else:
-            symm_root['entry/data/data'] = np.nan_to_num(
-                self.entry['transform'].nxsignal.nxvalue,
-                posinf=0.0, neginf=0.0)
+            data = np.nan_to_num(self.entry['transform'].nxsignal.nxvalue,
+                                 posinf=0.0, neginf=0.0)
+            symm_root['entry/data/data'] = NXfield(
+                data, **self.storage_options(data.shape))
         symm_root['entry/data'].nxsignal = symm_root['entry/data/data']
-        symm_root['entry/data'].nxweights = 1.0 / self.taper
+        symm_root['entry/data'].nxweights = NXfield(
+            1.0 / self.taper, **self.storage_options(self.taper.shape))
         symm_root['entry/data'].nxaxes = self.entry['transform'].nxaxes
         if self.symm_data in self.entry:
             del self.entry[self.symm_data]
@@ -177,15 +186,9 @@ class NXPDF:
         tic = timeit.default_timer()
         if qmax is None:
             qmax = self.qmax
-        Z, Y, X = np.meshgrid(self.Ql * self.refine.cstar,
-                              self.Qk * self.refine.bstar,
-                              self.Qh * self.refine.astar,
-                              indexing='ij')
-        taper = np.ones(X.shape, dtype=np.float32)
-        R = 2 * np.sqrt(X**2 + Y**2 + Z**2) / qmax
-        idx = (R > 1.0) & (R < 2.0)
-        taper[idx] = 0.5 * (1 - np.cos(R[idx] * np.pi))
-        taper[R >= 2.0] = taper.min()
+        taper = fft_taper(self.Qh * self.refine.astar,
+                          self.Qk * self.refine.bstar,
+                          self.Ql * self.refine.cstar, qmax)
         toc = timeit.default_timer()
         self.logger.info(f"{self.title}: Taper function calculated "
                          f"({toc-tic:g} seconds)")
@@ -203,14 +206,14 @@ class NXPDF:
         tic = timeit.default_timer()
         symm_data = self.entry[self.symm_data].nxsignal.nxvalue
         symm_data *= self.taper
-        fft = np.real(scipy.fft.fftshift(
-            scipy.fft.fftn(scipy.fft.fftshift(symm_data[:-1, :-1, :-1]),
-                           workers=os.cpu_count())))
+        fft = centered_fft(symm_data[:-1, :-1, :-1],
+                           workers=os.cpu_count())
         fft *= (1.0 / np.prod(fft.shape))
 
         root = nxopen(self.total_pdf_file, 'a')
         root['entry'] = NXentry()
-        root['entry/pdf'] = NXdata(NXfield(fft, name='pdf'))
+        root['entry/pdf'] = NXdata(
+            NXfield(fft, name='pdf', **self.storage_options(fft.shape)))
 
         if self.total_pdf_data in self.entry:
             del self.entry[self.total_pdf_data]
@@ -250,44 +253,26 @@ class NXPDF:
     def indices(self):
         self.refine.wavelength = 0.1
         self.refine.polar_max = 10.0
-        if self.refine.laue_group in ['-3', '-3m', '6/m', '6/mmm']:
-            _indices = []
-            for idx in self.refine.indices:
-                _indices += self.refine.indices_hkl(*idx)
-            return _indices
-        else:
-            ids = []
-            for h, k, l in self.refine.indices:
-                ids += self.refine.indices_hkl(h, k, l)
-            return ids
+        return self.refine.all_indices
 
     def symmetrize(self, data):
         if self.refine.laue_group not in ['-3', '-3m', '6/m', '6/mmm']:
-            import tempfile
-            root = nxopen(tempfile.mkstemp(suffix='.nxs')[1], mode='w')
-            root['data'] = data
-            symmetry = NXSymmetry(root['data'],
+            symmetry = NXSymmetry(NXfield(data, name='data'),
                                   laue_group=self.refine.laue_group)
-            result = symmetry.symmetrize()
-            Path(root.nxfilename).unlink()
-            return result
+            return symmetry.symmetrize()
         else:
             return data
 
     def punch_and_fill(self):
         self.logger.info(f"{self.title}: Performing punch-and-fill")
 
-        from julia import Main
-        LaplaceInterpolation = Main.LaplaceInterpolation
-
         tic = timeit.default_timer()
 
         symm_root = nxopen(self.symm_file, 'rw')
         symm_data = symm_root['entry/data/data']
 
-        mask, mask_indices = self.hole_mask(symm_data)
-        idx = [Main.CartesianIndex(int(i[0]+1), int(i[1]+1), int(i[2]+1))
-               for i in mask_indices]
+        mask, _ = self.hole_mask()
+        interpolator = NXLaplaceInterpolator(mask)
         ml = int((mask.shape[0]-1)/2)
         mk = int((mask.shape[1]-1)/2)
         mh = int((mask.shape[2]-1)/2)
@@ -302,7 +287,7 @@ class NXPDF:
                 hslice = slice(ih-mh, ih+mh+1)
                 v = symm_data[(lslice, kslice, hslice)].nxvalue
                 if v.max() > 0.0:
-                    w = LaplaceInterpolation.matern_3d_grid(v, idx)
+                    w = interpolator.fill(v)
                     fill_data[(lslice, kslice, hslice)] += np.where(mask, w, 0)
             except Exception as error:
                 raise
@@ -310,30 +295,50 @@ class NXPDF:
         self.logger.info(f"{self.title}: Symmetrizing punch-and-fill")
 
         # fill_data = self.symmetrize(fill_data)
-        self.changed_idx = np.where(fill_data > 0)
-        buffer = symm_data.nxvalue
-        buffer[self.changed_idx] = fill_data[self.changed_idx]
-        if 'fill' in symm_root['entry/data']:
-            del symm_root['entry/data/fill']
-        symm_root['entry/data/fill'] = buffer
-        if 'filled_data' in self.entry[self.symm_data]:
-            del self.entry[self.symm_data]['filled_data']
-        self.entry[self.symm_data]['filled_data'] = NXlink(
-            '/entry/data/fill', file=self.symm_file)
-
-        buffer[self.changed_idx] *= 0
-        if 'punch' in symm_root['entry/data']:
-            del symm_root['entry/data/punch']
-        symm_root['entry/data/punch'] = buffer
-        if 'punched_data' in self.entry[self.symm_data]:
-            del self.entry[self.symm_data]['punched_data']
-        self.entry[self.symm_data]['punched_data'] = NXlink(
-            '/entry/data/punch', file=self.symm_file)
+        fill_indices = np.flatnonzero(fill_data > 0)
+        fill_values = fill_data.reshape(-1)[fill_indices]
+        for name in ['fill', 'punch', 'fill_indices', 'fill_values']:
+            if name in symm_root['entry/data']:
+                del symm_root['entry/data'][name]
+        symm_root['entry/data/fill_indices'] = fill_indices
+        symm_root['entry/data/fill_values'] = NXfield(fill_values,
+                                                      dtype=symm_data.dtype)
+        symm_group = self.entry[self.symm_data]
+        for name in ['filled_data', 'punched_data', 'fill_indices',
+                     'fill_values']:
+            if name in symm_group:
+                del symm_group[name]
+        for name in ['fill_indices', 'fill_values']:
+            symm_group[name] = NXlink(f'/entry/data/{name}',
+                                      file=self.symm_file)
 
         toc = timeit.default_timer()
         self.logger.info(f"{self.title}: Punch-and-fill completed "
                          f"({toc - tic:g} seconds)")
 
+    def filled_data(self, punched=False):
+        """Return the symmetrized data after punch-and-fill.
+
+        Parameters
+        ----------
+        punched : bool, optional
+            True if the holes are left empty, by default False.
+
+        Returns
+        -------
+        array-like
+            Symmetrized data with the holes filled or punched.
+        """
+        with nxopen(self.symm_file, 'r') as symm_root:
+            symm_group = symm_root['entry/data']
+            data = symm_group.nxsignal.nxvalue
+            indices = symm_group['fill_indices'].nxvalue
+            if punched:
+                data.reshape(-1)[indices] = 0.0
+            else:
+                data.reshape(-1)[indices] = symm_group['fill_values'].nxvalue
+        return data
+
     def delta_pdf(self):
         self.logger.info(f"{self.title}: Calculating Delta-PDF")
         if self.pdf_file.exists():
@@ -344,16 +349,16 @@ class NXPDF:
                     f"{self.title}: Delta-PDF file already exists")
                 return
         tic = timeit.default_timer()
-        symm_data = self.entry[self.symm_data]['filled_data'].nxvalue
+        symm_data = self.filled_data()
         symm_data *= self.taper
-        fft = np.real(scipy.fft.fftshift(
-            scipy.fft.fftn(scipy.fft.fftshift(symm_data[:-1, :-1, :-1]),
-                           workers=os.cpu_count())))
+        fft = centered_fft(symm_data[:-1, :-1, :-1],
+                           workers=os.cpu_count())
         fft *= (1.0 / np.prod(fft.shape))
 
         root = nxopen(self.pdf_file, 'a')
         root['entry'] = NXentry()
-        root['entry/pdf'] = NXdata(NXfield(fft, name='pdf'))
+        root['entry/pdf'] = NXdata(
+            NXfield(fft, name='pdf', **self.storage_options(fft.shape)))
 
         if self.pdf_data in self.entry:
             del self.entry[self.pdf_data]
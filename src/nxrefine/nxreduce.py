@@ -8,12 +8,12 @@
 
 import logging
 import logging.handlers
-import operator
 import os
 import platform
 import shutil
 import subprocess
 import timeit
+from concurrent.futures import FIRST_COMPLETED, wait
 
 import h5py as h5
 import numpy as np
@@ -32,7 +32,10 @@ from .nxrefine import NXRefine
 from .nxserver import NXServer
 from .nxsettings import NXSettings
 from .nxsymmetry import NXSymmetry
-from .nxutils import init_julia, load_julia, mask_volume, peak_search
+from .nxutils import (NXBlockWriter, NXLaplaceInterpolator, blob_dtype,
+                      centered_fft, copy_structure, fft_taper,
+                      reduce_shared_slab, reduce_slab, storage_options,
+                      storage_settings, sum_frames)
 
 
 class NXReduce(QtCore.QObject):
@@ -374,10 +377,10 @@ class NXReduce(QtCore.QObject):
             entries = [entry for entry in self.root.entries
                        if entry[-1].isdigit()]
             try:
-                f = self.db.get_file(self.wrapper_file)
-                if len(f.get_entries()) != len(entries):
-                    f.set_entries(entries)
-                    self.db.session.commit()
+                with self.db.transaction():
+                    f = self.db.get_file(self.wrapper_file, sync=False)
+                    if len(f.get_entries()) != len(entries):
+                        f.set_entries(entries)
             except Exception:
                 pass
             return entries
@@ -804,6 +807,30 @@ class NXReduce(QtCore.QObject):
                 self._cctw = 'cctw'
         return self._cctw
 
+    @property
+    def storage(self):
+        """Storage profile of the 3D volumes written by the reduction.
+
+        The chunk shape, gzip compression level and precision are read
+        from the server settings.
+        """
+        return storage_settings(self.server_settings)
+
+    def storage_options(self, shape):
+        """Return the keyword arguments used to store a 3D volume.
+
+        Parameters
+        ----------
+        shape : tuple of int
+            Shape of the volume.
+
+        Returns
+        -------
+        dict
+            Keyword arguments to be passed to `NXfield`.
+        """
+        return storage_options(shape, **self.storage)
+
     def complete(self, task):
         """True if the task for this entry in the wrapper file is done """
         return task in self.entry
@@ -922,12 +949,15 @@ class NXReduce(QtCore.QObject):
             for key in [k for k in kwargs if k in self.default]:
                 self.entry[process][key] = kwargs[key]
 
-    def record_start(self, task):
-        """ Record that a task has started in the database """
+    def record_start(self, *tasks):
+        """ Record that one or more tasks have started in the database """
         try:
-            self.db.start_task(self.wrapper_file, task, self.entry_name)
-            self.timer[task] = timeit.default_timer()
-            self.log(f"{self.name}: '{task}' started")
+            self.db.update_tasks(self.wrapper_file,
+                                 [(task, self.entry_name) for task in tasks],
+                                 self.db.IN_PROGRESS)
+            for task in tasks:
+                self.timer[task] = timeit.default_timer()
+                self.log(f"{self.name}: '{task}' started")
         except Exception as error:
             self.log(str(error))
 
@@ -1120,40 +1150,30 @@ class NXReduce(QtCore.QObject):
             data = self.field.nxfile[self.raw_path]
             fsum = np.zeros(self.nframes, dtype=np.float64)
             psum = np.zeros(self.nframes, dtype=np.float64)
-            pixel_mask = self.pixel_mask
             # Add constantly firing pixels to the mask
-            pixel_max = np.zeros((self.shape[1], self.shape[2]))
-            v = data[0:10, :, :]
-            for i in range(10):
-                pixel_max = np.maximum(v[i, :, :], pixel_max)
-            pixel_mean = v.sum(0) / 10.
-            mask = np.zeros((self.shape[1], self.shape[2]), dtype=np.int8)
-            mask[np.where(pixel_max == pixel_mean)] = 1
-            mask[np.where(pixel_mean < 100)] = 0
-            pixel_mask = pixel_mask | mask
+            pixel_mask = self.pixel_mask | self.hot_pixel_mask(data)
             transmission_mask = self.transmission_coordinates()
-            # Start looping over the data
+            # Start looping over the data, using the same frame range as
+            # the single-pass reduction
             tic = self.start_progress(self.first, self.last)
+            vsum = None
             for i in range(self.first, self.last, chunk_size):
                 if self.stopped:
                     return None
                 self.update_progress(i)
-                try:
-                    v = data[i:i+chunk_size, :, :]
-                except IndexError:
-                    pass
-                if i == self.first:
-                    vsum = v.sum(0)
+                stop = min(i+chunk_size, self.last)
+                _, result = reduce_slab(
+                    data[i:stop], i, i, self.nframes, self.first, self.last,
+                    pixel_mask, transmission_mask=transmission_mask,
+                    block_size=chunk_size)
+                fsum[i:stop] = result['summed_frames']
+                psum[i:stop] = result['partial_frames']
+                if vsum is None:
+                    vsum = result['summed_data']
                 else:
-                    vsum += v.sum(0)
-                v = np.ma.masked_array(v)
-                v.mask = pixel_mask
-                fsum[i:i+chunk_size] = v.sum((1, 2))
-                v.mask = pixel_mask | transmission_mask
-                psum[i:i+chunk_size] = v.sum((1, 2))
-                if maximum < v.max():
-                    maximum = v.max()
-                del v
+                    vsum += result['summed_data']
+                if maximum < result['maximum']:
+                    maximum = result['maximum']
         self.pixel_mask = pixel_mask
         vsum = np.ma.masked_array(vsum)
         vsum.mask = pixel_mask
@@ -1168,6 +1188,29 @@ class NXReduce(QtCore.QObject):
                               self.partial_frames)
         return result
 
+    def hot_pixel_mask(self, data):
+        """Return a mask of constantly firing pixels.
+
+        Parameters
+        ----------
+        data : h5py.Dataset or array-like
+            Raw data, of which the first ten frames are inspected.
+
+        Returns
+        -------
+        array-like
+            2D mask with values of 1 for the constantly firing pixels.
+        """
+        pixel_max = np.zeros((self.shape[1], self.shape[2]))
+        v = data[0:10, :, :]
+        for i in range(10):
+            pixel_max = np.maximum(v[i, :, :], pixel_max)
+        pixel_mean = v.sum(0) / 10.
+        mask = np.zeros((self.shape[1], self.shape[2]), dtype=np.int8)
+        mask[np.where(pixel_max == pixel_mean)] = 1
+        mask[np.where(pixel_mean < 100)] = 0
+        return mask
+
     def write_maximum(self):
         with self:
             self.entry['data'].attrs['maximum'] = self.maximum
@@ -1289,17 +1332,11 @@ class NXReduce(QtCore.QObject):
 
     def transmission_coordinates(self):
         refine = NXRefine(self.entry)
-        min_radius = (self.qmin * refine.wavelength * refine.distance
-                      / (2 * np.pi * refine.pixel_size))
-        max_radius = (self.qmax * refine.wavelength * refine.distance
-                      / (2 * np.pi * refine.pixel_size))
-        x = np.arange(self.shape[2])
-        y = np.arange(self.shape[1])
-        min_mask = ((x[np.newaxis, :]-refine.xc)**2
-                    + (y[:, np.newaxis]-refine.yc)**2 < min_radius**2)
-        max_mask = ((x[np.newaxis, :]-refine.xc)**2
-                    + (y[:, np.newaxis]-refine.yc)**2 > max_radius**2)
-        return min_mask | max_mask
+        refine.shape = self.shape[1:]
+        polar_angles = refine.detector_angles()[0]
+        Q = (4 * np.pi * np.sin(polar_angles * np.pi / 360)
+             / refine.wavelength)
+        return (Q < self.qmin) | (Q > self.qmax)
 
     def read_monitor(self):
         try:
@@ -1316,10 +1353,10 @@ class NXReduce(QtCore.QObject):
             try:
                 peaks = self.find_peaks()
                 if self.gui:
-                    if peaks:
+                    if len(peaks) > 0:
                         self.result.emit(peaks)
                     self.stop.emit()
-                elif peaks:
+                elif len(peaks) > 0:
                     self.write_peaks(peaks)
                     self.write_parameters(threshold=self.threshold,
                                           first=self.first, last=self.last)
@@ -1338,53 +1375,13 @@ class NXReduce(QtCore.QObject):
 
     def find_peaks(self):
         self.log("Finding peaks")
-        tic = self.start_progress(self.first, self.last)
-        self.blobs = []
-        if self.concurrent:
-            from nxrefine.nxutils import NXExecutor, as_completed
-            with NXExecutor(max_workers=self.process_count,
-                            mp_context=self.concurrent) as executor:
-                futures = []
-                for i in range(self.first, self.last+1, 50):
-                    j, k = i - min(5, i), min(i+55, self.last+5, self.nframes)
-                    futures.append(executor.submit(
-                        peak_search,
-                        self.field.nxfilename, self.field.nxfilepath,
-                        i, j, k, self.threshold, mask=self.pixel_mask,
-                        min_pixels=self.min_pixels))
-                for future in as_completed(futures):
-                    z, blobs = future.result()
-                    self.blobs += [b for b in blobs if b.z >= z
-                                   and b.z < min(z+50, self.last)]
-                    self.update_progress(z)
-                    futures.remove(future)
-        else:
-            for i in range(self.first, self.last+1, 50):
-                j, k = i - min(5, i), min(i+55, self.last+5, self.nframes)
-                z, blobs = peak_search(
-                    self.field.nxfilename, self.field.nxfilepath,
-                    i, j, k, self.threshold, mask=self.pixel_mask,
-                    min_pixels=self.min_pixels)
-                self.blobs += [b for b in blobs if b.z >= z
-                               and b.z < min(z+50, self.last)]
-                self.update_progress(z)
-
-        peaks = sorted([b for b in self.blobs], key=operator.attrgetter('z'))
-
-        toc = self.stop_progress()
-        self.log(f"{len(peaks)} peaks found ({toc - tic:g} seconds)")
+        peaks, _ = self.reduce_frames(['nxfind'])
         return peaks
 
     def write_peaks(self, peaks):
         group = NXreflections()
-        group['intensity'] = NXfield([peak.intensity for peak in peaks],
-                                     dtype=float)
-        group['x'] = NXfield([peak.x for peak in peaks], dtype=float)
-        group['y'] = NXfield([peak.y for peak in peaks], dtype=float)
-        group['z'] = NXfield([peak.z for peak in peaks], dtype=float)
-        group['sigx'] = NXfield([peak.sigx for peak in peaks], dtype=float)
-        group['sigy'] = NXfield([peak.sigy for peak in peaks], dtype=float)
-        group['sigz'] = NXfield([peak.sigz for peak in peaks], dtype=float)
+        for field in ('intensity', 'x', 'y', 'z', 'sigx', 'sigy', 'sigz'):
+            group[field] = NXfield(peaks[field], dtype=float)
         group.attrs['first'] = self.first
         group.attrs['last'] = self.last
         group.attrs['threshold'] = self.threshold
@@ -1434,6 +1431,9 @@ class NXReduce(QtCore.QObject):
         refine = NXRefine(self.entry)
         refine.polar_max = self.polar_max
         refine.hkl_tolerance = self.hkl_tolerance
+        if refine.Umat is None:
+            indexed = refine.auto_orient()
+            self.log(f"Automatic orientation indexed {indexed} peaks")
         refine.refine_hkls(lattice=lattice, chi=True, omega=True, theta=True)
         fit_report = refine.fit_report
         refine.refine_hkls(chi=True, omega=True, theta=True)
@@ -1483,52 +1483,24 @@ class NXReduce(QtCore.QObject):
 
     def prepare_mask(self):
         """Prepare 3D mask"""
-        tic = self.start_progress(self.first, self.last)
-        t1 = self.mask_parameters['threshold_1']
-        h1 = self.mask_parameters['horizontal_size_1']
-        t2 = self.mask_parameters['threshold_2']
-        h2 = self.mask_parameters['horizontal_size_2']
+        _, mask = self.reduce_frames(['nxprepare'])
+        return mask
 
+    def initialize_mask(self):
+        """Create the temporary file used to accumulate the 3D mask."""
         mask_root = nxopen(self.mask_file+'.h5', 'w')
         mask_root['entry'] = NXentry()
         mask_root['entry/mask'] = (
             NXfield(shape=self.shape, dtype=np.int8, fillvalue=0))
+        return mask_root
 
-        if self.concurrent:
-            from nxrefine.nxutils import NXExecutor, as_completed
-            with NXExecutor(max_workers=self.process_count,
-                            mp_context=self.concurrent) as executor:
-                futures = []
-                for i in range(self.first, self.last+1, 10):
-                    j, k = i - min(1, i), min(i+11, self.last+1, self.nframes)
-                    futures.append(executor.submit(
-                        mask_volume,
-                        self.field.nxfilename, self.field.nxfilepath,
-                        mask_root.nxfilename, 'entry/mask', i, j, k,
-                        self.pixel_mask, t1, h1, t2, h2))
-                for future in as_completed(futures):
-                    k = future.result()
-                    self.update_progress(k)
-                    futures.remove(future)
-        else:
-            for i in range(self.first, self.last+1, 10):
-                j, k = i - min(1, i), min(i+11, self.last+1, self.nframes)
-                k = mask_volume(self.field.nxfilename, self.field.nxfilepath,
-                                mask_root.nxfilename, 'entry/mask', i, j, k,
-                                self.pixel_mask, t1, h1, t2, h2)
-                self.update_progress(k)
-
+    def mask_excluded_frames(self, mask_root):
+        """Mask the frames outside the range used in the reduction."""
         frame_mask = np.ones(shape=self.shape[1:], dtype=np.int8)
         with mask_root.nxfile:
             mask_root['entry/mask'][:self.first] = frame_mask
             mask_root['entry/mask'][self.last+1:] = frame_mask
 
-        toc = self.stop_progress()
-
-        self.log(f"3D Mask prepared in {toc-tic:g} seconds")
-
-        return mask_root['entry/mask']
-
     def write_mask(self, mask):
         """Write mask to file."""
         if os.path.exists(self.mask_file):
@@ -1542,6 +1514,251 @@ class NXReduce(QtCore.QObject):
                 self.data['data_mask'] = NXlink('entry/mask', self.mask_file)
         self.log(f"3D Mask written to '{self.mask_file}'")
 
+    def fused_tasks(self):
+        """Return the frame-based tasks that can share a single pass.
+
+        The 'nxmax', 'nxfind', and 'nxprepare' tasks all iterate over
+        the raw data frames. If more than one of them is requested, they
+        are performed together so that the raw data are only read once.
+
+        Returns
+        -------
+        list of str
+            Names of the tasks to be performed in a single pass, or an
+            empty list if fewer than two are requested.
+        """
+        tasks = []
+        if self.maxcount and self.not_processed('nxmax'):
+            tasks.append('nxmax')
+        if self.find and self.not_processed('nxfind'):
+            tasks.append('nxfind')
+        if self.prepare and self.not_processed('nxprepare_mask'):
+            tasks.append('nxprepare')
+        if len(tasks) > 1 and not self.gui:
+            return tasks
+        else:
+            return []
+
+    def nxfuse(self, tasks):
+        """Perform frame-based tasks with a single read of the raw data.
+
+        Parameters
+        ----------
+        tasks : list of str
+            Names of the tasks, chosen from 'nxmax', 'nxfind', and
+            'nxprepare'.
+        """
+        if not self.raw_data_exists():
+            self.log("Data file not available")
+            return
+        self.record_start(*tasks)
+        remaining = list(tasks)
+        try:
+            if 'nxprepare' in tasks:
+                self.mask_file = os.path.join(self.directory,
+                                              self.entry_name+'_mask.nxs')
+            peaks, mask = self.reduce_frames(tasks)
+            if 'nxmax' in tasks:
+                self.write_maximum()
+                self.write_parameters(first=self.first, last=self.last)
+                self.record('nxmax', maximum=self.maximum,
+                            first_frame=self.first, last_frame=self.last,
+                            qmin=self.qmin)
+                self.record_end('nxmax')
+                remaining.remove('nxmax')
+            if 'nxfind' in tasks:
+                if len(peaks) > 0:
+                    self.write_peaks(peaks)
+                    self.write_parameters(threshold=self.threshold,
+                                          first=self.first, last=self.last)
+                    self.record('nxfind', threshold=self.threshold,
+                                first=self.first, last=self.last,
+                                peak_number=len(peaks))
+                    self.record_end('nxfind')
+                else:
+                    self.record_fail('nxfind')
+                remaining.remove('nxfind')
+            if 'nxprepare' in tasks:
+                self.write_mask(mask)
+                self.write_parameters(first=self.first, last=self.last)
+                self.record(
+                    'nxprepare', masked_file=self.mask_file,
+                    first=self.first, last=self.last,
+                    threshold1=self.mask_parameters['threshold_1'],
+                    horizontal1=self.mask_parameters['horizontal_size_1'],
+                    threshold2=self.mask_parameters['threshold_2'],
+                    horizontal2=self.mask_parameters['horizontal_size_2'],
+                    process='nxprepare_mask')
+                self.record_end('nxprepare')
+                remaining.remove('nxprepare')
+        except Exception as error:
+            self.log(str(error))
+            for task in remaining:
+                self.record_fail(task)
+            raise
+
+    def frame_slabs(self, data, block_size=50, halo=5):
+        """Yield successive slabs of raw data, reading each frame once.
+
+        Each slab contains a block of frames, along with the frames on
+        either side that are required by the peak search and mask
+        convolutions. Frames that overlap the previous slab are retained
+        in memory rather than being read from the file again.
+
+        Parameters
+        ----------
+        data : h5py.Dataset
+            Raw data.
+        block_size : int, optional
+            Number of frames in each block, by default 50.
+        halo : int, optional
+            Number of frames on either side of each block, by default 5.
+
+        Yields
+        ------
+        tuple of int, int, and array-like
+            Index of the first frame of the block, index of the first
+            frame of the slab, and the slab.
+        """
+        slab, j = None, 0
+        for i in range(self.first, self.last+1, block_size):
+            start = i - min(halo, i)
+            stop = min(i+block_size+halo, self.last+halo, self.nframes)
+            if slab is None:
+                slab = data[start:stop]
+            elif stop > j + slab.shape[0]:
+                slab = np.concatenate((slab[start-j:],
+                                       data[j+slab.shape[0]:stop]))
+            else:
+                slab = slab[start-j:stop-j]
+            j = start
+            yield i, j, slab
+
+    def reduce_frames(self, tasks):
+        """Perform the frame-based tasks in a single pass over the data.
+
+        Parameters
+        ----------
+        tasks : list of str
+            Names of the tasks, chosen from 'nxmax', 'nxfind', and
+            'nxprepare'.
+
+        Returns
+        -------
+        tuple of array-like and NXfield
+            Bragg peaks and 3D mask, if requested, or None.
+        """
+        self.log(f"Reducing frames in a single pass ({', '.join(tasks)})")
+        tic = self.start_progress(self.first, self.last)
+        block_size = 50
+        maximum = 0.0
+        vsum = None
+        fsum = np.zeros(self.nframes, dtype=np.float64)
+        psum = np.zeros(self.nframes, dtype=np.float64)
+        peaks = []
+        mask_root = None
+        if 'nxprepare' in tasks:
+            mask_root = self.initialize_mask()
+            writer = NXBlockWriter(mask_root['entry/mask'],
+                                   self.first - min(1, self.first) + 1)
+            mask_parameters = self.mask_parameters
+        else:
+            mask_parameters = None
+        if 'nxfind' in tasks:
+            threshold = self.threshold
+        else:
+            threshold = None
+
+        def accumulate(i, result):
+            nonlocal maximum, vsum
+            if 'maximum' in result:
+                n = result['summed_frames'].shape[0]
+                fsum[i:i+n] = result['summed_frames']
+                psum[i:i+n] = result['partial_frames']
+                if vsum is None:
+                    vsum = result['summed_data']
+                else:
+                    vsum += result['summed_data']
+                if maximum < result['maximum']:
+                    maximum = result['maximum']
+            if 'peaks' in result:
+                peaks.append(result['peaks'])
+            if 'mask' in result:
+                with mask_root.nxfile:
+                    writer.add(result['mask_start'], result['mask'])
+            self.update_progress(i)
+
+        with self.field.nxfile:
+            data = self.field.nxfile[self.raw_path]
+            if 'nxmax' in tasks:
+                self.pixel_mask = self.pixel_mask | self.hot_pixel_mask(data)
+                transmission_mask = self.transmission_coordinates()
+            else:
+                transmission_mask = None
+            kwargs = {'transmission_mask': transmission_mask,
+                      'threshold': threshold, 'min_pixels': self.min_pixels,
+                      'mask_parameters': mask_parameters,
+                      'block_size': block_size}
+            slabs = self.frame_slabs(data, block_size=block_size)
+            if self.concurrent:
+                from nxrefine.nxutils import NXSharedArray, get_executor
+                executor = get_executor(max_workers=self.process_count,
+                                        mp_context=self.concurrent)
+                futures = {}
+
+                def collect(done):
+                    for future in done:
+                        futures.pop(future).release()
+                        accumulate(*future.result())
+
+                try:
+                    for i, j, slab in slabs:
+                        if len(futures) >= self.process_count:
+                            collect(wait(futures,
+                                         return_when=FIRST_COMPLETED).done)
+                        shared = NXSharedArray(slab)
+                        futures[executor.submit(
+                            reduce_shared_slab, shared.name, shared.shape,
+                            shared.dtype, i, j, self.nframes, self.first,
+                            self.last, self.pixel_mask, **kwargs)] = shared
+                    collect(wait(futures).done)
+                finally:
+                    for future in futures:
+                        future.cancel()
+                    for shared in futures.values():
+                        shared.release()
+            else:
+                for i, j, slab in slabs:
+                    accumulate(*reduce_slab(slab, i, j, self.nframes,
+                                            self.first, self.last,
+                                            self.pixel_mask, **kwargs))
+
+        if 'nxmax' in tasks:
+            vsum = np.ma.masked_array(vsum)
+            vsum.mask = self.pixel_mask
+            self.maximum = maximum
+            self.summed_data = NXfield(vsum, name='summed_data')
+            self.summed_frames = NXfield(fsum, name='summed_frames')
+            self.partial_frames = NXfield(psum, name='partial_frames')
+            self.log(f"Maximum counts: {maximum}")
+        if 'nxfind' in tasks:
+            if peaks:
+                peaks = np.concatenate(peaks)
+                peaks = peaks[np.argsort(peaks['z'], kind='stable')]
+            else:
+                peaks = np.zeros(0, dtype=blob_dtype)
+            self.log(f"{len(peaks)} peaks found")
+        if mask_root is not None:
+            with mask_root.nxfile:
+                writer.flush()
+            self.mask_excluded_frames(mask_root)
+            mask = mask_root['entry/mask']
+        else:
+            mask = None
+        toc = self.stop_progress()
+        self.log(f"Frames reduced in a single pass ({toc-tic:g} seconds)")
+        return peaks, mask
+
     def nxtransform(self, mask=False):
         if mask:
             task = 'nxmasked_transform'
@@ -1673,7 +1890,8 @@ class NXReduce(QtCore.QObject):
             refine.l_start, refine.l_step, refine.l_stop = self.Ql
             refine.define_grid()
             refine.prepare_transform(self.transform_file, mask=mask)
-            refine.write_settings(settings_file)
+            refine.write_settings(
+                settings_file, compression=self.storage['compression'] or 0)
             command = refine.cctw_command(mask)
             if command and os.path.exists(self.transform_file):
                 with NXLock(self.transform_file):
@@ -1694,7 +1912,7 @@ class NXReduce(QtCore.QObject):
             try:
                 self.log("Sum files launched")
                 tic = timeit.default_timer()
-                if not self.check_files(scan_list):
+                if not self.check_sum_files(scan_list):
                     self.record_fail('nxsum')
                 else:
                     self.log(
@@ -1725,27 +1943,83 @@ class NXReduce(QtCore.QObject):
                 status = False
         return status
 
-    def sum_files(self, scan_list):
+    def sum_files(self, scan_list, block_size=50):
+        """Sum the raw data files of the listed scans.
 
-        nframes = 3650
-        chunk_size = 500
-        for i, scan in enumerate(scan_list):
+        Each block of frames is read from all the scans and summed in
+        memory, so that the summed file is only written once. The blocks
+        are aligned with the chunks of the raw data.
+
+        Parameters
+        ----------
+        scan_list : list of str
+            Names of the scans to be summed.
+        block_size : int, optional
+            Approximate number of frames in each block, by default 50.
+        """
+        sources = []
+        for scan in scan_list:
             reduce = NXReduce(self.entry_name,
                               os.path.join(self.base_directory, scan))
             self.log(
                 f"Summing {self.entry_name} in '{reduce.raw_file}'")
-            if i == 0:
-                shutil.copyfile(reduce.raw_file, self.raw_file)
-                new_file = h5.File(self.raw_file, 'r+')
-                new_field = new_file[self.raw_path]
+            sources.append((reduce.raw_file, reduce.raw_path))
+
+        with h5.File(sources[0][0], 'r') as source_file:
+            shape = source_file[sources[0][1]].shape
+            chunks = source_file[sources[0][1]].chunks
+        for raw_file, raw_path in sources[1:]:
+            with h5.File(raw_file, 'r') as scan_file:
+                if scan_file[raw_path].shape != shape:
+                    raise NeXusError(
+                        f"Shape of '{raw_file}' does not match {shape}")
+        if chunks:
+            block_size = max(1, block_size // chunks[0]) * chunks[0]
+        nframes = shape[0]
+        blocks = [(j, min(j+block_size, nframes))
+                  for j in range(0, nframes, block_size)]
+
+        def write(start, total):
+            output[start:start+total.shape[0]] = total
+            self.update_progress(start)
+
+        tic = self.start_progress(0, nframes)
+        with h5.File(self.raw_file, 'w') as output_file:
+            with h5.File(sources[0][0], 'r') as source_file:
+                output = copy_structure(source_file, output_file,
+                                        sources[0][1])
+            if self.concurrent:
+                from nxrefine.nxutils import get_executor
+                executor = get_executor(max_workers=self.process_count,
+                                        mp_context=self.concurrent)
+                futures = set()
+                try:
+                    for j, k in blocks:
+                        if self.stopped:
+                            return
+                        if len(futures) >= self.process_count:
+                            done, futures = wait(futures,
+                                                 return_when=FIRST_COMPLETED)
+                            for future in done:
+                                write(*future.result())
+                        futures.add(executor.submit(sum_frames, sources, j, k))
+                    while futures:
+                        if self.stopped:
+                            return
+                        done, futures = wait(futures,
+                                             return_when=FIRST_COMPLETED)
+                        for future in done:
+                            write(*future.result())
+                finally:
+                    for future in futures:
+                        future.cancel()
             else:
-                scan_file = h5.File(reduce.raw_file, 'r')
-                scan_field = scan_file[reduce.raw_path]
-                for i in range(0, nframes, chunk_size):
-                    new_slab = new_field[i:i+chunk_size, :, :]
-                    scan_slab = scan_field[i:i+chunk_size, :, :]
-                    new_field[i:i+chunk_size, :, :] = new_slab + scan_slab
-        self.log("Raw data files summed")
+                for j, k in blocks:
+                    if self.stopped:
+                        return
+                    write(*sum_frames(sources, j, k))
+        toc = self.stop_progress()
+        self.log(f"Raw data files summed ({toc - tic:g} seconds)")
 
     def sum_monitors(self, scan_list, update=False):
 
@@ -1782,9 +2056,12 @@ class NXReduce(QtCore.QObject):
             self.nxlink()
         if self.copy:
             self.nxcopy()
-        if self.maxcount:
+        fused_tasks = self.fused_tasks()
+        if fused_tasks:
+            self.nxfuse(fused_tasks)
+        if self.maxcount and 'nxmax' not in fused_tasks:
             self.nxmax()
-        if self.find:
+        if self.find and 'nxfind' not in fused_tasks:
             self.nxfind()
         if self.refine:
             if self.complete('nxcopy') and self.complete('nxfind'):
@@ -1792,7 +2069,7 @@ class NXReduce(QtCore.QObject):
             else:
                 self.log("Cannot refine orientation matrix")
                 self.record_fail('nxrefine')
-        if self.prepare:
+        if self.prepare and 'nxprepare' not in fused_tasks:
             self.nxprepare()
         if self.transform:
             if self.oriented:
@@ -1829,45 +2106,46 @@ class NXReduce(QtCore.QObject):
             raise NeXusError("NXServer not configured")
 
         tasks = []
-        if self.load:
-            tasks.append('load')
-            self.queue_task('nxload')
-        if self.link:
-            tasks.append('link')
-            self.queue_task('nxlink')
-        if self.copy:
-            tasks.append('copy')
-            self.queue_task('nxcopy')
-        if self.maxcount:
-            tasks.append('max')
-            self.queue_task('nxmax')
-        if self.find:
-            tasks.append('find')
-            self.queue_task('nxfind')
-        if self.refine:
-            tasks.append('refine')
-            self.queue_task('nxrefine')
-        if self.prepare:
-            tasks.append('prepare')
-            self.queue_task('nxprepare')
-        if self.transform:
-            tasks.append('transform')
-            if self.regular:
-                self.queue_task('nxtransform')
-            if self.mask:
-                self.queue_task('nxmasked_transform')
-        if self.combine:
-            tasks.append('combine')
-            if self.regular:
-                self.queue_task('nxcombine', entry='entry')
-            if self.mask:
-                self.queue_task('nxmasked_combine', entry='entry')
-        if self.pdf:
-            tasks.append('pdf')
-            if self.regular:
-                self.queue_task('nxpdf', entry='entry')
-            if self.mask:
-                self.queue_task('nxmasked_pdf', entry='entry')
+        with self.db.transaction():
+            if self.load:
+                tasks.append('load')
+                self.queue_task('nxload')
+            if self.link:
+                tasks.append('link')
+                self.queue_task('nxlink')
+            if self.copy:
+                tasks.append('copy')
+                self.queue_task('nxcopy')
+            if self.maxcount:
+                tasks.append('max')
+                self.queue_task('nxmax')
+            if self.find:
+                tasks.append('find')
+                self.queue_task('nxfind')
+            if self.refine:
+                tasks.append('refine')
+                self.queue_task('nxrefine')
+            if self.prepare:
+                tasks.append('prepare')
+                self.queue_task('nxprepare')
+            if self.transform:
+                tasks.append('transform')
+                if self.regular:
+                    self.queue_task('nxtransform')
+                if self.mask:
+                    self.queue_task('nxmasked_transform')
+            if self.combine:
+                tasks.append('combine')
+                if self.regular:
+                    self.queue_task('nxcombine', entry='entry')
+                if self.mask:
+                    self.queue_task('nxmasked_combine', entry='entry')
+            if self.pdf:
+                tasks.append('pdf')
+                if self.regular:
+                    self.queue_task('nxpdf', entry='entry')
+                if self.mask:
+                    self.queue_task('nxmasked_pdf', entry='entry')
 
         if not tasks:
             return
@@ -1930,7 +2208,6 @@ class NXMultiReduce(NXReduce):
         self.mask = mask
         if not self.mask:
             self.regular = True
-        self.julia = None
 
     def __repr__(self):
         return f"NXMultiReduce('{self.sample}_{self.scan}')"
@@ -2087,14 +2364,6 @@ class NXMultiReduce(NXReduce):
                 self.log(
                     "Need to define a valid Laue group before PDF calculation")
                 return
-            if self.julia is None:
-                try:
-                    self.julia = init_julia()
-                except Exception as error:
-                    self.log(f"Cannot initialize Julia: {error}")
-                    self.julia = None
-                    return
-            load_julia(['LaplaceInterpolation.jl'])
             self.record_start(task)
             self.init_pdf(mask)
             try:
@@ -2153,9 +2422,16 @@ class NXMultiReduce(NXReduce):
         symm_root['entry/data'] = NXdata()
         symmetry = NXSymmetry(self.entry[self.transform_path],
                               laue_group=self.refine.laue_group)
-        symm_root['entry/data/data'] = symmetry.symmetrize(entries=True)
+        storage = self.storage_options(symmetry.shape)
+        storage.setdefault('dtype', symmetry.dtype)
+        symm_root['entry/data/data'] = NXfield(shape=symmetry.shape,
+                                               fillvalue=0, **storage)
+        symmetry.symmetrize(entries=True,
+                            output=symm_root['entry/data/data'])
         symm_root['entry/data'].nxsignal = symm_root['entry/data/data']
-        symm_root['entry/data'].nxweights = 1.0 / self.taper
+        symm_root['entry/data/data_weights'] = NXfield(
+            1.0 / self.taper, **self.storage_options(self.taper.shape))
+        symm_root['entry/data/data_weights'].attrs['qmax'] = self.qmax
         symm_root['entry/data'].nxaxes = self.entry[self.transform_path].nxaxes
         with self:
             if self.symm_data in self.entry:
@@ -2175,8 +2451,9 @@ class NXMultiReduce(NXReduce):
     def fft_taper(self, qmax=None):
         """Calculate spherical Tukey taper function.
 
-        The taper function values are read from the parent if they are
-        available.
+        The taper function values are read from the symmetrized data of
+        this entry or the parent if they are available on the same grid
+        with the same value of qmax.
 
         Parameters
         ----------
@@ -2188,27 +2465,25 @@ class NXMultiReduce(NXReduce):
         array-like
             An array containing the 3D taper function values.
         """
+        if qmax is None:
+            qmax = self.qmax
+        shape = (self.Ql.size, self.Qk.size, self.Qh.size)
+        entries = [self.entry]
         if self.parent:
-            entry = self.parent_root['entry']
-            if ('symm_transform' in entry
-                    and entry['symm_transform'].nxweights):
-                return 1.0 / entry['symm_transform'].nxweights.nxvalue
-            elif ('symm_masked_transform' in entry
-                    and entry['symm_masked_transform'].nxweights):
-                return 1.0 / entry['symm_masked_transform'].nxweights.nxvalue
+            entries.insert(0, self.parent_root['entry'])
+        for entry in entries:
+            for symm_data in ['symm_transform', 'symm_masked_transform']:
+                if symm_data in entry and entry[symm_data].nxweights:
+                    weights = entry[symm_data].nxweights
+                    if (weights.shape == shape and
+                            np.isclose(weights.attrs.get('qmax', qmax),
+                                       qmax)):
+                        return 1.0 / weights.nxvalue
         self.log(f"{self.title}: Calculating taper function")
         tic = timeit.default_timer()
-        if qmax is None:
-            qmax = self.qmax
-        Z, Y, X = np.meshgrid(self.Ql * self.refine.cstar,
-                              self.Qk * self.refine.bstar,
-                              self.Qh * self.refine.astar,
-                              indexing='ij')
-        taper = np.ones(X.shape, dtype=np.float32)
-        R = 2 * np.sqrt(X**2 + Y**2 + Z**2) / qmax
-        idx = (R > 1.0) & (R < 2.0)
-        taper[idx] = 0.5 * (1 - np.cos(R[idx] * np.pi))
-        taper[R >= 2.0] = taper.min()
+        taper = fft_taper(self.Qh * self.refine.astar,
+                          self.Qk * self.refine.bstar,
+                          self.Ql * self.refine.cstar, qmax)
         toc = timeit.default_timer()
         self.log(f"{self.title}: Taper function calculated "
                          f"({toc-tic:g} seconds)")
@@ -2226,14 +2501,14 @@ class NXMultiReduce(NXReduce):
         tic = timeit.default_timer()
         symm_data = self.entry[self.symm_data].nxsignal.nxvalue
         symm_data *= self.taper
-        fft = np.real(scipy.fft.fftshift(
-            scipy.fft.fftn(scipy.fft.fftshift(symm_data[:-1, :-1, :-1]),
-                           workers=self.process_count)))
+        fft = centered_fft(symm_data[:-1, :-1, :-1],
+                           workers=self.process_count)
         fft *= (1.0 / np.prod(fft.shape))
 
         with nxopen(self.total_pdf_file, 'a') as root:
             root['entry'] = NXentry()
-            root['entry/pdf'] = NXdata(NXfield(fft, name='pdf'))
+            root['entry/pdf'] = NXdata(
+                NXfield(fft, name='pdf', **self.storage_options(fft.shape)))
 
         with self:
             if self.total_pdf_data in self.entry:
@@ -2276,31 +2551,53 @@ class NXMultiReduce(NXReduce):
         self.refine.polar_max = max([NXRefine(self.root[e]).two_theta_max()
                                      for e in self.entries])
         if self.refine.laue_group in ['-3', '-3m', '6/m', '6/mmm']:
-            _indices = []
-            for idx in self.refine.indices:
-                _indices += self.refine.indices_hkl(*idx)
-            return _indices
+            return self.refine.all_indices
         else:
             return self.refine.indices
 
     def symmetrize(self, data):
         if self.refine.laue_group not in ['-3', '-3m', '6/m', '6/mmm']:
-            import tempfile
-            with nxopen(tempfile.mkstemp(suffix='.nxs')[1], mode='w') as root:
-                root['data'] = data
-                symmetry = NXSymmetry(root['data'],
-                                      laue_group=self.refine.laue_group)
-            result = symmetry.symmetrize()
-            os.remove(root.nxfilename)
-            return result
+            symmetry = NXSymmetry(NXfield(data, name='data'),
+                                  laue_group=self.refine.laue_group)
+            return symmetry.symmetrize()
         else:
             return data
 
-    def punch_and_fill(self):
-        self.log(f"{self.title}: Performing punch-and-fill")
+    def hole_corners(self, Qh, Qk, Ql, shape):
+        """Return the grid indices of the holes punched at each Bragg peak.
+
+        The grid indices of each HKL are calculated from the origin and
+        step size of each axis, and HKLs that do not lie on a grid point,
+        or whose holes do not fit within the grid, are excluded.
 
-        from julia import Main
-        LaplaceInterpolation = Main.LaplaceInterpolation
+        Parameters
+        ----------
+        Qh, Qk, Ql : NXfield
+            Axes of the symmetrized data in reciprocal lattice units.
+        shape : tuple of int
+            Shape of the array containing each hole.
+
+        Returns
+        -------
+        array-like
+            Array of shape (N, 3) containing the indices of the first
+            corner of each hole in the order (l, k, h).
+        """
+        hkls = np.array(self.indices, dtype=float).reshape(-1, 3)
+        corners = []
+        valid = np.ones(len(hkls), dtype=bool)
+        for Q, q, size in zip([Ql, Qk, Qh], [hkls[:, 2], hkls[:, 1],
+                              hkls[:, 0]], shape):
+            Q = np.asarray(Q.nxvalue, dtype=float)
+            i = np.rint((q - Q[0]) / (Q[1] - Q[0])).astype(int)
+            corner = i - (size - 1) // 2
+            valid &= (corner >= 0) & (corner + size <= Q.size)
+            valid &= np.isclose(Q[np.clip(i, 0, Q.size-1)], q)
+            corners.append(corner)
+        return np.column_stack(corners)[valid]
+
+    def punch_and_fill(self, batch_size=256):
+        self.log(f"{self.title}: Performing punch-and-fill")
 
         tic = timeit.default_timer()
         symm_group = self.entry[self.symm_data]
@@ -2309,59 +2606,82 @@ class NXMultiReduce(NXReduce):
         symm_root = nxopen(self.symm_file, 'rw')
         symm_data = symm_root['entry/data/data']
 
-        mask, mask_indices = self.hole_mask()
-        idx = [Main.CartesianIndex(int(i[0]+1), int(i[1]+1), int(i[2]+1))
-               for i in mask_indices]
-        ml = int((mask.shape[0]-1)/2)
-        mk = int((mask.shape[1]-1)/2)
-        mh = int((mask.shape[2]-1)/2)
-        fill_data = np.zeros(shape=symm_data.shape, dtype=symm_data.dtype)
+        mask, _ = self.hole_mask()
+        interpolator = NXLaplaceInterpolator(mask)
         self.refine.polar_max = max([NXRefine(self.root[e]).two_theta_max()
                                      for e in self.entries])
-        for h, k, l in self.indices:
-            try:
-                ih = np.argwhere(np.isclose(Qh, h))[0][0]
-                ik = np.argwhere(np.isclose(Qk, k))[0][0]
-                il = np.argwhere(np.isclose(Ql, l))[0][0]
-                lslice = slice(il-ml, il+ml+1)
-                kslice = slice(ik-mk, ik+mk+1)
-                hslice = slice(ih-mh, ih+mh+1)
-                v = symm_data[(lslice, kslice, hslice)].nxvalue
-                if v.max() > 0.0:
-                    w = LaplaceInterpolation.matern_3d_grid(v, idx)
-                    fill_data[(lslice, kslice, hslice)] += np.where(mask, w, 0)
-            except Exception:
-                pass
+        corners = self.hole_corners(Qh, Qk, Ql, mask.shape)
+
+        buffer = symm_data.nxvalue
+        windows = np.lib.stride_tricks.sliding_window_view(buffer,
+                                                           mask.shape)
+        offsets = np.ravel_multi_index(np.nonzero(mask), buffer.shape)
+        fill_data = np.zeros(shape=buffer.shape, dtype=buffer.dtype)
+        for i in range(0, len(corners), batch_size):
+            batch = corners[i:i+batch_size]
+            v = windows[batch[:, 0], batch[:, 1], batch[:, 2]]
+            punched = v.reshape(len(v), -1).max(axis=1) > 0.0
+            batch, v = batch[punched], v[punched]
+            if len(v) == 0:
+                continue
+            np.add.at(fill_data.reshape(-1),
+                      np.ravel_multi_index(batch.T, buffer.shape)[:, None]
+                      + offsets, interpolator.interpolate(v))
+        del windows, buffer
 
         self.log(f"{self.title}: Symmetrizing punch-and-fill")
 
         fill_data = self.symmetrize(fill_data)
-        changed_idx = np.where(fill_data > 0)
-        buffer = symm_data.nxvalue
-        buffer[changed_idx] = fill_data[changed_idx]
-        if 'fill' in symm_root['entry/data']:
-            del symm_root['entry/data/fill']
-        symm_root['entry/data/fill'] = buffer
-        with self:
-            if 'filled_data' in self.entry[self.symm_data]:
-                del self.entry[self.symm_data]['filled_data']
-            self.entry[self.symm_data]['filled_data'] = NXlink(
-                '/entry/data/fill', file=self.symm_file)
-
-        buffer[changed_idx] *= 0
-        if 'punch' in symm_root['entry/data']:
-            del symm_root['entry/data/punch']
-        symm_root['entry/data/punch'] = buffer
+        fill_indices = np.flatnonzero(fill_data > 0)
+        fill_values = fill_data.reshape(-1)[fill_indices]
+        del fill_data
+        for name in ['fill', 'punch', 'fill_indices', 'fill_values']:
+            if name in symm_root['entry/data']:
+                del symm_root['entry/data'][name]
+        symm_root['entry/data/fill_indices'] = fill_indices
+        symm_root['entry/data/fill_values'] = NXfield(fill_values,
+                                                      dtype=symm_data.dtype)
         with self:
-            if 'punched_data' in self.entry[self.symm_data]:
-                del self.entry[self.symm_data]['punched_data']
-            self.entry[self.symm_data]['punched_data'] = NXlink(
-                '/entry/data/punch', file=self.symm_file)
+            symm_group = self.entry[self.symm_data]
+            for name in ['filled_data', 'punched_data', 'fill_indices',
+                         'fill_values']:
+                if name in symm_group:
+                    del symm_group[name]
+            for name in ['fill_indices', 'fill_values']:
+                symm_group[name] = NXlink(f'/entry/data/{name}',
+                                          file=self.symm_file)
 
         toc = timeit.default_timer()
         self.log(f"{self.title}: Punch-and-fill completed "
                          f"({toc - tic:g} seconds)")
 
+    def filled_data(self, punched=False):
+        """Return the symmetrized data after punch-and-fill.
+
+        Only the indices and values of the filled voxels are stored, so
+        the volume is reconstructed from the symmetrized data, which are
+        read from the file to avoid modifying any cached values.
+
+        Parameters
+        ----------
+        punched : bool, optional
+            True if the holes are left empty, by default False.
+
+        Returns
+        -------
+        array-like
+            Symmetrized data with the holes filled or punched.
+        """
+        with nxopen(self.symm_file, 'r') as symm_root:
+            symm_group = symm_root['entry/data']
+            data = symm_group.nxsignal.nxvalue
+            indices = symm_group['fill_indices'].nxvalue
+            if punched:
+                data.reshape(-1)[indices] = 0.0
+            else:
+                data.reshape(-1)[indices] = symm_group['fill_values'].nxvalue
+        return data
+
     def delta_pdf(self):
         self.log(f"{self.title}: Calculating Delta-PDF")
         if os.path.exists(self.pdf_file):
@@ -2372,16 +2692,16 @@ class NXMultiReduce(NXReduce):
                     f"{self.title}: Delta-PDF file already exists")
                 return
         tic = timeit.default_timer()
-        symm_data = self.entry[self.symm_data]['filled_data'].nxvalue
+        symm_data = self.filled_data()
         symm_data *= self.taper
-        fft = np.real(scipy.fft.fftshift(
-            scipy.fft.fftn(scipy.fft.fftshift(symm_data[:-1, :-1, :-1]),
-                           workers=self.process_count)))
+        fft = centered_fft(symm_data[:-1, :-1, :-1],
+                           workers=self.process_count)
         fft *= (1.0 / np.prod(fft.shape))
 
         root = nxopen(self.pdf_file, 'a')
         root['entry'] = NXentry()
-        root['entry/pdf'] = NXdata(NXfield(fft, name='pdf'))
+        root['entry/pdf'] = NXdata(
+            NXfield(fft, name='pdf', **self.storage_options(fft.shape)))
 
         if self.pdf_data in self.entry:
             with self:
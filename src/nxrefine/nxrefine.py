@@ -7,6 +7,9 @@
 # -----------------------------------------------------------------------------
 
 import os
+import re
+from collections.abc import Mapping
+from itertools import combinations
 
 import numpy as np
 import numpy.ma as ma
@@ -14,13 +17,15 @@ from nexusformat.nexus import (NeXusError, NXdata, NXdetector, NXentry,
                                NXfield, NXgoniometer, NXgroup, NXinstrument,
                                NXlink, NXmonochromator, NXroot, NXsample)
 from numpy.linalg import inv, norm
-from scipy import optimize
 
-from .nxutils import init_julia, load_julia, parse_orientation
+from .nxutils import parse_orientation
 
 degrees = 180.0 / np.pi
 radians = np.pi / 180.0
 
+# Polar and azimuthal angle maps of recently used detector geometries
+_detector_angles = {}
+
 
 def find_nearest(array, value):
     """Return array value closest to the requested value."""
@@ -57,6 +62,84 @@ def rotmat(axis, angle):
     return np.matrix(mat)
 
 
+def rotmats(axis, angles):
+    """Return a stack of rotation matrices about the specified axis.
+
+    Parameters
+    ----------
+    axis : {1, 2, 3}
+        Index of the rotation axis.
+    angles : array_like
+        Angles of rotation in degrees.
+
+    Returns
+    -------
+    np.ndarray
+        An (N, 3, 3) array of rotation matrices, one for each angle.
+    """
+    angles = np.atleast_1d(np.asarray(angles, dtype=float)) * radians
+    cang, sang = np.cos(angles), np.sin(angles)
+    mats = np.zeros((angles.size, 3, 3))
+    i, j = [(1, 2), (2, 0), (0, 1)][axis-1]
+    mats[:, axis-1, axis-1] = 1.0
+    mats[:, i, i] = mats[:, j, j] = cang
+    mats[:, i, j] = -sang
+    mats[:, j, i] = sang
+    return mats
+
+
+def drotmat(axis, angle):
+    """Return the derivative of a rotation matrix with respect to its angle.
+
+    Parameters
+    ----------
+    axis : {1, 2, 3}
+        Index of the rotation axis.
+    angle : float
+        Angle of rotation in degrees.
+
+    Returns
+    -------
+    np.ndarray
+        The 3x3 derivative matrix per degree of rotation.
+    """
+    generator = np.zeros((3, 3))
+    i, j = [(1, 2), (2, 0), (0, 1)][axis-1]
+    generator[i, j] = -radians
+    generator[j, i] = radians
+    return generator @ np.asarray(rotmat(axis, angle))
+
+
+def unit_vecs(v):
+    """Return vectors normalized along the last axis."""
+    return v / norm(v, axis=-1, keepdims=True)
+
+
+def orientation_triads(v1, v2):
+    """Return orthonormal bases defined by pairs of vectors.
+
+    The first basis vector is parallel to `v1`, the third is normal to
+    both vectors, and the second completes the right-handed set. These
+    are the matrices Tc and Tphi in equations (23) to (25) of Busing
+    and Levy, Acta Crystallographica 22, 457 (1967).
+
+    Parameters
+    ----------
+    v1, v2 : array_like
+        Arrays of vectors with shape (..., 3).
+
+    Returns
+    -------
+    np.ndarray
+        Array with shape (..., 3, 3), whose columns are the basis
+        vectors.
+    """
+    t1 = unit_vecs(v1)
+    t3 = unit_vecs(np.cross(v1, v2))
+    t2 = unit_vecs(np.cross(v1, t3))
+    return np.stack((t1, t2, t3), axis=-1)
+
+
 def vec(x, y=0.0, z=0.0):
     """Return a 1x3 column vector."""
     return np.matrix((x, y, z)).T
@@ -67,6 +150,42 @@ def norm_vec(vec):
     return vec / norm(vec)
 
 
+class NXParameter:
+    """An experimental parameter that is only read when first used.
+
+    Array-valued parameters, such as the peak coordinates and the pixel
+    mask, can be large, so they are read from the NeXus file on demand,
+    instead of whenever an NXRefine instance is created. Assigning a
+    value overrides the value stored in the file until the parameters
+    are read again.
+
+    Parameters
+    ----------
+    path : str
+        Path to the parameter relative to the entry group.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        values = instance._parameters_read
+        if self.name not in values:
+            if instance.entry is not None:
+                values[self.name] = instance.read_parameter(self.path)
+            else:
+                values[self.name] = None
+        return values[self.name]
+
+    def __set__(self, instance, value):
+        instance._parameters_read[self.name] = value
+
+
 class NXRefine:
     """Crystallographic parameters and methods for single crystal diffraction.
 
@@ -147,7 +266,20 @@ class NXRefine:
                     'I': 'I222', 'F': 'F222', 'R': 'R3'}
     """Space groups with minimal systematic absences for each centring."""
 
+    xp = NXParameter('peaks/x')
+    yp = NXParameter('peaks/y')
+    zp = NXParameter('peaks/z')
+    polar_angle = NXParameter('peaks/polar_angle')
+    azimuthal_angle = NXParameter('peaks/azimuthal_angle')
+    rotation_angle = NXParameter('peaks/rotation_angle')
+    intensity = NXParameter('peaks/intensity')
+    pixel_mask = NXParameter('instrument/detector/pixel_mask')
+    Qh = NXParameter('transform/Qh')
+    Qk = NXParameter('transform/Qk')
+    Ql = NXParameter('transform/Ql')
+
     def __init__(self, node=None):
+        self._parameters_read = {}
         if isinstance(node, NXroot) and 'entry' in node:
             self.entry = node['entry']
         elif isinstance(node, NXentry):
@@ -211,12 +343,13 @@ class NXRefine:
         self.name = ""
         self._idx = None
         self._mode = None
+        self._inverses = {}
+        self._hkl_table = None
+        self._rings = None
         self._Dmat_cache = inv(rotmat(1, self.roll) * rotmat(2, self.pitch) *
                                rotmat(3, self.yaw))
         self._Gmat_cache = (rotmat(2, self.theta) * rotmat(3, self.omega) *
                             rotmat(1, self.chi))
-        self.julia = None
-
         self.parameters = None
 
         if self.entry is not None:
@@ -384,44 +517,27 @@ class NXRefine:
                                                 self.symmetry)
             self.centring = self.read_parameter('sample/lattice_centring',
                                                 self.centring)
-            self.xp = self.read_parameter('peaks/x')
-            self.yp = self.read_parameter('peaks/y')
-            self.zp = self.read_parameter('peaks/z')
-            self.polar_angle = self.read_parameter('peaks/polar_angle')
-            self.azimuthal_angle = self.read_parameter('peaks/azimuthal_angle')
-            self.intensity = self.read_parameter('peaks/intensity')
             self.pixel_size = self.read_parameter(
                 'instrument/detector/pixel_size', self.pixel_size)
-            self.pixel_mask = self.read_parameter(
-                'instrument/detector/pixel_mask')
             self.pixel_mask_applied = self.read_parameter(
                 'instrument/detector/pixel_mask_applied')
-            self.rotation_angle = self.read_parameter('peaks/rotation_angle')
             self.primary = self.read_parameter('peaks/primary_reflection')
             self.secondary = self.read_parameter('peaks/secondary_reflection')
             self.Umat = self.read_parameter(
                 'instrument/detector/orientation_matrix')
-            if isinstance(self.polar_angle, np.ndarray):
-                try:
-                    self._polar_max = np.sort(self.polar_angle)[200] + 0.1
-                except IndexError:
-                    self._polar_max = self.polar_angle.max()
-            else:
-                self._polar_max = 10.0
-            self.Qh = self.read_parameter('transform/Qh')
-            self.Qk = self.read_parameter('transform/Qk')
-            self.Ql = self.read_parameter('transform/Ql')
+            # Array-valued parameters are read when first used
+            self._parameters_read.clear()
+            self._polar_max = None
             self.initialize_peaks()
 
     def initialize_peaks(self):
-        try:
-            peaks = list(zip(self.xp,  self.yp, self.zp, self.intensity))
-            self.peaks = dict(zip(range(len(peaks)),
-                                  [NXPeak(*p, parent=self) for p in peaks]))
-            self.initialize_idx()
-        except Exception:
-            self.peaks = None
-            self._idx = None
+        """Reset the Bragg peaks used in refinements.
+
+        The peaks and the list of peaks within the HKL tolerance are only
+        generated when they are first used.
+        """
+        self.peaks = NXPeaks(self)
+        self._idx = None
 
     def write_parameter(self, path, value, attr=None):
         """Write a value to the NeXus object defined by its path.
@@ -676,13 +792,15 @@ class NXRefine:
         self.h_step, self.k_step, self.l_step = [1.0/hs, 1.0/ks, 1.0/ls]
         self.h_shape, self.k_shape, self.l_shape = d['outputdata.dimensions']
 
-    def write_settings(self, settings_file):
+    def write_settings(self, settings_file, compression=0):
         """Write experimental parameters to a CCTW settings file.
 
         Parameters
         ----------
         settings_file : str
             File name of the settings file.
+        compression : int, optional
+            Compression level of the transformed data, by default 0.
         """
         lines = []
         lines.append(f'parameters.pixelSize = {self.pixel_size};')
@@ -720,7 +838,7 @@ class NXRefine:
         lines.append('parameters.extraFlip = false;')
         lines.append(f'outputData.dimensions = {list(self.grid_shape)};')
         lines.append('outputData.chunkSize = [50,50,50];')
-        lines.append('outputData.compression = 0;')
+        lines.append(f'outputData.compression = {int(compression)};')
         lines.append('transformer.transformOptions =  0;')
         lines.append('transformer.oversampleX = 1;')
         lines.append('transformer.oversampleY = 1;')
@@ -932,6 +1050,17 @@ class NXRefine:
 
     @property
     def polar_max(self):
+        if self._polar_max is None:
+            # Include about 200 of the peaks with the lowest polar angles
+            if (isinstance(self.polar_angle, np.ndarray)
+                    and self.polar_angle.size > 200):
+                self._polar_max = np.partition(self.polar_angle,
+                                               200)[200] + 0.1
+            elif (isinstance(self.polar_angle, np.ndarray)
+                    and self.polar_angle.size > 0):
+                self._polar_max = self.polar_angle.max()
+            else:
+                self._polar_max = 10.0
         return self._polar_max
 
     @polar_max.setter
@@ -943,18 +1072,16 @@ class NXRefine:
         polar_max : float
             Maximum polar angle in degrees.
         """
-        try:
-            if not isinstance(self.polar_angle, np.ndarray):
-                self.polar_angle, self.azimuthal_angle = \
-                    self.calculate_angles(self.xp, self.yp)
-            self.x = []
-            self.y = []
-            for i in range(self.npks):
-                if self.polar_angle[i] <= polar_max:
-                    self.x.append(self.xp[i])
-                    self.y.append(self.yp[i])
-        except Exception:
-            pass
+        if self.npks > 0:
+            try:
+                if not isinstance(self.polar_angle, np.ndarray):
+                    self.polar_angle, self.azimuthal_angle = \
+                        self.calculate_angles(self.xp, self.yp)
+                within = self.polar_angle[:self.npks] <= polar_max
+                self.x = self.xp[within]
+                self.y = self.yp[within]
+            except Exception:
+                pass
         self._polar_max = polar_max
         self.initialize_idx()
 
@@ -1072,6 +1199,32 @@ class NXRefine:
             unit_cell=self.lattice_parameters),
             anomalous_flag=False, d_min=d_min).sort()
 
+    @property
+    def hkl_key(self):
+        """Parameters that determine the allowed HKL indices."""
+        return (self.space_group, self.centring,
+                tuple(self.lattice_parameters), self.wavelength,
+                self.polar_max)
+
+    @property
+    def hkl_table(self):
+        """Symmetry-equivalent HKL indices and their two-theta angles.
+
+        The table contains a list of the symmetry-equivalent indices for
+        each independent HKL allowed by the space group, and an array of
+        their two-theta angles in degrees, in order of increasing
+        two-theta. It is only recomputed when the space group, unit
+        cell, wavelength, or maximum polar angle are changed.
+        """
+        key = self.hkl_key
+        if self._hkl_table is None or self._hkl_table[0] != key:
+            _miller = self.miller
+            _equivalents = [self.indices_hkl(*h) for h in _miller.indices()]
+            _two_thetas = np.array(self.unit_cell.two_theta(
+                _miller.indices(), self.wavelength, deg=True))
+            self._hkl_table = (key, (_equivalents, _two_thetas))
+        return self._hkl_table[1]
+
     @property
     def indices(self):
         """Set of HKL indices allowed by the space group.
@@ -1079,10 +1232,12 @@ class NXRefine:
         Only a single index is returned when there are a number of
         symmetry-equivalent indices.
         """
-        _indices = []
-        for h in self.miller.indices():
-            _indices.append(self.indices_hkl(*h)[0])
-        return _indices
+        return [hkls[0] for hkls in self.hkl_table[0]]
+
+    @property
+    def all_indices(self):
+        """Set of HKL indices including all symmetry-equivalent indices."""
+        return [hkl for hkls in self.hkl_table[0] for hkl in hkls]
 
     def indices_hkl(self, H, K, L):
         """Return the symmetry-equivalent HKL indices."""
@@ -1098,8 +1253,7 @@ class NXRefine:
     @property
     def two_thetas(self):
         """The two-theta angles for all the HKL indices."""
-        return list(self.unit_cell.two_theta(self.miller.indices(),
-                                             self.wavelength, deg=True))
+        return list(self.hkl_table[1])
 
     def two_theta_hkl(self, H, K, L):
         """Return the two-theta angle for the specified HKL values."""
@@ -1128,31 +1282,33 @@ class NXRefine:
             Map of ring indices to lists containing their two-theta values
             and symmetry-equivalent HKLs.
         """
+        key = self.hkl_key + (self.polar_tolerance,)
+        if self._rings is not None and self._rings[0] == key:
+            return self._rings[1]
+        _equivalents, _two_thetas = self.hkl_table
+        _multiplicities = np.array([len(hkls) for hkls in _equivalents])
         _rings = {}
-        _r = 0
-        _indices = self.indices
-        for i, polar_angle in enumerate(self.two_thetas):
-            if i == 0:
-                _rings[0] = [polar_angle, [self.indices_hkl(*_indices[i])]]
-            elif polar_angle-_rings[_r][0] > self.polar_tolerance:
+        _r = -1
+        for i, polar_angle in enumerate(_two_thetas):
+            if _r < 0 or polar_angle - _rings[_r][0] > self.polar_tolerance:
                 _r += 1
-                _rings[_r] = [polar_angle, [self.indices_hkl(*_indices[i])]]
-            else:
-                _rings[_r][1].append(self.indices_hkl(*_indices[i]))
+                _rings[_r] = [polar_angle, [_equivalents[i]]]
                 pa = wa = 0.0
-                for j, hkl in enumerate(_rings[_r][1]):
-                    pa += self.two_theta_hkl(*hkl[0]) * len(hkl)
-                    wa += len(hkl)
-                _rings[_r][0] = pa / wa
+            else:
+                _rings[_r][1].append(_equivalents[i])
+            # The ring angle is the average weighted by multiplicity
+            pa += polar_angle * _multiplicities[i]
+            wa += _multiplicities[i]
+            _rings[_r][0] = pa / wa
+        self._rings = (key, _rings)
         return _rings
 
     def assign_rings(self):
         """Assign all the identified Bragg peaks to rings."""
         rings = self.make_rings()
-        ring_angles = [rings[r][0] for r in rings]
-        self.rp = np.zeros((self.npks), dtype=int)
-        for i in range(self.npks):
-            self.rp[i] = (np.abs(self.polar_angle[i] - ring_angles)).argmin()
+        ring_angles = np.array([rings[r][0] for r in rings])
+        self.rp = np.abs(np.asarray(self.polar_angle)[:self.npks, np.newaxis]
+                         - ring_angles).argmin(axis=1)
 
     def get_ring_list(self):
         """Return the HKL indices for all the rings."""
@@ -1281,6 +1437,25 @@ class NXRefine:
         """Return True if the HKL indices are systematically absent."""
         return self.sg.is_sys_absent((int(H), int(K), int(L)))
 
+    def absent_mask(self, H, K, L):
+        """Return a mask that is True for systematically absent HKL indices.
+
+        Parameters
+        ----------
+        H, K, L : array_like
+            HKL indices
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array with the same shape as the HKL arrays.
+        """
+        from cctbx.array_family import flex
+        indices = flex.miller_index(
+            list(zip(*[np.ravel(v).astype(int).tolist() for v in (H, K, L)])))
+        return self.sg.is_sys_absent(indices).as_numpy_array().reshape(
+            np.shape(H))
+
     @property
     def npks(self):
         """Number of identified Bragg peaks."""
@@ -1313,7 +1488,8 @@ class NXRefine:
     @property
     def Bmat(self):
         """Return the B matrix defined by the unit cell."""
-        return inv(self.Bimat)
+        return self.cached_inverse('Bimat', self.lattice_parameters,
+                                   lambda: self.Bimat)
 
     @property
     def Omat(self):
@@ -1361,33 +1537,155 @@ class NXRefine:
         """Vector from the center of the goniometer to the sample."""
         return vec(self.xs, self.ys, self.zs)
 
+    def cached_inverse(self, name, key, matrix):
+        """Return the inverse of a matrix, only recomputing it when necessary.
+
+        Parameters
+        ----------
+        name : str
+            Name used to store the inverse.
+        key : tuple
+            Parameters that define the matrix. The inverse is recomputed
+            if they differ from the values used to compute the stored one.
+        matrix : callable
+            Function returning the matrix to be inverted.
+
+        Returns
+        -------
+        np.matrix
+            The inverse matrix.
+        """
+        if name not in self._inverses or self._inverses[name][0] != key:
+            self._inverses[name] = (key, np.matrix(inv(matrix())))
+        return self._inverses[name][1]
+
+    @property
+    def Oimat(self):
+        """Return the inverse of the detector orientation matrix."""
+        return self.cached_inverse('Omat', str(self.detector_orientation),
+                                   lambda: self.Omat)
+
+    @property
+    def Dimat(self):
+        """Return the inverse of the detector tilt matrix."""
+        return self.cached_inverse('Dmat', self.tilts, lambda: self.Dmat)
+
+    @property
+    def Gimat(self):
+        """Return the inverse of the goniometer matrix at zero phi."""
+        return self.cached_inverse('Gmat', (self.theta, self.omega, self.chi),
+                                   lambda: self._Gmat_cache)
+
+    @property
+    def UBimat(self):
+        """Return the inverse of the UB matrix."""
+        if self.Umat is not None:
+            key = (self.lattice_parameters, np.asarray(self.Umat).tobytes())
+        else:
+            key = None
+        return self.cached_inverse('UBmat', key, lambda: self.UBmat)
+
     def Gvec(self, x, y, z):
-        phi = self.phi + self.phi_step * z
-        v1 = vec(x, y)
-        v2 = self.pixel_size * inv(self.Omat) * (v1 - self.Cvec)
-        v3 = inv(self.Dmat) * v2 - self.Dvec(phi)
-        return (inv(self.Gmat(phi)) *
-                ((norm_vec(v3) / self.wavelength) - self.Evec))
+        return vec(*self.calculate_Gvecs(x, y, z)[0])
 
     def get_Gvecs(self, idx):
-        self.Gvecs = [self.Gvec(x, y, z) for x, y, z
-                      in zip(self.xp[idx], self.yp[idx], self.zp[idx])]
+        self.Gvecs = [vec(*g) for g in self.calculate_Gvecs(
+            self.xp[idx], self.yp[idx], self.zp[idx])]
         return self.Gvecs
 
+    def calculate_Gvecs(self, x, y, z):
+        """Return the scattering vectors of a set of pixel coordinates.
+
+        The detector and goniometer transformations are applied to all the
+        peaks at once, using a stack of phi rotations for each frame.
+
+        Parameters
+        ----------
+        x, y, z : array_like
+            Pixel coordinates.
+
+        Returns
+        -------
+        np.ndarray
+            An (N, 3) array of scattering vectors in reciprocal Å.
+        """
+        x, y, z = [np.atleast_1d(np.asarray(v, dtype=float))
+                   for v in (x, y, z)]
+        phis = rotmats(3, self.phi + self.phi_step * z)
+        v1 = np.column_stack((x - self.xc, y - self.yc, np.zeros(x.size)))
+        v2 = self.pixel_size * v1 @ np.asarray(self.Oimat).T
+        svec = (np.einsum('nij,j->ni', phis, (self.xs, self.ys, self.zs))
+                @ np.asarray(self._Gmat_cache).T)
+        svec[:, 0] -= self.distance
+        v3 = v2 @ np.asarray(self.Dimat).T - svec
+        v4 = v3 / (norm(v3, axis=1)[:, np.newaxis] * self.wavelength)
+        v4[:, 0] -= 1.0 / self.wavelength
+        return np.einsum('nji,nj->ni', phis, v4 @ np.asarray(self.Gimat).T)
+
     def calculate_angles(self, x, y):
-        """Return the polar and azimuthal angles of the specified pixels."""
-        Oimat = inv(self.Omat)
-        Mat = self.pixel_size * inv(self.Dmat) * Oimat
-        polar_angles = []
-        azimuthal_angles = []
-        for i in range(len(x)):
-            peak = Oimat * (vec(x[i], y[i]) - self.Cvec)
-            v = norm(Mat * peak)
-            polar_angle = np.arctan(v / self.distance)
-            polar_angles.append(polar_angle)
-            azimuthal_angles.append(np.arctan2(-peak[1, 0], peak[2, 0]))
-        return (np.array(polar_angles) * degrees,
-                np.array(azimuthal_angles) * degrees)
+        """Return the polar and azimuthal angles of the specified pixels.
+
+        Parameters
+        ----------
+        x, y : array_like
+            Pixel coordinates.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Polar and azimuthal angles in degrees.
+        """
+        if x is None or y is None:
+            return np.array([]), np.array([])
+        x, y = [np.atleast_1d(np.asarray(v, dtype=float)).ravel()
+                for v in (x, y)]
+        Oimat = np.asarray(self.Oimat)
+        Mat = self.pixel_size * np.asarray(self.Dimat) @ Oimat
+        peaks = np.column_stack((x - self.xc, y - self.yc,
+                                 np.zeros(x.size))) @ Oimat.T
+        polar_angles = np.arctan(norm(peaks @ Mat.T, axis=1) / self.distance)
+        azimuthal_angles = np.arctan2(-peaks[:, 1], peaks[:, 2])
+        return polar_angles * degrees, azimuthal_angles * degrees
+
+    def detector_angles(self, block_size=256):
+        """Return the polar and azimuthal angles of every detector pixel.
+
+        The maps are cached for each detector geometry, so that they are
+        shared by all NXRefine instances with the same detector
+        parameters. They should not be modified.
+
+        Parameters
+        ----------
+        block_size : int, optional
+            Number of detector rows calculated at the same time, by
+            default 256.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Polar and azimuthal angles in degrees, with the shape of the
+            detector.
+        """
+        shape = tuple(int(i) for i in self.shape)
+        key = (shape, self.xc, self.yc, self.distance, self.pixel_size,
+               str(self.detector_orientation), self.tilts)
+        if key not in _detector_angles:
+            polar_angles = np.empty(shape, dtype=np.float32)
+            azimuthal_angles = np.empty(shape, dtype=np.float32)
+            x = np.arange(shape[1], dtype=float)
+            for start in range(0, shape[0], block_size):
+                rows = slice(start, min(start+block_size, shape[0]))
+                y = np.arange(rows.start, rows.stop, dtype=float)
+                xx, yy = np.meshgrid(x, y)
+                polar, azimuthal = self.calculate_angles(xx, yy)
+                polar_angles[rows] = polar.reshape(xx.shape)
+                azimuthal_angles[rows] = azimuthal.reshape(xx.shape)
+            polar_angles.setflags(write=False)
+            azimuthal_angles.setflags(write=False)
+            if len(_detector_angles) >= 4:
+                del _detector_angles[next(iter(_detector_angles))]
+            _detector_angles[key] = (polar_angles, azimuthal_angles)
+        return _detector_angles[key]
 
     def angle_peaks(self, i, j):
         """Return the angle between two peaks in degrees.
@@ -1467,6 +1765,134 @@ class NXRefine:
 
         return Tg * np.linalg.inv(Tc)
 
+    def get_UBmats(self, g1, g2, h1, h2):
+        """Return the orientation matrices for a set of HKL assignments.
+
+        This is a vectorized version of `get_UBmat`, which computes the
+        matrices for many possible HKL indices of the same two peaks.
+
+        Parameters
+        ----------
+        g1, g2 : array_like
+            Scattering vectors of the two Bragg peaks.
+        h1, h2 : array_like
+            (N, 3) arrays of the HKL indices assigned to each peak.
+
+        Returns
+        -------
+        np.ndarray
+            An (N, 3, 3) array of orientation matrices.
+        """
+        Bmat = np.asarray(self.Bmat)
+        Tc = orientation_triads(np.asarray(h1) @ Bmat.T,
+                                np.asarray(h2) @ Bmat.T)
+        Tg = orientation_triads(np.asarray(g1), np.asarray(g2))
+        return Tg @ np.swapaxes(Tc, -1, -2)
+
+    def auto_orient(self, max_peaks=10, peak_tolerance=None,
+                    hkl_tolerance=None, block_size=256):
+        """Determine the orientation matrix without choosing peaks.
+
+        Pairs of the strongest Bragg peaks are compared to a table of the
+        angles between the HKL vectors of the rings they are assigned
+        to. Each HKL pair whose angle agrees within the peak tolerance
+        defines a candidate orientation matrix. Every candidate is given
+        one vote for each peak it indexes within the HKL tolerance. The
+        candidate with the most votes is selected, using the weighted
+        HKL deviations to break ties. Only the first of each set of
+        symmetry-equivalent indices is used for the first peak of each
+        pair, since the others generate equivalent orientations.
+
+        Parameters
+        ----------
+        max_peaks : int, optional
+            Number of the strongest peaks used to generate candidate
+            orientation matrices, by default 10.
+        peak_tolerance : float, optional
+            Maximum difference in degrees between the observed and
+            calculated angles between two peaks, by default the value of
+            the `peak_tolerance` attribute.
+        hkl_tolerance : float, optional
+            Maximum deviation in reciprocal Å of an indexed peak from
+            its nearest HKL vector, by default the value of the
+            `hkl_tolerance` attribute.
+        block_size : int, optional
+            Number of candidates that are scored at the same time, by
+            default 256.
+
+        Returns
+        -------
+        int
+            Number of peaks indexed by the selected orientation matrix.
+        """
+        if peak_tolerance is None:
+            peak_tolerance = self.peak_tolerance
+        if hkl_tolerance is None:
+            hkl_tolerance = self.hkl_tolerance
+        peaks = np.flatnonzero(self.polar_angle < self.polar_max)
+        if peaks.size < 2:
+            raise NeXusError("At least two peaks are required to orient "
+                             "the lattice")
+        self.assign_rings()
+        rings = self.make_rings()
+        Bmat = np.asarray(self.Bmat)
+        first_hkls = {r: np.array([hkls[0] for hkls in rings[r][1]],
+                                  dtype=float) for r in rings}
+        all_hkls = {r: np.array([hkl for hkls in rings[r][1]
+                                 for hkl in hkls], dtype=float)
+                    for r in rings}
+        Gvecs = self.calculate_Gvecs(self.xp[peaks], self.yp[peaks],
+                                     self.zp[peaks])
+        strongest = np.argsort(self.intensity[peaks])[::-1][:max_peaks]
+        angle_table = {}
+        candidates = []
+        pairs = []
+        for a, b in combinations(strongest, 2):
+            i, j = peaks[a], peaks[b]
+            ri, rj = self.rp[i], self.rp[j]
+            if (ri, rj) not in angle_table:
+                cosines = (unit_vecs(first_hkls[ri] @ Bmat.T) @
+                           unit_vecs(all_hkls[rj] @ Bmat.T).T)
+                angle_table[(ri, rj)] = np.arccos(
+                    np.clip(cosines, -1.0, 1.0)) * degrees
+            g1, g2 = unit_vecs(Gvecs[a]), unit_vecs(Gvecs[b])
+            angle = np.arccos(np.clip(g1 @ g2, -1.0, 1.0)) * degrees
+            if angle < peak_tolerance or angle > 180.0 - peak_tolerance:
+                continue
+            hkl_angles = angle_table[(ri, rj)]
+            match = np.argwhere((np.abs(hkl_angles - angle) < peak_tolerance)
+                                & (hkl_angles > peak_tolerance)
+                                & (hkl_angles < 180.0 - peak_tolerance))
+            if match.size == 0:
+                continue
+            candidates.append(self.get_UBmats(
+                Gvecs[a], Gvecs[b], first_hkls[ri][match[:, 0]],
+                all_hkls[rj][match[:, 1]]))
+            pairs.extend([(i, j)] * len(match))
+        if not candidates:
+            raise NeXusError("No matching peaks found")
+        candidates = np.concatenate(candidates)
+        weights = np.asarray(self.intensity[peaks], dtype=float)
+        votes = np.zeros(len(candidates), dtype=int)
+        scores = np.zeros(len(candidates))
+        Bimat = np.asarray(self.Bimat)
+        for start in range(0, len(candidates), block_size):
+            Umats = candidates[start:start+block_size]
+            hkls = np.einsum('nj,kji->kni', Gvecs, Umats) @ Bimat.T
+            diffs = norm((hkls - np.rint(hkls)) @ Bmat.T, axis=-1)
+            indexed = diffs < hkl_tolerance
+            votes[start:start+block_size] = indexed.sum(axis=1)
+            w = weights * indexed
+            scores[start:start+block_size] = (
+                np.sum(w * diffs, axis=1) / np.maximum(np.sum(w, axis=1),
+                                                       np.finfo(float).tiny))
+        best = np.flatnonzero(votes == votes.max())
+        best = best[np.argmin(scores[best])]
+        self.Umat = np.matrix(candidates[best])
+        self.primary, self.secondary = (int(p) for p in pairs[best])
+        self.initialize_idx()
+        return int(votes[best])
+
     def get_hkl(self, x, y, z):
         """Return the HKL indices for the specified pixel coordinates.
 
@@ -1480,24 +1906,54 @@ class NXRefine:
         list
             HKL indices
         """
+        return list(self.calculate_hkls(x, y, z)[0])
+
+    def calculate_hkls(self, x, y, z):
+        """Return the HKL indices for a set of pixel coordinates.
+
+        Parameters
+        ----------
+        x, y, z : array_like
+            Pixel coordinates
+
+        Returns
+        -------
+        np.ndarray
+            An (N, 3) array of HKL indices
+        """
         if self.Umat is not None:
-            v5 = self.Gvec(x, y, z)
-#           v6 = inv(self.Umat) * v5
-#           v7 = inv(self.Bmat) * v6
-            v7 = inv(self.UBmat) * v5
-            return list(np.array(v7.T)[0])
+            return (self.calculate_Gvecs(x, y, z)
+                    @ np.asarray(self.UBimat).T)
         else:
-            return [0.0, 0.0, 0.0]
+            return np.zeros((np.size(x), 3))
+
+    def calculate_diffs(self, hkls):
+        """Return the deviations of a set of HKLs from the nearest integers.
+
+        Parameters
+        ----------
+        hkls : np.ndarray
+            An (N, 3) array of HKL indices
+
+        Returns
+        -------
+        np.ndarray
+            Deviations from the nearest HKL vectors in reciprocal Å.
+        """
+        return norm((hkls - np.rint(hkls)) @ np.asarray(self.Bmat).T, axis=1)
 
     def get_hkls(self):
         """Return the set of hkls for all the  Bragg peaks as three columns."""
-        return zip(*[self.hkl(i) for i in range(self.npks)])
+        if self.npks == 0:
+            return [], [], []
+        return tuple(self.calculate_hkls(self.xp, self.yp, self.zp).T)
 
     @property
     def hkls(self):
         """The set of HKLs for all the Bragg peaks."""
-        return [self.get_hkl(self.xp[i], self.yp[i], self.zp[i])
-                for i in range(self.npks)]
+        if self.npks == 0:
+            return []
+        return self.calculate_hkls(self.xp, self.yp, self.zp).tolist()
 
     def hkl(self, i):
         """Return the calculated HKL indices for the specified peak."""
@@ -1516,88 +1972,93 @@ class NXRefine:
         list of NXPeaks
             List of NXPeaks containing the pixel/frame coordinates.
         """
-        v7 = vec(H, K, L)
-        v6 = self.Bmat * v7
-        v5 = self.Umat * v6
+        x, y, z, _, _, _ = self.calculate_xyzs(H, K, L)
+        return [NXPeak(xp, yp, zp, H=H, K=K, L=L, parent=self)
+                for xp, yp, zp in zip(x, y, z)]
 
-        def ewald_condition(phi): return (
-            norm(self.Evec)**2 - norm(self.Gmat(phi)*v5 + self.Evec)**2)
+    def get_xyzs(self, Qh=None, Qk=None, Ql=None):
+        """Return the pixel/frame indices of all the allowed HKL indices.
 
-        phis = []
-        if H == 0 and K == 0 and L == 0:
-            pass
-        elif optimize.fsolve(ewald_condition, 45.0, full_output=1)[2] == 1:
-            phis = list(
-                np.unique(
-                    np.around(
-                        [optimize.fsolve(ewald_condition, phi) % 360
-                         for phi in np.arange(30, 390, 15)],
-                        decimals=4)))
-
-        def get_ij(phi):
-            v4 = self.Gmat(phi) * v5
-            p = norm_vec(v4 + self.Evec)
-            v3 = -(self.Dvec(phi)[0, 0] / p[0, 0]) * p
-            v2 = self.Dmat * (v3 + self.Dvec(phi))
-            v1 = (self.Omat * v2 / self.pixel_size) + self.Cvec
-            return v1[0, 0], v1[1, 0]
-
-        peaks = []
-        for phi in phis:
-            x, y = get_ij(phi)
-            z = ((phi - self.phi_start) / self.phi_step) % 3600
-            if z < 25:
-                z = z + 3600
-            elif z > 3625:
-                z = z - 3600
-            if x > 0 and x < self.shape[1] and y > 0 and y < self.shape[0]:
-                peaks.append(NXPeak(x, y, z, H=H, K=K, L=L, parent=self))
-
-        peaks = [peak for peak in peaks if peak.z > 0 and peak.z < 3648]
-
-        return peaks
+        Parameters
+        ----------
+        Qh, Qk, Ql : int, optional
+            Maximum absolute values of the HKL indices, by default the
+            limits of the transform grid.
 
-    def get_xyzs(self, Qh=None, Qk=None, Ql=None):
-        if self.julia is None:
-            try:
-                self.julia = init_julia()
-            except Exception as error:
-                raise NeXusError(str(error))
-        load_julia(['julia/get_xyzs.jl'])
-        from julia import Main, Pkg
-        Pkg.add("Roots")
-        Main.Gmat0 = np.array(self.Gmat(0.0))
-        Main.UBmat = np.array(self.UBmat)
-        Main.Dmat = np.array(self.Dmat)
-        Main.Omat = np.array(self.Omat) / self.pixel_size
-        Main.Cvec = list(np.array(self.Cvec.T).reshape((3)))
-        Main.Dvec = list(np.array(self.Dvec().T).reshape((3)))
-        Main.Evec = list(np.array(self.Evec.T).reshape((3)))
-        Main.shape = self.shape
+        Returns
+        -------
+        list of NXPeaks
+            List of NXPeaks containing the pixel/frame coordinates.
+        """
         if Qh is None:
             Qh = int(self.Qh[-1])
         if Qk is None:
             Qk = int(self.Qk[-1])
         if Ql is None:
             Ql = int(self.Ql[-1])
-        ps = self.julia.get_xyzs(Qh, Qk, Ql)
-        peaks = []
-        for p in ps:
-            try:
-                H, K, L = p[3], p[4], p[5]
-                if not self.absent(H, K, L):
-                    peaks.append(NXPeak(*p[0:3], H=H, K=K, L=L, parent=self))
-            except Exception:
-                pass
-        return peaks
+        H, K, L = [v.ravel() for v in np.mgrid[-Qh:Qh+1, -Qk:Qk+1, -Ql:Ql+1]]
+        allowed = np.invert(self.absent_mask(H, K, L))
+        x, y, z, H, K, L = self.calculate_xyzs(H[allowed], K[allowed],
+                                               L[allowed])
+        return [NXPeak(*p[0:3], H=int(p[3]), K=int(p[4]), L=int(p[5]),
+                       parent=self) for p in zip(x, y, z, H, K, L)]
+
+    def calculate_xyzs(self, H, K, L):
+        """Return the pixel/frame coordinates of a set of HKL indices.
+
+        The Ewald condition for each HKL vector is a sinusoidal function of
+        the phi angle, so the two angles at which the vector intersects the
+        Ewald sphere are calculated analytically for all the HKLs at once.
+
+        Parameters
+        ----------
+        H, K, L : array_like
+            HKL indices
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Pixel/frame coordinates, x, y, z, and HKL indices of the peaks
+            that lie within the detector.
+        """
+        H, K, L = [np.atleast_1d(np.asarray(v)).ravel() for v in (H, K, L)]
+        v5 = np.column_stack((H, K, L)) @ np.asarray(self.UBmat).T
+        G0mat = np.asarray(self._Gmat_cache)
+        e = G0mat[0] / self.wavelength
+        A = e[0] * v5[:, 0] + e[1] * v5[:, 1]
+        B = e[1] * v5[:, 0] - e[0] * v5[:, 1]
+        C = -0.5 * np.sum(v5**2, axis=1) - e[2] * v5[:, 2]
+        R = np.hypot(A, B)
+        valid = R > np.abs(C)
+        delta = np.arctan2(B[valid], A[valid])
+        alpha = np.arccos(C[valid] / R[valid])
+        peaks = np.concatenate((np.flatnonzero(valid), np.flatnonzero(valid)))
+        phi = (np.concatenate((delta + alpha, delta - alpha)) * degrees) % 360
+        order = np.argsort(peaks, kind='stable')
+        peaks, phi = peaks[order], phi[order]
+
+        phis = rotmats(3, phi)
+        v4 = np.einsum('nij,nj->ni', phis, v5[peaks]) @ G0mat.T
+        p = v4 + (1.0 / self.wavelength, 0.0, 0.0)
+        p /= norm(p, axis=1)[:, np.newaxis]
+        dvec = (np.einsum('nij,j->ni', phis, (self.xs, self.ys, self.zs))
+                @ G0mat.T)
+        dvec[:, 0] -= self.distance
+        v3 = -(dvec[:, 0] / p[:, 0])[:, np.newaxis] * p
+        v2 = (v3 + dvec) @ np.asarray(self.Dmat).T
+        v1 = v2 @ np.asarray(self.Omat).T / self.pixel_size
+        x, y = v1[:, 0] + self.xc, v1[:, 1] + self.yc
+        z = ((phi - self.phi_start) / self.phi_step) % 3600
+        z = np.where(z < 25, z + 3600, np.where(z > 3625, z - 3600, z))
+        on_detector = ((x > 0) & (x < self.shape[1]) &
+                       (y > 0) & (y < self.shape[0]) & (z > 0) & (z < 3648))
+        peaks = peaks[on_detector]
+        return (x[on_detector], y[on_detector], z[on_detector],
+                H[peaks], K[peaks], L[peaks])
 
     def polar(self, i):
-        """Return the polar angle in degrees for the specified Bragg peak."""
-        Oimat = inv(self.Omat)
-        Mat = self.pixel_size * inv(self.Dmat) * Oimat
-        peak = Oimat * (vec(self.xp[i], self.yp[i]) - self.Cvec)
-        v = norm(Mat * peak)
-        return np.arctan(v / self.distance)
+        """Return the polar angle in radians for the specified Bragg peak."""
+        return self.calculate_angles(self.xp[i], self.yp[i])[0][0] * radians
 
     def score(self):
         """Return the goodness of fit of the calculated peak positions."""
@@ -1611,6 +2072,11 @@ class NXRefine:
     @property
     def idx(self):
         """List of peaks whose polar angles are less than the maximum."""
+        if self._idx is None and self.xp is not None:
+            try:
+                self.initialize_idx()
+            except Exception:
+                self._idx = None
         if self._idx is not None:
             return self._idx.compressed()
         else:
@@ -1623,9 +2089,10 @@ class NXRefine:
             self._idx[self.polar_angle>self.polar_max] = ma.masked
             if hkl_tolerance is not None:
                 self._hkl_tolerance = hkl_tolerance
-            mask = [i for i in self._idx.compressed()
-                    if self.diff(i) > self.hkl_tolerance]
-            self._idx[mask] = ma.masked
+            idx = self._idx.compressed()
+            diffs = self.calculate_diffs(
+                self.calculate_hkls(self.xp[idx], self.yp[idx], self.zp[idx]))
+            self._idx[idx[diffs > self.hkl_tolerance]] = ma.masked
 
     @property
     def weights(self):
@@ -1634,7 +2101,9 @@ class NXRefine:
 
     def diffs(self):
         """Return all the deviations from the calculated peak positions."""
-        return np.array([self.diff(i) for i in self.idx])
+        idx = self.idx
+        return self.calculate_diffs(
+            self.calculate_hkls(self.xp[idx], self.yp[idx], self.zp[idx]))
 
     def diff(self, i):
         """Return the deviation from the calculated peak position.
@@ -1652,10 +2121,271 @@ class NXRefine:
         float
             [description]
         """
-        H, K, L = self.hkl(i)
-        Q = np.matrix((H, K, L)).T
-        Q0 = np.matrix((np.rint(H), np.rint(K), np.rint(L))).T
-        return norm(self.Bmat * (Q - Q0))
+        return self.calculate_diffs(np.array([self.hkl(i)]))[0]
+
+    def calculate_Gvec_derivatives(self, x, y, z, names):
+        """Return the derivatives of the scattering vectors.
+
+        The derivatives are calculated analytically by propagating changes
+        in the specified parameters through the detector and goniometer
+        transformations used by `calculate_Gvecs`.
+
+        Parameters
+        ----------
+        x, y, z : array_like
+            Pixel coordinates.
+        names : list of str
+            Names of the parameters. Parameters that do not affect the
+            scattering vectors are ignored.
+
+        Returns
+        -------
+        np.ndarray, dict
+            An (N, 3) array of scattering vectors and a dictionary of (N, 3)
+            arrays of their derivatives with respect to each parameter.
+        """
+        x, y, z = [np.atleast_1d(np.asarray(v, dtype=float))
+                   for v in (x, y, z)]
+        phis = rotmats(3, self.phi + self.phi_step * z)
+        Oimat = np.asarray(self.Oimat)
+        Dimat = np.asarray(self.Dimat)
+        G0mat = np.asarray(self._Gmat_cache)
+        Gimat = np.asarray(self.Gimat)
+        v1 = np.column_stack((x - self.xc, y - self.yc, np.zeros(x.size)))
+        v2 = self.pixel_size * v1 @ Oimat.T
+        sample = np.einsum('nij,j->ni', phis, (self.xs, self.ys, self.zs))
+        svec = sample @ G0mat.T
+        svec[:, 0] -= self.distance
+        v3 = v2 @ Dimat.T - svec
+        length = norm(v3, axis=1)[:, np.newaxis]
+        unit = v3 / length
+        v4 = (unit - (1.0, 0.0, 0.0)) / self.wavelength
+        q = v4 @ Gimat.T
+        Gvecs = np.einsum('nji,nj->ni', phis, q)
+
+        def rotate(dv3=None, dv4=None, dq=None):
+            if dq is None:
+                dq = np.zeros(q.shape)
+            if dv3 is not None:
+                dv3 = np.broadcast_to(dv3, v3.shape)
+                du = (dv3 - unit * np.sum(unit * dv3, axis=1)[:, np.newaxis])
+                dv4 = du / (length * self.wavelength)
+            if dv4 is not None:
+                dq = dq + dv4 @ Gimat.T
+            return np.einsum('nji,nj->ni', phis, dq)
+
+        Dmats = [rotmat(1, self.roll), rotmat(2, self.pitch),
+                 rotmat(3, self.yaw)]
+        Gmats = [rotmat(2, self.theta), rotmat(3, self.omega),
+                 rotmat(1, self.chi)]
+        derivatives = {}
+        for name in names:
+            if name in ('xc', 'yc'):
+                e = np.zeros(3)
+                e[('xc', 'yc').index(name)] = -self.pixel_size
+                derivatives[name] = rotate(dv3=Dimat @ Oimat @ e)
+            elif name == 'distance':
+                derivatives[name] = rotate(dv3=np.array((1.0, 0.0, 0.0)))
+            elif name in ('xs', 'ys', 'zs'):
+                k = ('xs', 'ys', 'zs').index(name)
+                derivatives[name] = rotate(dv3=-phis[:, :, k] @ G0mat.T)
+            elif name in ('roll', 'pitch', 'yaw'):
+                k = ('roll', 'pitch', 'yaw').index(name)
+                mats = [np.asarray(m) for m in Dmats]
+                mats[k] = drotmat(k+1, getattr(self, name))
+                derivatives[name] = rotate(dv3=v2 @ (mats[0] @ mats[1] @
+                                                     mats[2]).T)
+            elif name in ('theta', 'omega', 'chi'):
+                k = ('theta', 'omega', 'chi').index(name)
+                mats = [np.asarray(m) for m in Gmats]
+                mats[k] = drotmat((2, 3, 1)[k], getattr(self, name))
+                dG0mat = mats[0] @ mats[1] @ mats[2]
+                dGimat = -Gimat @ dG0mat @ Gimat
+                derivatives[name] = rotate(dv3=-sample @ dG0mat.T,
+                                           dq=v4 @ dGimat.T)
+            elif name in ('phi', 'phi_step'):
+                scale = 1.0 if name == 'phi' else z[:, np.newaxis]
+                dphis = np.einsum('ij,njk->nik', drotmat(3, 0.0), phis)
+                dsample = np.einsum('nij,j->ni', dphis,
+                                    (self.xs, self.ys, self.zs))
+                derivatives[name] = scale * (
+                    rotate(dv3=-dsample @ G0mat.T) +
+                    np.einsum('nji,nj->ni', dphis, q))
+            elif name == 'wavelength':
+                derivatives[name] = rotate(dv4=-v4 / self.wavelength)
+        return Gvecs, derivatives
+
+    def calculate_Bmat_derivatives(self, names, step=1e-6):
+        """Return the derivatives of the B matrix.
+
+        The derivatives are calculated by central differences of the 3x3
+        matrix, so that constraints applied by `set_symmetry` are included.
+
+        Parameters
+        ----------
+        names : list of str
+            Names of the parameters. Parameters that are not lattice
+            parameters are ignored.
+        step : float, optional
+            Relative step size, by default 1e-6.
+
+        Returns
+        -------
+        dict
+            A dictionary of 3x3 arrays of the derivatives with respect to
+            each lattice parameter.
+        """
+        lattice_names = ['a', 'b', 'c', 'alpha', 'beta', 'gamma']
+        lattice_parameters = self.lattice_parameters
+        derivatives = {}
+        for name in [n for n in names if n in lattice_names]:
+            value = getattr(self, name)
+            delta = step * max(abs(value), 1.0)
+            mats = []
+            for v in (value + delta, value - delta):
+                setattr(self, name, v)
+                self.set_symmetry()
+                mats.append(np.asarray(inv(self.Bimat)))
+                for n, p in zip(lattice_names, lattice_parameters):
+                    setattr(self, n, p)
+            derivatives[name] = (mats[0] - mats[1]) / (2 * delta)
+        return derivatives
+
+    def diff_jacobian(self, names):
+        """Return the derivatives of the peak deviations.
+
+        Parameters
+        ----------
+        names : list of str
+            Names of the varied parameters, which can include lattice
+            parameters, experimental parameters, and the orientation matrix
+            elements, 'U00' to 'U22'.
+
+        Returns
+        -------
+        np.ndarray
+            An array of derivatives with one row per peak in `self.idx` and
+            one column per parameter.
+        """
+        idx = self.idx
+        Gvecs, dGvecs = self.calculate_Gvec_derivatives(
+            self.xp[idx], self.yp[idx], self.zp[idx], names)
+        dBmats = self.calculate_Bmat_derivatives(names)
+        Bmat = np.asarray(self.Bmat)
+        Uimat = np.asarray(inv(self.Umat))
+        hkls = Gvecs @ np.asarray(self.UBimat).T
+        hkl0s = np.rint(hkls)
+        deviations = (hkls - hkl0s) @ Bmat.T
+        diffs = norm(deviations, axis=1)
+        jacobian = np.zeros((len(idx), len(names)))
+        for i, name in enumerate(names):
+            if name in dGvecs:
+                dv = dGvecs[name] @ Uimat.T
+            elif name in dBmats:
+                dv = -hkl0s @ dBmats[name].T
+            elif re.match(r'^U[0-2][0-2]$', name):
+                j, k = int(name[1]), int(name[2])
+                dv = -np.outer((Gvecs @ Uimat.T)[:, k], Uimat[:, j])
+            else:
+                jacobian[:, i] = self.numerical_derivative(name, self.diffs)
+                continue
+            jacobian[:, i] = np.divide(np.sum(deviations * dv, axis=1),
+                                       diffs, out=np.zeros(diffs.shape),
+                                       where=diffs > 0)
+        return jacobian
+
+    def angle_diff_jacobian(self, names):
+        """Return the derivatives of the polar angle deviations.
+
+        Parameters
+        ----------
+        names : list of str
+            Names of the varied parameters.
+
+        Returns
+        -------
+        np.ndarray
+            An array of derivatives with one row per peak in `self.idx` and
+            one column per parameter.
+        """
+        idx = self.idx
+        Oimat = np.asarray(self.Oimat)
+        Dimat = np.asarray(self.Dimat)
+        Pmat = self.pixel_size * Dimat @ Oimat @ Oimat
+        v1 = np.column_stack((self.xp[idx] - self.xc, self.yp[idx] - self.yc,
+                              np.zeros(len(idx))))
+        v = v1 @ Pmat.T
+        rho = norm(v, axis=1)
+        polars = np.arctan(rho / self.distance)
+        hkl0s = np.rint(self.calculate_hkls(self.xp[idx], self.yp[idx],
+                                            self.zp[idx]))
+        Bmat = np.asarray(self.Bmat)
+        dstars = hkl0s @ Bmat.T
+        dstar = norm(dstars, axis=1)
+        polar0s = 2 * np.arcsin(self.wavelength * dstar / 2)
+        dBmats = self.calculate_Bmat_derivatives(names)
+        Dmats = [rotmat(1, self.roll), rotmat(2, self.pitch),
+                 rotmat(3, self.yaw)]
+        jacobian = np.zeros((len(idx), len(names)))
+        for i, name in enumerate(names):
+            drho = ddistance = dpolar0 = 0.0
+            if name in ('xc', 'yc'):
+                dv = -Pmat[:, ('xc', 'yc').index(name)]
+                drho = np.sum(v * dv, axis=1) / rho
+            elif name in ('roll', 'pitch', 'yaw'):
+                k = ('roll', 'pitch', 'yaw').index(name)
+                mats = [np.asarray(m) for m in Dmats]
+                mats[k] = drotmat(k+1, getattr(self, name))
+                dv = v1 @ (self.pixel_size * mats[0] @ mats[1] @ mats[2] @
+                           Oimat @ Oimat).T
+                drho = np.sum(v * dv, axis=1) / rho
+            elif name == 'distance':
+                ddistance = 1.0
+            elif name == 'wavelength':
+                dpolar0 = dstar / np.cos(polar0s / 2)
+            elif name in dBmats:
+                ddstar = np.sum(dstars * (hkl0s @ dBmats[name].T), axis=1)
+                dpolar0 = np.divide(self.wavelength * ddstar,
+                                    dstar * np.cos(polar0s / 2),
+                                    out=np.zeros(dstar.shape),
+                                    where=dstar > 0)
+            elif name not in ('phi', 'phi_step', 'chi', 'omega', 'theta',
+                              'xs', 'ys', 'zs'):
+                jacobian[:, i] = self.numerical_derivative(
+                    name, self.angle_diffs)
+                continue
+            dpolar = ((self.distance * drho - rho * ddistance) /
+                      (self.distance**2 + rho**2))
+            jacobian[:, i] = dpolar - dpolar0
+        return np.sign(polars - polar0s)[:, np.newaxis] * jacobian
+
+    def numerical_derivative(self, name, residuals, step=1e-6):
+        """Return the derivatives of the residuals by central differences.
+
+        This is used for parameters without analytic derivatives.
+
+        Parameters
+        ----------
+        name : str
+            Name of the parameter.
+        residuals : callable
+            Function returning the array of residuals.
+        step : float, optional
+            Relative step size, by default 1e-6.
+
+        Returns
+        -------
+        np.ndarray
+            Derivatives of the residuals.
+        """
+        value = getattr(self, name)
+        delta = step * max(abs(value), 1.0)
+        setattr(self, name, value + delta)
+        upper = residuals()
+        setattr(self, name, value - delta)
+        lower = residuals()
+        setattr(self, name, value)
+        return (upper - lower) / (2 * delta)
 
     def angle_diffs(self):
         """Return the set of polar angle differences for all the peaks"""
@@ -1684,19 +2414,18 @@ class NXRefine:
 
     def get_peaks(self):
         """Return tuples containing the peaks and their parameters."""
-        peaks = np.array([i for i in range(self.npks)
-                          if self.polar_angle[i] < self.polar_max])
+        peaks = np.flatnonzero(
+            np.asarray(self.polar_angle)[:self.npks] < self.polar_max)
         x, y, z = (np.rint(self.xp[peaks]).astype(np.int16),
                    np.rint(self.yp[peaks]).astype(np.int16),
                    np.rint(self.zp[peaks]).astype(np.int16))
         polar, azi = self.polar_angle[peaks], self.azimuthal_angle[peaks]
         intensity = self.intensity[peaks]
         if self.Umat is not None:
-            H, K, L = self.get_hkls()
-            H = np.array(H)[peaks]
-            K = np.array(K)[peaks]
-            L = np.array(L)[peaks]
-            diffs = np.array([self.diff(i) for i in peaks])
+            hkls = self.calculate_hkls(self.xp[peaks], self.yp[peaks],
+                                       self.zp[peaks])
+            H, K, L = hkls.T
+            diffs = self.calculate_diffs(hkls)
         else:
             H = K = L = diffs = np.zeros(peaks.shape, dtype=float)
         return list(zip(peaks, x, y, z, polar, azi, intensity, H, K, L, diffs))
@@ -1785,7 +2514,9 @@ class NXRefine:
         p0 = self.define_parameters(**opts)
         if len(p0) == 0:
             raise NeXusError('No parameters selected for refinement')
-        self.result = minimize(self.hkl_residuals, p0, method=method)
+        self.result = minimize(self.hkl_residuals, p0, method=method,
+                               **self.jacobian_options(self.hkl_jacobian,
+                                                       method))
         self.fit_report = fit_report(self.result)
         if self.result.success:
             self.get_parameters(self.result.params)
@@ -1806,6 +2537,24 @@ class NXRefine:
         self.get_parameters(parameters)
         return self.diffs()
 
+    def hkl_jacobian(self, parameters):
+        """Return the derivatives of the HKL residuals.
+
+        Parameters
+        ----------
+        parameters : lmfit.Parameters
+            The set of parameters to be optimized by LMFIT.
+
+        Returns
+        -------
+        array_like
+            An array of derivatives of the HKL residuals with respect to
+            each varied parameter.
+        """
+        self.get_parameters(parameters)
+        return self.diff_jacobian(
+            [p for p in parameters if parameters[p].vary])
+
     def refine_angles(self, method='nelder', **opts):
         """Refine parameters based on the calculated polar angles.
 
@@ -1816,7 +2565,9 @@ class NXRefine:
         """
         from lmfit import fit_report, minimize
         p0 = self.define_parameters(**opts)
-        self.result = minimize(self.angle_residuals, p0, method=method)
+        self.result = minimize(self.angle_residuals, p0, method=method,
+                               **self.jacobian_options(self.angle_jacobian,
+                                                       method))
         self.fit_report = fit_report(self.result)
         if self.result.success:
             self.get_parameters(self.result.params)
@@ -1838,6 +2589,24 @@ class NXRefine:
         self.get_parameters(parameters)
         return self.angle_diffs()
 
+    def angle_jacobian(self, parameters):
+        """Return the derivatives of the polar angle residuals.
+
+        Parameters
+        ----------
+        parameters : lmfit.Parameters
+            The set of parameters to be optimized by LMFIT.
+
+        Returns
+        -------
+        array_like
+            An array of derivatives of the polar angle residuals with respect
+            to each varied parameter.
+        """
+        self.get_parameters(parameters)
+        return self.angle_diff_jacobian(
+            [p for p in parameters if parameters[p].vary])
+
     def define_orientation_matrix(self):
         """Return the elements of the orientation matrix as LMFIT parameters.
 
@@ -1883,7 +2652,9 @@ class NXRefine:
         """
         from lmfit import fit_report, minimize
         p0 = self.define_orientation_matrix()
-        self.result = minimize(self.orient_residuals, p0, method=method)
+        self.result = minimize(self.orient_residuals, p0, method=method,
+                               **self.jacobian_options(self.orient_jacobian,
+                                                       method))
         self.fit_report = fit_report(self.result)
         if self.result.success:
             self.get_orientation_matrix(self.result.params)
@@ -1908,6 +2679,45 @@ class NXRefine:
         self.get_orientation_matrix(p)
         return self.diffs()
 
+    def orient_jacobian(self, p):
+        """Return the derivatives of the HKL residuals.
+
+        Parameters
+        ----------
+        parameters : lmfit.Parameters
+            The set of parameters to be optimized by LMFIT.
+
+        Returns
+        -------
+        array_like
+            An array of derivatives of the HKL residuals with respect to
+            each orientation matrix element.
+        """
+        self.get_orientation_matrix(p)
+        return self.diff_jacobian([n for n in p if p[n].vary])
+
+    def jacobian_options(self, jacobian, method):
+        """Return the LMFIT keyword arguments used to supply a Jacobian.
+
+        Jacobians are only used by the least-squares minimizers.
+
+        Parameters
+        ----------
+        jacobian : callable
+            Function returning the derivatives of the residuals.
+        method : str
+            LMFIT minimizer method.
+
+        Returns
+        -------
+        dict
+            Keyword arguments to be passed to `lmfit.minimize`.
+        """
+        if method in ('leastsq', 'least_squares'):
+            return {'Dfun': jacobian}
+        else:
+            return {}
+
     def get_polarization(self, beam_polarization=0.99):
         """Return the synchrotron x-ray polarization across the detector.
 
@@ -2035,3 +2845,38 @@ class NXPeak:
     @property
     def HKL(self):
         return self.H, self.K, self.L
+
+
+class NXPeaks(Mapping):
+    """Map of peak indices to the Bragg peaks of an NXRefine instance.
+
+    Each NXPeak is created when it is requested, so that no objects are
+    created for peaks that are never used.
+
+    Parameters
+    ----------
+    parent : NXRefine
+        Parent NXRefine instance
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+
+    def __repr__(self):
+        return f"NXPeaks(npks={len(self)})"
+
+    def __len__(self):
+        return self.parent.npks
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __getitem__(self, i):
+        if not isinstance(i, (int, np.integer)) or not 0 <= i < len(self):
+            raise KeyError(i)
+        p = self.parent
+        if p.intensity is not None:
+            intensity = p.intensity[i]
+        else:
+            intensity = None
+        return NXPeak(p.xp[i], p.yp[i], p.zp[i], intensity, parent=p)
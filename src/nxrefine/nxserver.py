@@ -7,80 +7,209 @@
 # -----------------------------------------------------------------------------
 
 import os
+import socket
+import sqlite3
 import subprocess
 import tempfile
 import time
 from configparser import ConfigParser
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from queue import Queue
-from threading import Thread
+from queue import Empty, Queue
+from threading import Semaphore, Thread
 
 import psutil
 from nexusformat.nexus import NeXusError, NXLock
-from persistqueue import Queue as FileQueue
-from persistqueue.exceptions import Empty as FileEmpty
-from persistqueue.serializers import json
 
 from .nxdaemon import NXDaemon
 from .nxsettings import NXSettings
 
 
-class NXFileQueue(FileQueue):
-    """A file-based queue with locked access"""
+class NXTaskQueue:
+    """A persistent queue of unique tasks stored in an SQLite database.
 
-    def __init__(self, directory, autosave=False):
-        self.directory = Path(directory)
-        self.directory.mkdir(mode=0o777, exist_ok=True)
-        tempdir = self.directory / 'tempdir'
-        tempdir.mkdir(mode=0o777, exist_ok=True)
-        self.lock = NXLock(self.directory / 'filequeue')
+    Each command can only be queued once, so that duplicate tasks are
+    ignored. The commands are indexed, so that checking and removing tasks
+    does not require the whole queue to be read. Since tasks may be added
+    from other nodes, the database uses the default rollback journal,
+    rather than write-ahead logging, and all access is protected by a
+    file lock.
+    """
+
+    def __init__(self, queue_file, timeout=60):
+        self.queue_file = Path(queue_file)
+        self.timeout = timeout
+        self.lock = NXLock(self.queue_file)
         with self.lock:
-            super().__init__(directory, serializer=json, autosave=autosave,
-                             tempdir=tempdir)
+            with self.connect() as connection:
+                connection.execute('PRAGMA journal_mode=DELETE')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS tasks ('
+                    'id INTEGER PRIMARY KEY, command TEXT UNIQUE NOT NULL)')
             self.fix_access()
 
     def __repr__(self):
-        return f"NXFileQueue('{self.directory}')"
+        return f"NXTaskQueue('{self.queue_file}')"
 
-    def __enter__(self):
-        self.lock.acquire()
-        self.info = self._loadinfo()
+    def __len__(self):
+        return self.qsize()
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.fix_access()
-        self.lock.release()
+    def __contains__(self, item):
+        with self.lock:
+            with self.connect() as connection:
+                row = connection.execute(
+                    'SELECT 1 FROM tasks WHERE command=?',
+                    (str(item),)).fetchone()
+        return row is not None
+
+    @contextmanager
+    def connect(self):
+        """Yield a database connection, committing changes on exit."""
+        connection = sqlite3.connect(self.queue_file, timeout=self.timeout)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
 
-    def put(self, item, block=True, timeout=None):
-        """Add an item to the queue."""
-        with self:
-            super().put(str(item), block=block, timeout=timeout)
+    def put(self, item):
+        """Add an item to the end of the queue, unless already queued."""
+        self.put_items([item])
 
-    def get(self, block=True, timeout=None):
-        """Get the next item in the queue."""
-        with self:
-            item = str(super().get(block=block, timeout=timeout))
-        return item
+    def put_items(self, items):
+        """Add items to the end of the queue in a single transaction."""
+        with self.lock:
+            with self.connect() as connection:
+                connection.executemany(
+                    'INSERT OR IGNORE INTO tasks (command) VALUES (?)',
+                    [(str(item),) for item in items])
+
+    def get(self, block=False, timeout=None):
+        """Remove and return the next item in the queue.
+
+        Parameters
+        ----------
+        block : bool, optional
+            True if the call waits for an item to be queued, by default
+            False.
+        timeout : float, optional
+            Maximum time in seconds to wait if `block` is True, by
+            default None, i.e., wait indefinitely.
+
+        Raises
+        ------
+        Empty
+            If there are no items in the queue.
+        """
+        start = time.monotonic()
+        while True:
+            with self.lock:
+                with self.connect() as connection:
+                    row = connection.execute(
+                        'SELECT id, command FROM tasks '
+                        'ORDER BY id LIMIT 1').fetchone()
+                    if row is not None:
+                        connection.execute('DELETE FROM tasks WHERE id=?',
+                                           (row[0],))
+                        return row[1]
+            if not block or (timeout is not None and
+                             time.monotonic() - start >= timeout):
+                raise Empty
+            time.sleep(1)
+
+    def remove(self, item):
+        """Remove an item from the queue if it is present."""
+        with self.lock:
+            with self.connect() as connection:
+                connection.execute('DELETE FROM tasks WHERE command=?',
+                                   (str(item),))
 
     def queued_items(self):
         """Return a list of items still remaining in the queue."""
-        with self:
-            items = []
-            while self.qsize() > 0:
-                items.append(super().get(timeout=0))
-        return items
+        with self.lock:
+            with self.connect() as connection:
+                return [row[0] for row in connection.execute(
+                    'SELECT command FROM tasks ORDER BY id')]
+
+    def qsize(self):
+        """Return the number of items in the queue."""
+        with self.lock:
+            with self.connect() as connection:
+                return connection.execute(
+                    'SELECT COUNT(*) FROM tasks').fetchone()[0]
+
+    def clear(self):
+        """Remove all items from the queue."""
+        with self.lock:
+            with self.connect() as connection:
+                connection.execute('DELETE FROM tasks')
 
     def fix_access(self):
-        """Ensure that the file queue pointer is readable."""
-        for f in [f for f in self.directory.iterdir() if f.is_file()]:
+        """Ensure that the queue files are writable by all users."""
+        for f in self.queue_file.parent.glob(self.queue_file.name+'*'):
             try:
-                self.directory.joinpath(f).chmod(0o666)
+                f.chmod(0o666)
             except Exception:
                 pass
-        for f in [f for f in self.directory.iterdir() if f.is_dir()]:
+
+
+class NXWakeup:
+    """A local datagram socket used to signal that a task has been queued.
+
+    The server listens on the socket while waiting for new tasks, and
+    processes that add tasks to the queue send a message to wake it.
+    If the socket is not available, e.g., because tasks are being added
+    from a different node, the server falls back to polling the queue.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.socket = None
+
+    def __repr__(self):
+        return f"NXWakeup('{self.path}')"
+
+    def listen(self):
+        """Bind the socket so that wakeup messages can be received."""
+        try:
+            if self.path.is_socket():
+                self.path.unlink()
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.socket.bind(str(self.path))
+        except OSError:
+            self.socket = None
+
+    def wait(self, timeout):
+        """Wait for a wakeup message, or until the timeout has elapsed."""
+        if self.socket is None:
+            time.sleep(timeout)
+            return
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.recv(64)
+            # Discard messages from tasks added at the same time
+            self.socket.setblocking(False)
+            while True:
+                self.socket.recv(64)
+        except OSError:
+            pass
+
+    def notify(self):
+        """Send a wakeup message to a listening server."""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+                s.sendto(b'task', str(self.path))
+        except OSError:
+            pass
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
             try:
-                self.directory.joinpath(f).chmod(0o777)
-            except Exception:
+                self.path.unlink()
+            except OSError:
                 pass
 
 
@@ -100,7 +229,6 @@ class NXController(Thread):
     def run(self):
         self.log(f"Starting controller on pid={os.getpid()}")
         while True:
-            time.sleep(10)
             next_task = self.controller_queue.get()
             if next_task is None or next_task == 'stop':
                 self.log(f"Stopping controller on pid={os.getpid()}")
@@ -149,11 +277,12 @@ class NXController(Thread):
 class NXWorker(Thread):
     """Class for processing tasks on a specific cpu."""
 
-    def __init__(self, cpu, worker_queue, server_log):
+    def __init__(self, cpu, worker_queue, server_log, idle=None):
         super().__init__()
         self.cpu = cpu
         self.worker_queue = worker_queue
         self.server_log = server_log
+        self.idle = idle
         cpu_log = self.cpu + '.log'
         self.cpu_log = Path(self.server_log).parent / cpu_log
 
@@ -163,7 +292,6 @@ class NXWorker(Thread):
     def run(self):
         self.log(f"Starting worker on {self.cpu}")
         while True:
-            time.sleep(5)
             next_task = self.worker_queue.get()
             if next_task is None:
                 self.log(f"Stopping worker on {self.cpu}")
@@ -175,6 +303,8 @@ class NXWorker(Thread):
                     next_task.execute(self.cpu, self.cpu_log)
             self.worker_queue.task_done()
             self.log(f"{self.cpu}: Finished '{next_task.command}'")
+            if self.idle is not None:
+                self.idle.release()
         return
 
     def log(self, message):
@@ -235,6 +365,9 @@ class NXTask:
 
 class NXServer(NXDaemon):
 
+    # Time in seconds between checks of the queue if no wakeup is received
+    poll_interval = 10
+
     def __init__(self, directory=None, server_type=None):
         self.pid_name = 'nxserver'
         self.initialize(directory, server_type)
@@ -307,9 +440,10 @@ class NXServer(NXDaemon):
         self.template = self.settings.get('server', 'template')
         self.server_log = self.directory / 'nxserver.log'
         self.pid_file = self.directory / 'nxserver.pid'
-        self.queue_directory = self.directory / 'task_list'
+        self.queue_file = self.directory / 'task_queue.db'
+        self.wakeup = NXWakeup(self.directory / 'nxserver.sock')
         if self.server_type:
-            self.task_queue = NXFileQueue(self.queue_directory)
+            self.task_queue = NXTaskQueue(self.queue_file)
             self.controller = None
         else:
             self.task_queue = Queue()
@@ -361,21 +495,32 @@ class NXServer(NXDaemon):
 
         Create a worker for each cpu, read commands from the server
         queue, and add an NXTask for each command to a Queue.
+
+        A command is only read when a worker is idle, so that queued
+        tasks can still be listed and removed. The server sleeps until
+        it is woken by a process adding a task, with periodic checks of
+        the queue in case the wakeup message is not received.
         """
         self.log(f'Starting server (pid={os.getpid()})')
-        self.task_queue = NXFileQueue(self.queue_directory, autosave=True)
+        self.task_queue = NXTaskQueue(self.queue_file)
+        self.wakeup.listen()
         self.worker_queue = Queue()
-        self.workers = [NXWorker(cpu, self.worker_queue, self.server_log)
+        idle = Semaphore(len(self.cpus))
+        self.workers = [NXWorker(cpu, self.worker_queue, self.server_log,
+                                 idle=idle)
                         for cpu in self.cpus]
         for worker in self.workers:
             worker.start()
         while True:
-            time.sleep(10)
+            idle.acquire()
             command = self.read_task()
+            while command is None:
+                self.wakeup.wait(self.poll_interval)
+                command = self.read_task()
             if command == 'stop':
                 break
-            elif command:
-                self.worker_queue.put(NXTask(command, self))
+            self.worker_queue.put(NXTask(command, self))
+        self.wakeup.close()
         for worker in self.workers:
             self.worker_queue.put(None)
         self.worker_queue.join()
@@ -385,20 +530,24 @@ class NXServer(NXDaemon):
         super(NXServer, self).stop()
 
     def add_task(self, tasks):
-        """Add a task to the server queue."""
+        """Add tasks to the server queue.
+
+        On a server, tasks that are already queued are ignored.
+        """
         if isinstance(tasks, str):
             tasks = tasks.split('\n')
-        for task in tasks:
-            if task == 'stop':
-                self.task_queue.put(task)
-            elif self.server_type is None or task not in self.queued_tasks():
+        if self.server_type:
+            self.task_queue.put_items(tasks)
+            self.wakeup.notify()
+        else:
+            for task in tasks:
                 self.task_queue.put(task)
 
     def read_task(self):
         """Read the next task from the server queue"""
         try:
             task = self.task_queue.get(block=False)
-        except FileEmpty:
+        except Empty:
             return None
         except Exception as error:
             self.log(str(error))
@@ -407,17 +556,20 @@ class NXServer(NXDaemon):
 
     def remove_task(self, task):
         """Remove task from the server queue."""
-        tasks = self.queued_tasks()
-        if task in tasks:
-            tasks.remove(task)
-        self.clear()
-        for task in tasks:
-            self.add_task(task)
+        if self.server_type:
+            self.task_queue.remove(task)
+        else:
+            with self.task_queue.mutex:
+                if task in self.task_queue.queue:
+                    self.task_queue.queue.remove(task)
 
     def queued_tasks(self):
         """List tasks remaining on the server queue."""
-        queue = NXFileQueue(self.queue_directory, autosave=False)
-        return queue.queued_items()
+        if self.server_type:
+            return self.task_queue.queued_items()
+        else:
+            with self.task_queue.mutex:
+                return list(self.task_queue.queue)
 
     def stop(self):
         """Stop the server when active tasks are completed."""
@@ -426,11 +578,11 @@ class NXServer(NXDaemon):
 
     def clear(self):
         """Clear the server queue."""
-        with self.task_queue.lock:
-            if self.queue_directory.exists():
-                import shutil
-                shutil.rmtree(self.queue_directory, ignore_errors=True)
-        self.task_queue = NXFileQueue(self.queue_directory)
+        if self.server_type:
+            self.task_queue.clear()
+        else:
+            with self.task_queue.mutex:
+                self.task_queue.queue.clear()
 
     def kill(self):
         """Kill the server process.
@@ -20,7 +20,9 @@ class NXSettings(ConfigParser):
         super().__init__(allow_no_value=True)
         self.defaults = {
             'server': {'type': 'multicore', 'cores': 4, 'concurrent': True,
-                       'run_command': None, 'template': None, 'cctw': 'cctw'},
+                       'run_command': None, 'template': None, 'cctw': 'cctw',
+                       'chunks': '1,128,128', 'compression': 4,
+                       'precision': 'float32'},
             'instrument': {'source': None, 'instrument': None,
                            'raw_home': None, 'raw_path': None,
                            'analysis_home': None, 'analysis_path': None,
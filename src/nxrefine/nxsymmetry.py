@@ -7,63 +7,41 @@
 # -----------------------------------------------------------------------------
 
 import os
-import tempfile
+from collections import Counter
+from contextlib import nullcontext
 
 import numpy as np
-from nexusformat.nexus import nxopen, nxsetconfig
-
-from .nxutils import NXExecutor, as_completed
+from nexusformat.nexus import nxgetconfig, nxopen
 
 
 def triclinic(data):
     """Laue group: -1"""
-    outarr = np.nan_to_num(data)
-    outarr += np.flip(outarr)
-    return outarr
+    return apply_generators(np.nan_to_num(data), laue_generators['-1'])
 
 
 def monoclinic(data):
     """Laue group: 2/m"""
-    outarr = np.nan_to_num(data)
-    outarr += np.rot90(outarr, 2, (0, 2))
-    outarr += np.flip(outarr, 1)
-    return outarr
+    return apply_generators(np.nan_to_num(data), laue_generators['2/m'])
 
 
 def orthorhombic(data):
     """Laue group: mmm"""
-    outarr = np.nan_to_num(data)
-    outarr += np.flip(outarr, 0)
-    outarr += np.flip(outarr, 1)
-    outarr += np.flip(outarr, 2)
-    return outarr
+    return apply_generators(np.nan_to_num(data), laue_generators['mmm'])
 
 
 def tetragonal1(data):
     """Laue group: 4/m"""
-    outarr = np.nan_to_num(data)
-    outarr += np.rot90(outarr, 1, (1, 2))
-    outarr += np.rot90(outarr, 2, (1, 2))
-    outarr += np.flip(outarr, 0)
-    return outarr
+    return apply_generators(np.nan_to_num(data), laue_generators['4/m'])
 
 
 def tetragonal2(data):
     """Laue group: 4/mmm"""
-    outarr = np.nan_to_num(data)
-    outarr += np.rot90(outarr, 1, (1, 2))
-    outarr += np.rot90(outarr, 2, (1, 2))
-    outarr += np.rot90(outarr, 2, (0, 1))
-    outarr += np.flip(outarr, 0)
-    return outarr
+    return apply_generators(np.nan_to_num(data), laue_generators['4/mmm'])
 
 
 def hexagonal(data):
     """Laue group: 6/m, 6/mmm (modeled as 2/m along the c-axis)"""
-    outarr = np.nan_to_num(data)
-    outarr += np.rot90(outarr, 2, (1, 2))
-    outarr += np.flip(outarr, 0)
-    return outarr
+    return apply_generators(np.nan_to_num(data), laue_generators['6/m'])
 
 
 def cubic(data):
@@ -75,57 +53,56 @@ def cubic(data):
         pad_width = [(amount // 2, amount - amount // 2)
                      for _, amount in padding]
         outarr = np.pad(outarr, pad_width, mode='constant')
-    outarr += np.transpose(outarr, axes=(1, 2, 0))
-    outarr += np.transpose(outarr, axes=(2, 0, 1))
-    outarr += np.transpose(outarr, axes=(0, 2, 1))
-    outarr += np.flip(outarr, 0)
-    outarr += np.flip(outarr, 1)
-    outarr += np.flip(outarr, 2)
-    return outarr
-
-def symmetrize_entries(symm_function, data_type, data_file, data_path):
-    nxsetconfig(lock=3600, lockexpiry=28800)
-    with nxopen(data_file, 'r') as data_root:
-        data_path = os.path.basename(data_path)
-        for i, entry in enumerate([e for e in data_root if e[-1].isdigit()]):
-            data_size = int(
-                data_root[entry][data_path].nxsignal.nbytes / 1e6) + 1000
-            nxsetconfig(memory=data_size)
-            if i == 0:
-                if data_type == 'signal':
-                    data = data_root[entry][data_path].nxsignal.nxvalue
-                elif data_root[entry][data_path].nxweights:
-                    data = data_root[entry][data_path].nxweights.nxvalue
-                else:
-                    signal = data_root[entry][data_path].nxsignal.nxvalue
-                    data = np.zeros(signal.shape, dtype=signal.dtype)
-                    data[np.where(signal > 0)] = 1
-            else:
-                if data_type == 'signal':
-                    data += data_root[entry][data_path].nxsignal.nxvalue
-                elif data_root[entry][data_path].nxweights:
-                    data += data_root[entry][data_path].nxweights.nxvalue
-    result = symm_function(data)
-    with nxopen(tempfile.mkstemp(suffix='.nxs')[1], mode='w') as root:
-        root['data'] = result
-    return data_type, root.nxfilename
-
-
-def symmetrize_data(symm_function, data_type, data_file, data_path):
-    nxsetconfig(lock=3600, lockexpiry=28800)
-    with nxopen(data_file, 'r') as data_root:
-        data_size = int(data_root[data_path].nbytes / 1e6) + 1000
-        nxsetconfig(memory=data_size)
-        if data_type == 'signal':
-            data = data_root[data_path].nxvalue
-        else:
-            signal = data_root[data_path].nxvalue
-            data = np.zeros(signal.shape, signal.dtype)
-            data[np.where(signal > 0)] = 1
-    result = symm_function(data)
-    with nxopen(tempfile.mkstemp(suffix='.nxs')[1], mode='w') as root:
-        root['data'] = result
-    return data_type, root.nxfilename
+    return apply_generators(outarr, laue_generators['m-3'])
+
+
+def apply_generators(data, generators):
+    """Symmetrize an array in place by adding each generator in turn.
+
+    Parameters
+    ----------
+    data : array-like
+        Array to be symmetrized.
+    generators : list of tuple
+        Operations, ``(axes, flips)``, representing the array returned by
+        ``np.flip(np.transpose(data, axes), flips)``.
+
+    Returns
+    -------
+    array-like
+        Symmetrized array.
+    """
+    for axes, flips in generators:
+        data += np.flip(np.transpose(data, axes), flips)
+    return data
+
+
+def symmetry_operations(generators):
+    """Return the operations summed by a Laue group symmetrization.
+
+    Each operation is a tuple, ``(axes, flips)``, representing the array
+    returned by ``np.flip(np.transpose(data, axes), flips)``. The Laue
+    functions above add each generator to the sum of all the previous
+    operations, so the number of times each distinct operation appears
+    in that sum is also returned.
+
+    Parameters
+    ----------
+    generators : list of tuple
+        Operations applied in turn by the Laue group function.
+
+    Returns
+    -------
+    Counter
+        Multiplicity of each distinct operation.
+    """
+    operations = [((0, 1, 2), ())]
+    for axes, flips in generators:
+        operations += [(tuple(a[i] for i in axes),
+                        tuple(sorted(set(flips) ^
+                                     {i for i in range(3) if axes[i] in f})))
+                       for a, f in operations]
+    return Counter(operations)
 
 
 laue_functions = {'-1': triclinic,
@@ -140,36 +117,267 @@ laue_functions = {'-1': triclinic,
                   'm-3': cubic,
                   'm-3m': cubic}
 
+laue_generators = {'-1': [((0, 1, 2), (0, 1, 2))],
+                   '2/m': [((0, 1, 2), (0, 2)), ((0, 1, 2), (1,))],
+                   'mmm': [((0, 1, 2), (0,)), ((0, 1, 2), (1,)),
+                           ((0, 1, 2), (2,))],
+                   '4/m': [((0, 2, 1), (1,)), ((0, 1, 2), (1, 2)),
+                           ((0, 1, 2), (0,))],
+                   '4/mmm': [((0, 2, 1), (1,)), ((0, 1, 2), (1, 2)),
+                             ((0, 1, 2), (0, 1)), ((0, 1, 2), (0,))],
+                   '-3': [((0, 1, 2), (0, 1, 2))],
+                   '-3m': [((0, 1, 2), (0, 1, 2))],
+                   '6/m': [((0, 1, 2), (1, 2)), ((0, 1, 2), (0,))],
+                   '6/mmm': [((0, 1, 2), (1, 2)), ((0, 1, 2), (0,))],
+                   'm-3': [((1, 2, 0), ()), ((2, 0, 1), ()), ((0, 2, 1), ()),
+                           ((0, 1, 2), (0,)), ((0, 1, 2), (1,)),
+                           ((0, 1, 2), (2,))],
+                   'm-3m': [((1, 2, 0), ()), ((2, 0, 1), ()),
+                            ((0, 2, 1), ()), ((0, 1, 2), (0,)),
+                            ((0, 1, 2), (1,)), ((0, 1, 2), (2,))]}
+
 
 class NXSymmetry:
+    """Symmetrize 3D data according to the Laue group.
+
+    Parameters
+    ----------
+    data : NXdata or NXfield
+        Data to be symmetrized. If the data are to be summed over the
+        entries of the file, this is the group within one of the entries.
+        The field does not need to be saved to a file.
+    laue_group : str, optional
+        Laue group used to symmetrize the data, by default '-1'.
+    memory : float, optional
+        Approximate memory budget in MB of the blocked symmetrization, by
+        default the current nexusformat memory limit.
+    """
 
-    def __init__(self, data, laue_group=None):
+    def __init__(self, data, laue_group=None, memory=None):
         if laue_group and laue_group in laue_functions:
             self.symm_function = laue_functions[laue_group]
+            self.generators = laue_generators[laue_group]
         else:
             self.symm_function = triclinic
+            self.generators = laue_generators['-1']
+        self.operations = symmetry_operations(self.generators)
+        self.data = data
         self.data_file = data.nxfilename
         self.data_path = data.nxpath
+        if memory is None:
+            memory = nxgetconfig('memory')
+        self.memory = memory
+        if data.nxclass == 'NXfield':
+            signal = data
+        else:
+            signal = data.nxsignal
+        self.data_shape = tuple(signal.shape)
+        self.dtype = signal.dtype
+        if self.symm_function is cubic and len(set(self.data_shape)) > 1:
+            max_dim = max(self.data_shape)
+            self.padding = [(max_dim - dim) // 2 for dim in self.data_shape]
+            self.shape = (max_dim,) * 3
+        else:
+            self.padding = [0, 0, 0]
+            self.shape = self.data_shape
 
-    def symmetrize(self, entries=False):
-        if entries:
-            symmetrize = symmetrize_entries
+    def symmetrize(self, entries=False, output=None):
+        """Return the symmetrized data.
+
+        Parameters
+        ----------
+        entries : bool, optional
+            True if the data are summed over all the entries, by default
+            False
+        output : NXfield, optional
+            Field in which to store the symmetrized data, by default None.
+            If this is specified, the data are symmetrized in blocks, so
+            that the memory usage is limited by the memory budget, and the
+            field is returned. It must have the shape given by
+            `NXSymmetry.shape`.
+
+        Returns
+        -------
+        array-like or NXfield
+            Symmetrized data.
+        """
+        if output is not None:
+            return self.symmetrize_blocks(output, entries=entries)
+        with self.open_data() as root:
+            signal, weights = self.read_slab(root, 0, 0, self.shape[0],
+                                             entries=entries)
+        apply_generators(signal, self.generators)
+        apply_generators(weights, self.generators)
+        return self.normalize(signal, weights)
+
+    def open_data(self):
+        """Return a context manager for reading the data.
+
+        The data file is opened read-only, so that it is not locked while
+        the data are symmetrized. If the data are not saved to a file, the
+        context manager returns None.
+        """
+        if self.data_file is None:
+            return nullcontext()
         else:
-            symmetrize = symmetrize_data
-        with NXExecutor(max_workers=2) as executor:
-            futures = []
-            for data_type in ['signal', 'weights']:
-                futures.append(executor.submit(
-                    symmetrize, self.symm_function, data_type,
-                    self.data_file, self.data_path))
-        for future in as_completed(futures):
-            data_type, result_file = future.result()
-            with nxopen(result_file, 'r') as result_root:
-                if data_type == 'signal':
-                    signal = result_root['data'].nxvalue
+            return nxopen(self.data_file, 'r')
+
+    def normalize(self, signal, weights):
+        """Divide the symmetrized signal by the weights in place.
+
+        Parameters
+        ----------
+        signal : array-like
+            Symmetrized signal, which is overwritten.
+        weights : array-like
+            Symmetrized weights.
+
+        Returns
+        -------
+        array-like
+            Normalized signal, with zeros wherever the weights are zero.
+        """
+        np.divide(signal, weights, out=signal, where=weights > 0)
+        signal[weights <= 0] = 0.0
+        return signal
+
+    @property
+    def block_size(self):
+        """Number of frames in each symmetrized block."""
+        frame_size = np.prod(self.shape[1:]) * np.dtype(self.dtype).itemsize
+        return max(1, int(self.memory * 1e6 / (8 * frame_size)))
+
+    def symmetrize_blocks(self, output, entries=False):
+        """Symmetrize the data in blocks of frames, storing them in a field.
+
+        Each block of the output is the sum of the symmetry-related blocks
+        of the input, which are slabs along one of the three axes. Each
+        slab is read once, and all the operations that use it are added
+        to the accumulated signal and weights before they are divided.
+
+        Parameters
+        ----------
+        output : NXfield
+            Field in which to store the symmetrized data.
+        entries : bool, optional
+            True if the data are summed over all the entries, by default
+            False
+
+        Returns
+        -------
+        NXfield
+            Field containing the symmetrized data.
+        """
+        with self.open_data() as data_root:
+            with output.nxfile:
+                for start in range(0, self.shape[0], self.block_size):
+                    stop = min(start + self.block_size, self.shape[0])
+                    output[start:stop] = self.symmetrize_block(
+                        data_root, start, stop, entries=entries)
+        return output
+
+    def symmetrize_block(self, root, start, stop, entries=False):
+        """Return a block of frames of the symmetrized data.
+
+        Parameters
+        ----------
+        root : NXroot
+            Root of the file containing the data.
+        start : int
+            Index of the first frame of the block.
+        stop : int
+            Index of the frame after the last frame of the block.
+        entries : bool, optional
+            True if the data are summed over all the entries, by default
+            False
+
+        Returns
+        -------
+        array-like
+            Symmetrized block.
+        """
+        slabs = {}
+        for (axes, flips), count in self.operations.items():
+            size = self.shape[axes[0]]
+            if 0 in flips:
+                slab = (axes[0], size - stop, size - start)
+            else:
+                slab = (axes[0], start, stop)
+            slabs.setdefault(slab, []).append((axes, flips, count))
+        shape = (stop - start,) + tuple(self.shape[1:])
+        signal = np.zeros(shape, dtype=self.dtype)
+        weights = np.zeros(shape, dtype=self.dtype)
+        for slab in slabs:
+            slab_signal, slab_weights = self.read_slab(root, *slab,
+                                                       entries=entries)
+            for axes, flips, count in slabs[slab]:
+                for _ in range(count):
+                    signal += np.flip(np.transpose(slab_signal, axes), flips)
+                    weights += np.flip(np.transpose(slab_weights, axes),
+                                       flips)
+        return self.normalize(signal, weights)
+
+    def read_slab(self, root, axis, start, stop, entries=False):
+        """Return a slab of the signal and weights, padded if necessary.
+
+        Parameters
+        ----------
+        root : NXroot
+            Root of the file containing the data, or None if the data are
+            not saved to a file.
+        axis : int
+            Axis along which the slab is taken.
+        start : int
+            Index of the first slice of the slab.
+        stop : int
+            Index of the slice after the last slice of the slab.
+        entries : bool, optional
+            True if the data are summed over all the entries, by default
+            False
+
+        Returns
+        -------
+        tuple of array-like
+            Signal and weights of the slab.
+        """
+        shape = list(self.shape)
+        shape[axis] = stop - start
+        signal = np.zeros(shape, dtype=self.dtype)
+        weights = np.zeros(shape, dtype=self.dtype)
+        source, target = [], []
+        for i, (pad, size) in enumerate(zip(self.padding, self.data_shape)):
+            if i == axis:
+                lo, hi = max(start - pad, 0), min(stop - pad, size)
+                if lo >= hi:
+                    return signal, weights
+                source.append(slice(lo, hi))
+                target.append(slice(lo + pad - start, hi + pad - start))
+            else:
+                source.append(slice(0, size))
+                target.append(slice(pad, pad + size))
+        source, target = tuple(source), tuple(target)
+        if entries:
+            data_path = os.path.basename(self.data_path)
+            for i, entry in enumerate([e for e in root if e[-1].isdigit()]):
+                data = root[entry][data_path]
+                values = data.nxsignal[source].nxvalue
+                if i == 0:
+                    signal[target] = values
+                    if data.nxweights:
+                        weights[target] = data.nxweights[source].nxvalue
+                    else:
+                        weights[target] = values > 0
                 else:
-                    weights = result_root['data'].nxvalue
-            os.remove(result_file)
-        with np.errstate(divide='ignore', invalid='ignore'):
-            result = np.where(weights > 0, signal / weights, 0.0)
-        return result
+                    signal[target] += values
+                    if data.nxweights:
+                        weights[target] += data.nxweights[source].nxvalue
+        else:
+            if root is None:
+                data = self.data
+            else:
+                data = root[self.data_path]
+            signal[target] = data[source].nxvalue
+            weights[target] = signal[target] > 0
+        np.nan_to_num(signal, copy=False)
+        np.nan_to_num(weights, copy=False)
+        return signal, weights
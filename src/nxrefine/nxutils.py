@@ -6,25 +6,38 @@
 # The full license is in the file LICENSE.pdf, distributed with this software.
 # -----------------------------------------------------------------------------
 
-import sys
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from multiprocessing import get_context, resource_tracker
-
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import (get_context, parent_process, resource_tracker,
+                             shared_memory)
+
+import h5py as h5
 import numpy as np
-
-if sys.version_info < (3, 10):
-    from importlib_resources import files as package_files
-else:
-    from importlib.resources import files as package_files
+import scipy.fft
 
 from nexusformat.nexus import (NeXusError, NXdata, NXentry, NXfield, NXlog,
                                NXroot, nxopen, nxsetconfig)
+from scipy.spatial import cKDTree
 from skimage.feature import peak_local_max
 
 
-def peak_search(data_file, data_path, i, j, k, threshold, mask=None,
-                min_pixels=10):
-    """Identify peaks in the slab of raw data
+blob_dtype = np.dtype([('x', float), ('y', float), ('z', float),
+                       ('max_value', float), ('intensity', float),
+                       ('sigx', float), ('sigy', float), ('sigz', float)])
+
+
+_open_files = {}
+
+
+def read_frames(data_file, data_path, j, k):
+    """Read a slab of frames, keeping the file open for subsequent reads.
+
+    Each worker process keeps its own handle to the file, which is only
+    reopened if the file has been modified since it was opened. The main
+    process opens the file for each read, since it may need to write to
+    the same file.
 
     Parameters
     ----------
@@ -32,12 +45,41 @@ def peak_search(data_file, data_path, i, j, k, threshold, mask=None,
         File path to the raw data file
     data_path : str
         Internal path to the raw data
-    i : int
-        Index of first z-value of output peaks
     j : int
-        Index of first z-value of processed slab
+        Index of first frame of the slab
     k : int
-        Index of last z-value of processed slab
+        Index of last frame of the slab
+
+    Returns
+    -------
+    array-like
+        3D slab of raw detector frames
+    """
+    if parent_process() is None:
+        nxsetconfig(lock=3600, lockexpiry=28800)
+        with nxopen(data_file, 'r') as data_root:
+            return data_root[data_path][j:k].nxvalue
+    mtime = os.path.getmtime(data_file)
+    if data_file in _open_files and _open_files[data_file][1] != mtime:
+        _open_files.pop(data_file)[0].close()
+    if data_file not in _open_files:
+        _open_files[data_file] = (h5.File(data_file, 'r', locking=False),
+                                  mtime)
+    return _open_files[data_file][0][data_path][j:k]
+
+
+def find_blobs(data, threshold, mask=None, min_pixels=10):
+    """Identify peaks in a slab of raw data already loaded into memory.
+
+    Local maxima in each frame are linked to those in the previous frame
+    if they are within 10 pixels. Linked maxima are assigned the position
+    of the largest value, and the peak is refined once it is no longer
+    found in the next frame.
+
+    Parameters
+    ----------
+    data : array-like
+        3D slab of raw detector frames
     threshold : float
         Peak threshold
     mask : array-like
@@ -47,107 +89,114 @@ def peak_search(data_file, data_path, i, j, k, threshold, mask=None,
 
     Returns
     -------
-    list of NXBlobs
-        Peak locations and intensities stored in NXBlob instances
+    array-like
+        Peak locations and intensities stored in a structured array with
+        the fields defined by `blob_dtype`, with z-values relative to the
+        first frame of the slab
     """
-    nxsetconfig(lock=3600, lockexpiry=28800)
-
-    with nxopen(data_file, "r") as data_root:
-        data = data_root[data_path][j:k].nxvalue.clip(0)
-
+    data = data.clip(0)
     if mask is not None:
         data = np.where(mask, 0, data)
 
     nframes = data.shape[0]
     saved_blobs = []
-    last_blobs = []
+    last_blobs = np.zeros(0, dtype=blob_dtype)
     for z in range(nframes):
-        blobs = [
-            NXBlob(x, y, z, data[z, int(y), int(x)], min_pixels=min_pixels)
-            for y, x in peak_local_max(
-                data[z], min_distance=min_pixels, threshold_abs=threshold
-            )
-        ]
-        for lb in last_blobs:
-            found = False
-            for b in blobs:
-                if lb == b:
-                    found = True
-                    b.update(lb)
-            if not found:
-                lb.refine(data)
-                if lb.is_valid():
-                    saved_blobs.append(lb)
+        yx = peak_local_max(data[z], min_distance=min_pixels,
+                            threshold_abs=threshold)
+        blobs = np.zeros(len(yx), dtype=blob_dtype)
+        blobs['x'], blobs['y'], blobs['z'] = yx[:, 1], yx[:, 0], z
+        blobs['max_value'] = data[z, yx[:, 0], yx[:, 1]]
+        found = np.zeros(len(last_blobs), dtype=bool)
+        if len(last_blobs) > 0 and len(blobs) > 0:
+            il, ib = link_blobs(last_blobs, blobs)
+            found[il] = True
+            order = np.lexsort((il, -last_blobs['max_value'][il], ib))
+            il, ib = il[order], ib[order]
+            first = np.flatnonzero(np.diff(ib, prepend=-1))
+            il, ib = il[first], ib[first]
+            larger = last_blobs['max_value'][il] > blobs['max_value'][ib]
+            for field in ('x', 'y', 'z', 'max_value'):
+                blobs[field][ib[larger]] = last_blobs[field][il[larger]]
+        lost_blobs = last_blobs[~found]
+        if len(lost_blobs) > 0:
+            refine_blobs(data, lost_blobs, min_pixels=min_pixels)
+            saved_blobs.append(lost_blobs[(lost_blobs['sigx'] >= 0.5) &
+                                          (lost_blobs['sigy'] >= 0.5)])
         last_blobs = blobs
-    for blob in saved_blobs:
-        blob.z += j
-    return i, saved_blobs
+    if saved_blobs:
+        return np.concatenate(saved_blobs)
+    else:
+        return np.zeros(0, dtype=blob_dtype)
 
 
-class NXBlob:
+def link_blobs(blobs_1, blobs_2, distance=10.0):
+    """Return the indices of pairs of peaks closer than a given distance.
 
-    def __init__(self, x, y, z, max_value=0.0, intensity=0.0,
-                 sigx=0.0, sigy=0.0, sigz=0.0, min_pixels=10):
-        self.x = x
-        self.y = y
-        self.z = z
-        self.max_value = max_value
-        self.intensity = intensity
-        self.sigx = sigx
-        self.sigy = sigy
-        self.sigz = sigz
-        self.min_pixels = min_pixels
+    Parameters
+    ----------
+    blobs_1, blobs_2 : array-like
+        Structured arrays of peaks with the fields defined by `blob_dtype`
+    distance : float, optional
+        Maximum separation in pixels, by default 10
 
-    def __repr__(self):
-        return (
-            f"NXBlob(x={self.x:.2f} y={self.y:.2f} z={self.z:.2f} "
-            + f"intensity={self.intensity:.2f} "
-            + f"dx={self.sigx:.2f} dy={self.sigy:.2f} dz={self.sigz:.2f})"
-        )
-
-    def __eq__(self, other):
-        if (
-            (self.x - other.x) ** 2
-            + (self.y - other.y) ** 2
-            + (self.z - other.z) ** 2
-        ) < 100:
-            return True
-        else:
-            return False
+    Returns
+    -------
+    tuple of array-like
+        Indices of the linked peaks in each array
+    """
+    xyz_1 = np.column_stack((blobs_1['x'], blobs_1['y'], blobs_1['z']))
+    xyz_2 = np.column_stack((blobs_2['x'], blobs_2['y'], blobs_2['z']))
+    pairs = cKDTree(xyz_1).sparse_distance_matrix(
+        cKDTree(xyz_2), distance, output_type='ndarray')
+    il, ib = pairs['i'].astype(int), pairs['j'].astype(int)
+    close = np.sum((xyz_1[il] - xyz_2[ib])**2, axis=1) < distance**2
+    return il[close], ib[close]
 
-    @property
-    def xyz(self):
-        return (int(self.z), int(self.y), int(self.x))
-
-    def update(self, other):
-        if other.max_value > self.max_value:
-            self.x = other.x
-            self.y = other.y
-            self.z = other.z
-            self.max_value = other.max_value
-
-    def refine(self, data):
-        def peak_range():
-            idx = []
-            for i in range(3):
-                idx.append(np.s_[max(0, self.xyz[i] - self.min_pixels):
-                           min(self.xyz[i] + self.min_pixels, data.shape[i])])
-            return tuple(idx)
-
-        slab = NXdata(data)[peak_range()]
-        slabx = slab.sum((0, 1))
-        self.x, self.sigx = slabx.mean().nxvalue, slabx.std().nxvalue
-        slaby = slab.sum((0, 2))
-        self.y, self.sigy = slaby.mean().nxvalue, slaby.std().nxvalue
-        slabz = slab.sum((1, 2))
-        self.z, self.sigz = slabz.mean().nxvalue, slabz.std().nxvalue
-        self.intensity = slab.sum()
-
-    def is_valid(self):
-        if self.sigx < 0.5 or self.sigy < 0.5:
-            return False
-        else:
-            return True
+
+def refine_blobs(data, blobs, min_pixels=10, chunk_size=256):
+    """Refine the positions, widths and intensities of peaks in place.
+
+    The centroids and standard deviations are calculated from the sums of
+    the data projected onto each axis within a box of half-width
+    `min_pixels` around each peak, truncated at the edges of the slab.
+    The boxes are gathered into a single array for each chunk of peaks.
+
+    Parameters
+    ----------
+    data : array-like
+        3D slab of raw detector frames
+    blobs : array-like
+        Structured array of peaks with the fields defined by `blob_dtype`
+    min_pixels : int
+        Half-width of the region used to refine each peak, default=10
+    chunk_size : int
+        Maximum number of peaks processed at once, default=256
+    """
+    offsets = np.arange(-min_pixels, min_pixels)
+    for c in range(0, len(blobs), chunk_size):
+        chunk = blobs[c:c+chunk_size]
+        coords, valid, idx = [], [], []
+        for axis, field in enumerate(('z', 'y', 'x')):
+            coord = chunk[field].astype(int)[:, np.newaxis] + offsets
+            inside = (coord >= 0) & (coord < data.shape[axis])
+            coords.append(coord)
+            valid.append(inside)
+            idx.append(np.clip(coord, 0, data.shape[axis] - 1))
+        slabs = data[idx[0][:, :, None, None], idx[1][:, None, :, None],
+                     idx[2][:, None, None, :]].astype(np.float64)
+        slabs *= (valid[0][:, :, None, None] & valid[1][:, None, :, None]
+                  & valid[2][:, None, None, :])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for axis, field in enumerate(('z', 'y', 'x')):
+                sums = slabs.sum(tuple(a+1 for a in range(3) if a != axis))
+                weights = sums / sums.sum(1)[:, np.newaxis]
+                centers = np.sum(weights * coords[axis], axis=1)
+                chunk[field] = centers
+                chunk['sig' + field] = np.sqrt(np.abs(np.sum(
+                    weights * (coords[axis] - centers[:, np.newaxis])**2,
+                    axis=1)))
+        chunk['intensity'] = slabs.sum((1, 2, 3))
 
 
 def fill_gaps(mask, mask_gaps):
@@ -238,27 +287,77 @@ def local_sum_same(X, K, padding):
     return G
 
 
-def mask_volume(data_file, data_path, mask_file, mask_path, i, j, k,
-                pixel_mask, threshold_1=2, horiz_size_1=11,
-                threshold_2=0.8, horiz_size_2=51):
-    """Generate a 3D mask around Bragg peaks.
+def sum_frames(sources, j, k):
+    """Return the sum of a slab of frames read from several raw data files.
 
     Parameters
     ----------
-    data_file : str
-        File path to the raw data file
-    data_path : str
-        Internal path to the raw data
-    mask_file : str
-        File path to the mask file
-    mask_path : str
-        Internal path to the mask array
-    i : int
-        Index of first z-value of output mask
+    sources : list of tuple of str
+        File path and internal path to the raw data of each scan
     j : int
-        Index of first z-value of processed slab
+        Index of first frame of the slab
     k : int
-        Index of last z-value of processed slab
+        Index of last frame of the slab
+
+    Returns
+    -------
+    tuple of int and array-like
+        Index of the first frame and the summed slab.
+    """
+    data_file, data_path = sources[0]
+    total = np.array(read_frames(data_file, data_path, j, k))
+    for data_file, data_path in sources[1:]:
+        total += read_frames(data_file, data_path, j, k)
+    return j, total
+
+
+def copy_structure(source, destination, data_path):
+    """Copy an HDF5 group, replacing one dataset by an empty copy.
+
+    The empty dataset has the same shape, data type, chunks, compression
+    and attributes as the original, so that it can be filled without
+    copying the original values.
+
+    Parameters
+    ----------
+    source : h5py.Group
+        Group to be copied
+    destination : h5py.Group
+        Group receiving the copied items
+    data_path : str
+        Absolute path to the dataset that is not copied
+
+    Returns
+    -------
+    h5py.Dataset
+        Empty dataset created in the destination group.
+    """
+    data_path = '/' + data_path.strip('/')
+    destination.attrs.update(source.attrs)
+    dataset = None
+    for name, item in source.items():
+        if item.name == data_path:
+            dataset = destination.create_dataset_like(name, item)
+            dataset.attrs.update(item.attrs)
+        elif data_path.startswith(item.name + '/'):
+            dataset = copy_structure(item, destination.create_group(name),
+                                     data_path)
+        else:
+            source.copy(item, destination, name=name)
+    return dataset
+
+
+def mask_slab(volume, pixel_mask, threshold_1=2, horiz_size_1=11,
+              threshold_2=0.8, horiz_size_2=51):
+    """Generate a 3D mask around Bragg peaks in a slab of raw data.
+
+    The returned mask excludes the first and last frames of the slab,
+    which are only used to calculate the frame-to-frame differences.
+
+    Parameters
+    ----------
+    volume : array-like
+        3D slab of raw detector frames
     pixel_mask : array-like
         2D detector mask. This has to be the same shape as the last two
         dimensions of the 3D slab. Values of 1 represent masked pixels.
@@ -270,14 +369,13 @@ def mask_volume(data_file, data_path, mask_file, mask_path, i, j, k,
         Size of larger convolution rectangles, by default 51
     threshold_2 : float, optional
         Threshold for performing the larger convolution, by default 0.8
-    queue : Queue, optional
-        Queue used in multiprocessing, by default None
-    """
-
-    nxsetconfig(lock=3600, lockexpiry=28800)
-    with nxopen(data_file, 'r') as data_root:
-        volume = data_root[data_path][j:k].nxvalue
 
+    Returns
+    -------
+    array-like
+        3D mask of the frames between the first and last frames of
+        the slab.
+    """
     horiz_size_1, horiz_size_2 = int(horiz_size_1), int(horiz_size_2)
     sum1, sum2 = horiz_size_1**2, horiz_size_2**2
     horiz_kern_1 = np.ones((1, horiz_size_1, horiz_size_1))
@@ -315,29 +413,335 @@ def mask_volume(data_file, data_path, mask_file, mask_path, i, j, k,
     vol_smoothed /= sum2
     vol_smoothed[vol_smoothed < threshold_2] = 0
     vol_smoothed[vol_smoothed > threshold_2] = 1
-    nxsetconfig(lock=3600, lockexpiry=28800)
-    with nxopen(mask_file, 'rw') as mask_root:
-        mask_root[mask_path][j+1:k-1] = (
-            np.maximum(vol_smoothed[0:-1], vol_smoothed[1:]))
-    return i
+    return np.maximum(vol_smoothed[0:-1], vol_smoothed[1:])
+
 
+def reduce_slab(data, i, j, nframes, first, last, pixel_mask,
+                transmission_mask=None, threshold=None, min_pixels=10,
+                mask_parameters=None, block_size=50):
+    """Perform all the frame-based reductions on a slab of raw data.
 
-def init_julia():
-    from julia.api import Julia
-    from julia.core import JuliaError
+    This allows the maximum counts, the Bragg peaks and the 3D mask to
+    be determined from a single read of the raw data. The slab must
+    include the frames on either side of the block that are required by
+    the peak search and mask convolutions, i.e., five frames before and
+    after the block.
+
+    Parameters
+    ----------
+    data : array-like
+        3D slab of raw detector frames
+    i : int
+        Index of the first frame of the block being reduced
+    j : int
+        Index of the first frame of the slab
+    nframes : int
+        Total number of frames in the raw data
+    first : int
+        First frame included in the data reduction
+    last : int
+        Last frame included in the data reduction
+    pixel_mask : array-like
+        2D detector mask. Values of 1 represent masked pixels.
+    transmission_mask : array-like, optional
+        2D mask of pixels excluded from the partial frame sums. If None,
+        the maximum counts and frame sums are not determined. By default
+        None.
+    threshold : float, optional
+        Peak threshold. If None, no peak search is performed. By default
+        None.
+    min_pixels : int, optional
+        Minimum pixel separation of peaks, by default 10
+    mask_parameters : dict, optional
+        Thresholds and convolution sizes used to prepare the 3D mask. If
+        None, no mask is prepared. By default None.
+    block_size : int, optional
+        Number of frames in the block, by default 50
+
+    Returns
+    -------
+    tuple of int and dict
+        Index of the first frame of the block and a dictionary
+        containing the results of each reduction.
+    """
+    k = j + data.shape[0]
+    stop = min(i+block_size, last)
+    result = {}
+    if transmission_mask is not None and stop > i:
+        v = data[i-j:stop-j]
+        result['summed_data'] = v.sum(0)
+        v = np.ma.masked_array(v)
+        v.mask = pixel_mask
+        result['summed_frames'] = v.sum((1, 2))
+        v.mask = pixel_mask | transmission_mask
+        result['partial_frames'] = v.sum((1, 2))
+        result['maximum'] = v.max()
+    if threshold is not None:
+        js, ks = i - min(5, i), min(i+block_size+5, last+5, nframes)
+        blobs = find_blobs(data[js-j:ks-j], threshold, mask=pixel_mask,
+                           min_pixels=min_pixels)
+        blobs['z'] += js
+        result['peaks'] = blobs[(blobs['z'] >= i) & (blobs['z'] < stop)]
+    if mask_parameters is not None:
+        masks = []
+        for im in range(i, min(i+block_size, last+1), 10):
+            jm, km = im - min(1, im), min(im+11, last+1, nframes, k)
+            if not masks:
+                result['mask_start'] = jm + 1
+            masks.append(mask_slab(data[jm-j:km-j], pixel_mask,
+                                   mask_parameters['threshold_1'],
+                                   mask_parameters['horizontal_size_1'],
+                                   mask_parameters['threshold_2'],
+                                   mask_parameters['horizontal_size_2'])
+                         .astype(np.int8))
+        result['mask'] = np.concatenate(masks)
+    return i, result
+
+
+def reduce_shared_slab(name, shape, dtype, i, j, *args, **kwargs):
+    """Perform frame-based reductions on a slab stored in shared memory.
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block containing the slab
+    shape : tuple of int
+        Shape of the slab
+    dtype : str
+        Data type of the slab
+    i : int
+        Index of the first frame of the block
+    j : int
+        Index of the first frame of the slab
+
+    Returns
+    -------
+    tuple of int and dict
+        Index of the first frame of the block and a dictionary
+        containing the results of each reduction.
+
+    Notes
+    -----
+    The remaining arguments are passed to `reduce_slab`.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    data = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
     try:
-        jl = Julia(compiled_modules=False)
-    except JuliaError:
-        import julia
-        julia.install()
-        jl = Julia(compile_modules=False)
-    return jl
+        return reduce_slab(data, i, j, *args, **kwargs)
+    finally:
+        del data
+        shm.close()
+
+
+def fft_taper(x, y, z, qmax):
+    """Return a spherical Tukey taper function on a 3D grid.
 
+    The radii are calculated by broadcasting the squares of the three
+    axes, and the taper function is evaluated in place, so the only
+    full-sized arrays are the single-precision result and two boolean
+    masks.
 
-def load_julia(resources):
-    from julia import Main
-    for resource in resources:
-        Main.include(str(package_files('nxrefine.julia') / resource))
+    Parameters
+    ----------
+    x, y, z : array-like
+        Cartesian components of Q along each axis in Å-1.
+    qmax : float
+        Maximum Q value in Å-1.
+
+    Returns
+    -------
+    array-like
+        An array containing the 3D taper function values, with shape
+        ``(len(z), len(y), len(x))``.
+    """
+    x2, y2, z2 = [np.square(np.asarray(a, dtype=np.float64)).astype(
+        np.float32) for a in (x, y, z)]
+    taper = z2[:, np.newaxis, np.newaxis] + y2[:, np.newaxis] + x2
+    np.sqrt(taper, out=taper)
+    taper *= 2.0 / qmax
+    inner = taper <= 1.0
+    outer = taper >= 2.0
+    taper *= np.pi
+    np.cos(taper, out=taper)
+    taper -= 1.0
+    taper *= -0.5
+    taper[inner] = 1.0
+    taper[outer] = 1.0
+    taper[outer] = taper.min()
+    return taper
+
+
+def centered_fft(data, workers=None):
+    """Return the real part of the FFT of real data centered on the origin.
+
+    This is equivalent to ``np.real(fftshift(fftn(fftshift(data))))``, but
+    only half the complex transform is calculated using `scipy.fft.rfftn`.
+    The other half is filled using the Hermitian symmetry of the transform
+    of real data, i.e., F(-k) is the complex conjugate of F(k). If all the
+    dimensions are even, the shifts are applied by alternating the signs of
+    the data in place, so the input array is overwritten.
+
+    Parameters
+    ----------
+    data : array-like
+        Real 3D array.
+    workers : int, optional
+        Number of workers used by `scipy.fft.rfftn`, by default None.
+
+    Returns
+    -------
+    array-like
+        Real part of the centered FFT, with the same shape as the input.
+    """
+    even = all(n % 2 == 0 for n in data.shape)
+    if even:
+        alternate_signs(data)
+    else:
+        data = scipy.fft.fftshift(data)
+    half = scipy.fft.rfftn(data, workers=workers)
+    n = data.shape[-1]
+    m = half.shape[-1]
+    result = np.empty(data.shape, dtype=half.real.dtype)
+    result[..., :m] = half.real
+    mirror = half.real[..., n-m:0:-1]
+    result[0, 0, m:] = mirror[0, 0]
+    result[0, 1:, m:] = mirror[0, :0:-1]
+    result[1:, 0, m:] = mirror[:0:-1, 0]
+    result[1:, 1:, m:] = mirror[:0:-1, :0:-1]
+    del half, mirror
+    if even:
+        alternate_signs(result)
+        if sum(n // 2 for n in data.shape) % 2 == 1:
+            np.negative(result, out=result)
+        return result
+    else:
+        return scipy.fft.fftshift(result)
+
+
+def alternate_signs(data):
+    """Multiply a 3D array in place by (-1)**(i+j+k)."""
+    data[1::2] *= -1
+    data[:, 1::2] *= -1
+    data[:, :, 1::2] *= -1
+
+
+def storage_options(shape, chunks=(1, 128, 128), compression=4,
+                    dtype='float32'):
+    """Return the keyword arguments used to store a 3D volume.
+
+    The default chunks contain a 128x128 tile of a single frame, so that
+    viewing a slice along any axis only reads a fraction of the volume,
+    and the data are compressed losslessly with the shuffle filter.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape of the volume.
+    chunks : tuple of int, optional
+        Maximum chunk shape, by default (1, 128, 128). Each dimension is
+        limited by the shape of the volume.
+    compression : int, optional
+        Gzip compression level, by default 4. If this is 0 or None, the
+        data are not compressed.
+    dtype : str, optional
+        Data type of the stored volume, by default 'float32'. If this is
+        None, the data type of the values is used.
+
+    Returns
+    -------
+    dict
+        Keyword arguments to be passed to `NXfield`.
+    """
+    options = {'chunks': tuple(max(1, min(int(c), int(n)))
+                               for c, n in zip(chunks, shape))}
+    if compression:
+        options['compression'] = 'gzip'
+        options['compression_opts'] = int(compression)
+        options['shuffle'] = True
+    if dtype:
+        options['dtype'] = dtype
+    return options
+
+
+def storage_settings(settings):
+    """Return the storage profile defined by the server settings.
+
+    Parameters
+    ----------
+    settings : dict
+        Server settings, which may define the 'chunks', 'compression' and
+        'precision' of the stored volumes.
+
+    Returns
+    -------
+    dict
+        Keyword arguments to be passed to `storage_options`.
+    """
+    storage = {'chunks': (1, 128, 128), 'compression': 4,
+               'dtype': 'float32'}
+    for option, key in [('chunks', 'chunks'),
+                        ('compression', 'compression'),
+                        ('precision', 'dtype')]:
+        value = settings.get(option)
+        if value is None:
+            continue
+        elif value in ['None', 'none', '']:
+            storage[key] = None
+        elif option == 'chunks':
+            storage[key] = tuple(int(c) for c in str(value).split(','))
+        elif option == 'compression':
+            storage[key] = int(value)
+        else:
+            storage[key] = value
+    if storage['chunks'] is None:
+        storage['chunks'] = (1, 128, 128)
+    return storage
+
+
+def laplace_matrix(shape, m=1, epsilon=0.0):
+    """Return the Laplace or Matern operator on a 3D grid.
+
+    The discrete Laplacian, -∇², of a grid with unit spacing has the
+    number of neighbors of each grid point on the diagonal and -1 for each
+    neighbor, so the boundaries are reflecting. The Matern operator is
+    (-∇² + ε²)^m.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape of the grid.
+    m : int, optional
+        Matern exponent, by default 1
+    epsilon : float, optional
+        Matern parameter, by default 0.0
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Sparse matrix operating on the flattened grid.
+    """
+    from scipy import sparse
+    operators = []
+    for axis, n in enumerate(shape):
+        degree = np.full(n, 2.0)
+        degree[[0, -1]] = 1.0
+        if n == 1:
+            degree[0] = 0.0
+        operator = sparse.diags([-np.ones(n-1), degree, -np.ones(n-1)],
+                                [-1, 0, 1])
+        for i, size in enumerate(shape):
+            if i < axis:
+                operator = sparse.kron(sparse.identity(size), operator)
+            elif i > axis:
+                operator = sparse.kron(operator, sparse.identity(size))
+        operators.append(operator)
+    matrix = sum(operators)
+    if epsilon:
+        matrix = matrix + epsilon**2 * sparse.identity(matrix.shape[0])
+    result = matrix
+    for _ in range(m-1):
+        result = result @ matrix
+    return sparse.csr_matrix(result)
 
 
 def parse_orientation(orientation):
@@ -701,12 +1105,223 @@ class NXExecutor(ProcessPoolExecutor):
         else:
             mp_context = None
         super().__init__(max_workers=max_workers, mp_context=mp_context)
+        self.closed = False
 
     def __repr__(self):
         return f"NXExecutor(max_workers={self._max_workers})"
 
+    def submit(self, fn, /, *args, **kwargs):
+        """Submit a task, recording whether the pool has been broken."""
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except (BrokenProcessPool, RuntimeError):
+            self.closed = True
+            raise
+        future.add_done_callback(self._check_pool)
+        return future
+
+    def _check_pool(self, future):
+        if (not future.cancelled()
+                and isinstance(future.exception(), BrokenProcessPool)):
+            self.closed = True
+
+    def shutdown(self, wait=True, **kwargs):
+        self.closed = True
+        super().shutdown(wait=wait, **kwargs)
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.shutdown(wait=True)
         if self._mp_context.get_start_method(allow_none=False) != 'fork':
             resource_tracker._resource_tracker._stop()
         return False
+
+
+_executors = {}
+
+
+def get_executor(max_workers=None, mp_context='spawn'):
+    """Return a persistent executor with the requested settings.
+
+    The executor is created by the first call and reused by later calls
+    with the same settings, so that worker processes, and any files they
+    keep open, persist between tasks and entries. The executors are shut
+    down when the main process exits.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Maximum number of worker processes, by default None
+    mp_context : str, optional
+        Multiprocessing start method, by default 'spawn'
+
+    Returns
+    -------
+    NXExecutor
+        Executor used to run the tasks
+    """
+    key = (max_workers, mp_context)
+    executor = _executors.get(key)
+    if executor is None or executor.closed:
+        executor = NXExecutor(max_workers=max_workers, mp_context=mp_context)
+        _executors[key] = executor
+    return executor
+
+
+@atexit.register
+def shutdown_executors():
+    """Shut down all the persistent executors."""
+    while _executors:
+        _executors.popitem()[1].shutdown(wait=True)
+
+
+class NXBlockWriter:
+    """Write slabs of frames to a 3D field in chunk-aligned blocks.
+
+    Slabs can be added in any order. They are buffered until the frames
+    are contiguous up to a chunk boundary, so that each write covers
+    complete chunks of the field.
+
+    Parameters
+    ----------
+    field : NXfield
+        3D field to be written, which should be in an open file.
+    start : int
+        Index of the first frame to be written.
+    """
+
+    def __init__(self, field, start):
+        self.field = field
+        if field.chunks:
+            self.block_size = field.chunks[0]
+        else:
+            self.block_size = 1
+        self.start = start
+        self.stop = start
+        self.buffer = []
+        self.pending = {}
+
+    def __repr__(self):
+        return f"NXBlockWriter({self.field.nxpath}, start={self.start})"
+
+    def add(self, start, slab):
+        """Add a slab of frames starting at the specified frame."""
+        self.pending[start] = slab
+        while self.stop in self.pending:
+            slab = self.pending.pop(self.stop)
+            self.buffer.append(slab)
+            self.stop += slab.shape[0]
+        self.write((self.stop // self.block_size) * self.block_size)
+
+    def write(self, stop):
+        """Write the buffered frames up to the specified frame."""
+        if stop <= self.start or not self.buffer:
+            return
+        block = np.concatenate(self.buffer)
+        self.field[self.start:stop] = block[:stop-self.start]
+        self.buffer = [block[stop-self.start:]]
+        self.start = stop
+
+    def flush(self):
+        """Write all the remaining frames."""
+        self.write(self.stop)
+        for start in sorted(self.pending):
+            slab = self.pending.pop(start)
+            self.field[start:start+slab.shape[0]] = slab
+
+
+class NXLaplaceInterpolator:
+    """Fill holes of a fixed shape by Laplace or Matern interpolation.
+
+    The values inside each hole are chosen so that the Laplace (or Matern)
+    operator vanishes there, with the values outside the hole held fixed.
+    Since every hole has the same shape, the sparse system restricted to
+    the hole is factorized once and reused for all of them.
+
+    Parameters
+    ----------
+    mask : array-like
+        3D array in which non-zero values define the hole.
+    m : int, optional
+        Matern exponent, by default 1
+    epsilon : float, optional
+        Matern parameter, by default 0.0
+    """
+
+    def __init__(self, mask, m=1, epsilon=0.0):
+        from scipy.sparse.linalg import splu
+        self.shape = mask.shape
+        self.hole = np.flatnonzero(mask)
+        self.known = np.flatnonzero(mask == 0)
+        matrix = laplace_matrix(self.shape, m=m, epsilon=epsilon)
+        matrix = matrix[self.hole]
+        self.coupling = matrix[:, self.known]
+        self.solver = splu(matrix[:, self.hole].tocsc())
+
+    def __repr__(self):
+        return (f"NXLaplaceInterpolator(shape={self.shape}, "
+                f"hole={self.hole.size})")
+
+    def interpolate(self, data):
+        """Return the interpolated values inside one or more holes.
+
+        Parameters
+        ----------
+        data : array-like
+            Array with the shape of the mask, or a stack of such arrays
+            along the first axis. Values inside the holes are ignored.
+
+        Returns
+        -------
+        array-like
+            Interpolated values at the non-zero mask elements, in the order
+            returned by `np.nonzero`. There is one row per hole if a stack
+            of arrays is given.
+        """
+        data = np.asarray(data)
+        values = data.reshape(-1, np.prod(self.shape))[:, self.known]
+        result = self.solver.solve(
+            -(self.coupling @ values.T.astype(np.float64)))
+        if data.ndim == len(self.shape):
+            return result[:, 0]
+        else:
+            return result.T
+
+    def fill(self, data):
+        """Return a copy of the data with the hole filled."""
+        result = np.array(data, dtype=np.float64)
+        result.reshape(-1)[self.hole] = self.interpolate(data)
+        return result
+
+
+class NXSharedArray:
+    """Copy of an array in shared memory that worker processes can read.
+
+    Workers attach to the memory block using its name, so the array is
+    not pickled when submitting tasks. The block should be released by
+    the process that created it once the workers have finished.
+
+    Parameters
+    ----------
+    array : array-like
+        Array to be copied to shared memory.
+    """
+
+    def __init__(self, array):
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=max(array.nbytes, 1))
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)[...] = (
+            array)
+
+    def __repr__(self):
+        return f"NXSharedArray(name={self.name}, shape={self.shape})"
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def release(self):
+        """Close and remove the shared memory block."""
+        self.shm.close()
+        self.shm.unlink()
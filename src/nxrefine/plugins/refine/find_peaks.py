@@ -121,10 +121,10 @@ class FindDialog(NXDialog):
         self.peaks = peaks
         self.status_message.setText(f'{len(self.peaks)} peaks found')
         self.status_message.setVisible(True)
-        self.refine.xp = np.array([peak.x for peak in peaks])
-        self.refine.yp = np.array([peak.y for peak in peaks])
-        self.refine.zp = np.array([peak.z for peak in peaks])
-        self.refine.intensity = np.array([peak.intensity for peak in peaks])
+        self.refine.xp = peaks['x']
+        self.refine.yp = peaks['y']
+        self.refine.zp = peaks['z']
+        self.refine.intensity = peaks['intensity']
         self.refine.polar_angle, self.refine.azimuthal_angle = (
             self.refine.calculate_angles(self.refine.xp, self.refine.yp))
         self.update_table()
@@ -580,10 +580,12 @@ class RefineLatticeDialog(NXDialog):
         self.secondary_box = NXLineEdit(self.refine.secondary, width=80,
                                         align='right')
         orient_button = NXPushButton('Orient', self.choose_peaks)
+        auto_button = NXPushButton('Auto Orient', self.auto_orient)
         orient_layout = self.make_layout(NXLabel('Primary'), self.primary_box,
                                          NXLabel('Secondary'),
                                          self.secondary_box, 'stretch',
-                                         orient_button, align='right')
+                                         orient_button, auto_button,
+                                         align='right')
 
         self.table_view = QtWidgets.QTableView()
         self.table_model = NXTableModel(self, peak_list, header)
@@ -751,6 +753,16 @@ class RefineLatticeDialog(NXDialog):
                                                  self.secondary_hkl)
         self.update_table()
 
+    def auto_orient(self):
+        try:
+            self.transfer_parameters()
+            self.refine.auto_orient(peak_tolerance=self.get_peak_tolerance())
+            self.primary_box.setText(str(self.refine.primary))
+            self.secondary_box.setText(str(self.refine.secondary))
+            self.update_table()
+        except NeXusError as error:
+            report_error("Refining Lattice", error)
+
     def export_peaks(self):
         peaks = list(zip(*[p for p in self.table_model.peak_list
                            if p[-1] < self.get_hkl_tolerance()]))
@@ -318,9 +318,9 @@ class WorkflowDialog(NXDialog):
         return self.grid
 
     def sync_db(self):
-        for scan in self.scans:
-            if self.sync_selected(scan):
-                self.db.update_file(self.get_scan_file(scan))
+        self.db.sync_db(self.sample_directory,
+                        [self.get_scan_file(scan) for scan in self.scans
+                         if self.sync_selected(scan)], force=True)
         self.update()
 
     def new_checkbox(self, slot=None):
@@ -0,0 +1,163 @@
+import os
+
+import pytest
+from nexusformat.nexus import NXdata, NXentry, NXinstrument, NXprocess, NXroot
+
+import nxrefine.nxdatabase as nxdatabase
+from nxrefine.nxdatabase import (DONE, FAILED, IN_PROGRESS, NOT_STARTED,
+                                 QUEUED, File, NXDatabase, Task)
+
+
+def write_wrapper(path, process=None):
+    root = NXroot(NXentry())
+    for entry in ('f1', 'f2'):
+        root[entry] = NXentry(NXdata(), NXinstrument())
+        if process:
+            root[entry][process] = NXprocess()
+    root.save(path, 'w')
+
+
+@pytest.fixture
+def experiment(tmp_path):
+    sample_dir = tmp_path / 'sample' / 'label'
+    sample_dir.mkdir(parents=True)
+    (tmp_path / 'tasks').mkdir()
+    for scan in ('1', '2'):
+        write_wrapper(sample_dir / f'sample_{scan}.nxs')
+    (sample_dir / '1').mkdir()
+    return sample_dir
+
+
+@pytest.fixture
+def db(experiment):
+    return NXDatabase(experiment.parent.parent / 'tasks' / 'nxdatabase.db')
+
+
+@pytest.fixture
+def inspected(monkeypatch):
+    files = []
+    inspect_file = nxdatabase.inspect_file
+
+    def record(filepath, scan_dir):
+        files.append(filepath.name)
+        return inspect_file(filepath, scan_dir)
+
+    monkeypatch.setattr(nxdatabase, 'inspect_file', record)
+    return files
+
+
+def get_file(db, name):
+    return db.session.query(File).filter(
+        File.filename == f'sample/label/{name}').one_or_none()
+
+
+def touch(path, offset):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime + offset, stat.st_mtime + offset))
+
+
+def test_sync_skips_unchanged_files(experiment, db, inspected):
+    db.sync_db(experiment)
+    assert sorted(inspected) == ['sample_1.nxs', 'sample_2.nxs']
+    f = get_file(db, 'sample_1.nxs')
+    assert f.mtime is not None and f.size is not None
+    assert f.scan_mtime is not None
+    assert get_file(db, 'sample_2.nxs').scan_mtime is None
+    inspected.clear()
+    db.sync_db(experiment)
+    assert inspected == []
+    db.sync_db(experiment, force=True)
+    assert sorted(inspected) == ['sample_1.nxs', 'sample_2.nxs']
+
+
+def test_sync_detects_modified_wrapper(experiment, db, inspected):
+    db.sync_db(experiment)
+    assert get_file(db, 'sample_2.nxs').nxmax == NOT_STARTED
+    inspected.clear()
+    write_wrapper(experiment / 'sample_2.nxs', process='nxmax')
+    touch(experiment / 'sample_2.nxs', 10)
+    db.sync_db(experiment)
+    assert inspected == ['sample_2.nxs']
+    assert get_file(db, 'sample_2.nxs').nxmax == DONE
+
+
+def test_sync_detects_new_raw_data(experiment, db, inspected):
+    db.sync_db(experiment)
+    assert get_file(db, 'sample_1.nxs').nxload == NOT_STARTED
+    inspected.clear()
+    for entry in ('f1', 'f2'):
+        (experiment / '1' / f'{entry}.h5').touch()
+    touch(experiment / '1', 10)
+    db.sync_db(experiment)
+    assert inspected == ['sample_1.nxs']
+    assert get_file(db, 'sample_1.nxs').nxload == DONE
+
+
+def test_sync_removes_deleted_files(experiment, db):
+    db.sync_db(experiment)
+    (experiment / 'sample_2.nxs').unlink()
+    db.sync_db(experiment, wrapper_files=[experiment / 'sample_1.nxs'])
+    assert get_file(db, 'sample_2.nxs') is not None
+    db.sync_db(experiment)
+    assert get_file(db, 'sample_1.nxs') is not None
+    assert get_file(db, 'sample_2.nxs') is None
+
+
+def status(db, task, entry=None):
+    return db.task_status('sample/label/sample_1.nxs', task, entry)
+
+
+def test_task_lifecycle(db):
+    filename = 'sample/label/sample_1.nxs'
+    db.queue_task(filename, 'nxmax', 'f1')
+    assert (status(db, 'nxmax', 'f1'), status(db, 'nxmax')) == (QUEUED,
+                                                                 QUEUED)
+    db.start_task(filename, 'nxmax', 'f1')
+    assert (status(db, 'nxmax', 'f1'),
+            status(db, 'nxmax')) == (IN_PROGRESS, IN_PROGRESS)
+    db.end_task(filename, 'nxmax', 'f1')
+    assert (status(db, 'nxmax', 'f1'), status(db, 'nxmax')) == (DONE,
+                                                                IN_PROGRESS)
+    assert status(db, 'nxmax', 'f2') == NOT_STARTED
+    db.end_task(filename, 'nxmax', 'f2')
+    assert (status(db, 'nxmax', 'f2'), status(db, 'nxmax')) == (DONE, DONE)
+
+
+def test_mixed_task_status(db):
+    filename = 'sample/label/sample_1.nxs'
+    db.queue_task(filename, 'nxfind', 'f1')
+    db.queue_task(filename, 'nxfind', 'f2')
+    assert status(db, 'nxfind') == QUEUED
+    db.start_task(filename, 'nxfind', 'f1')
+    db.end_task(filename, 'nxfind', 'f1')
+    assert status(db, 'nxfind', 'f1') == DONE
+    assert status(db, 'nxfind', 'f2') == QUEUED
+    assert status(db, 'nxfind') == IN_PROGRESS
+
+
+def test_fail_unrecorded_task(db):
+    filename = 'sample/label/sample_1.nxs'
+    db.fail_task(filename, 'nxrefine', 'f1')
+    assert status(db, 'nxrefine', 'f1') == NOT_STARTED
+    assert status(db, 'nxrefine') == NOT_STARTED
+    assert db.session.query(Task).filter(Task.name == 'nxrefine').count() == 0
+    db.queue_task(filename, 'nxrefine', 'f1')
+    db.fail_task(filename, 'nxrefine', 'f1')
+    assert (status(db, 'nxrefine', 'f1'), status(db, 'nxrefine')) == (FAILED,
+                                                                      FAILED)
+
+
+def test_requeue_after_done(db):
+    filename = 'sample/label/sample_1.nxs'
+    for entry in ('f1', 'f2'):
+        db.queue_task(filename, 'nxcopy', entry)
+        db.start_task(filename, 'nxcopy', entry)
+        db.end_task(filename, 'nxcopy', entry)
+    assert status(db, 'nxcopy') == DONE
+    db.queue_task(filename, 'nxcopy', 'f1')
+    assert status(db, 'nxcopy', 'f1') == QUEUED
+    assert status(db, 'nxcopy', 'f2') == DONE
+    assert status(db, 'nxcopy') == IN_PROGRESS
+    db.start_task(filename, 'nxcopy', 'f1')
+    db.end_task(filename, 'nxcopy', 'f1')
+    assert (status(db, 'nxcopy', 'f1'), status(db, 'nxcopy')) == (DONE, DONE)
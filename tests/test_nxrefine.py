@@ -0,0 +1,118 @@
+import itertools
+
+import numpy as np
+import pytest
+from nexusformat.nexus import NXentry, NXinstrument, NXroot
+
+from nxrefine.nxrefine import NXRefine, rotmat
+
+
+def test_polar_max_without_peaks(tmp_path):
+    root = NXroot(NXentry())
+    root['entry/instrument'] = NXinstrument()
+    root.save(tmp_path / 'nopeaks.nxs', 'w')
+    refine = NXRefine(root['entry'])
+    refine.polar_max = 5.0
+    assert refine.polar_max == 5.0
+    assert refine.npks == 0
+    assert refine.idx.size == 0
+
+
+def test_calculate_angles_without_pixels(tmp_path):
+    root = NXroot(NXentry())
+    root.save(tmp_path / 'nopeaks.nxs', 'w')
+    refine = NXRefine(root['entry'])
+    for x, y in [(None, None), ([], [])]:
+        polar_angles, azimuthal_angles = refine.calculate_angles(x, y)
+        assert polar_angles.size == 0
+        assert azimuthal_angles.size == 0
+        assert isinstance(polar_angles, np.ndarray)
+
+
+class UnitCell:
+    """Minimal replacement for the cctbx unit cell used by angle_diff."""
+
+    def __init__(self, refine):
+        self.Bmat = np.asarray(refine.Bmat)
+
+    def two_theta(self, hkl, wavelength, deg=False):
+        dstar = np.linalg.norm(self.Bmat @ np.asarray(hkl, dtype=float))
+        two_theta = 2 * np.arcsin(wavelength * dstar / 2)
+        return np.degrees(two_theta) if deg else two_theta
+
+
+@pytest.fixture
+def monoclinic(monkeypatch):
+    try:
+        import cctbx  # noqa: F401
+    except ImportError:
+        monkeypatch.setattr(NXRefine, 'unit_cell',
+                            property(lambda self: UnitCell(self)))
+    refine = NXRefine()
+    refine.symmetry = 'monoclinic'
+    refine.a, refine.b, refine.c = 5.2, 6.1, 7.3
+    refine.alpha, refine.beta, refine.gamma = 90.0, 97.0, 90.0
+    refine.wavelength = 0.2
+    refine.distance = 500.0
+    refine.pixel_size = 0.172
+    refine.xc, refine.yc = 737.0, 839.0
+    refine.yaw, refine.pitch, refine.roll = 0.2, -0.3, 0.1
+    refine.phi, refine.phi_step = -5.0, 0.1
+    refine.Umat = np.matrix(rotmat(1, 20.0) @ rotmat(2, 35.0) @
+                            rotmat(3, -10.0))
+    hkls = np.array([h for h in itertools.product(range(-4, 5), repeat=3)
+                     if any(h)])
+    x, y, z = refine.calculate_xyzs(*hkls.T)[:3]
+    rng = np.random.default_rng(0)
+    refine.xp = x + rng.normal(0.0, 0.5, len(x))
+    refine.yp = y + rng.normal(0.0, 0.5, len(y))
+    refine.zp = z + rng.normal(0.0, 0.5, len(z))
+    refine.intensity = np.ones(len(x))
+    refine.polar_angle, refine.azimuthal_angle = refine.calculate_angles(
+        refine.xp, refine.yp)
+    refine.polar_max = 10.0
+    refine.hkl_tolerance = 0.5
+    refine.initialize_idx()
+    assert refine.idx.size > 20
+    return refine
+
+
+def assert_close(analytic, numerical, residuals, name):
+    # Finite differences are unreliable for peaks whose residuals are
+    # close to zero, where the residuals are not differentiable
+    valid = np.abs(residuals) > 1e-5
+    np.testing.assert_allclose(analytic[valid], numerical[valid], rtol=1e-3,
+                               atol=1e-9, err_msg=name)
+
+
+def test_diff_jacobian(monoclinic):
+    names = ['a', 'b', 'c', 'beta', 'wavelength', 'distance', 'xc', 'yc',
+             'yaw', 'pitch', 'roll', 'phi']
+    jacobian = monoclinic.diff_jacobian(names)
+    residuals = monoclinic.diffs()
+    for i, name in enumerate(names):
+        numerical = monoclinic.numerical_derivative(name, monoclinic.diffs)
+        assert_close(jacobian[:, i], numerical, residuals, name)
+
+
+def test_angle_diff_jacobian(monoclinic):
+    names = ['a', 'b', 'c', 'beta', 'wavelength', 'distance', 'xc', 'yc',
+             'yaw', 'pitch', 'roll']
+    jacobian = monoclinic.angle_diff_jacobian(names)
+    residuals = monoclinic.angle_diffs()
+    for i, name in enumerate(names):
+        numerical = monoclinic.numerical_derivative(name,
+                                                    monoclinic.angle_diffs)
+        assert_close(jacobian[:, i], numerical, residuals, name)
+
+
+def test_orientation_matrix_inverse():
+    refine = NXRefine()
+    orientation = np.array([[0, -1, 0], [0, 0, 1], [-1, 0, 0]])
+    refine.detector_orientation = orientation
+    for _ in range(2):
+        np.testing.assert_allclose(refine.Oimat @ refine.Omat, np.eye(3),
+                                   atol=1e-12)
+    refine.detector_orientation = '-y +z -x'
+    np.testing.assert_allclose(refine.Oimat @ refine.Omat, np.eye(3),
+                               atol=1e-12)